@@ -0,0 +1,208 @@
+"""
+AI 分析報告歷史紀錄 (SQLite)
+
+個股、基本面、定期定額與投資組合頁面產生的每一份 AI 報告都會寫入本地資料庫，
+以 (頁面, 股票代號, 日期) 與輸入內容雜湊建立索引：
+- 相同輸入 (同一份 prompt) 再次分析時直接讀取紀錄，不重新呼叫 LLM (不受 LLM 快取 TTL 限制)
+- 可依股票與頁面瀏覽過去的報告，並比較不同日期的內容差異
+"""
+import datetime
+import difflib
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from llm import DEFAULT_MODEL, generate_text
+from trading_calendar import TW_TZ, now_tw
+
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_PATH = os.getenv("ANALYSIS_HISTORY_PATH", os.path.join(PROJECT_DIR, ".cache", "analysis_history.db"))
+
+PAGE_LABELS = {
+    "stock": "個股分析",
+    "fundamental": "基本面分析",
+    "dca": "定期定額回測",
+    "portfolio": "投資組合健檢",
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS reports (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    page TEXT NOT NULL,
+    ticker TEXT NOT NULL,
+    label TEXT NOT NULL,
+    report_date TEXT NOT NULL,
+    input_hash TEXT NOT NULL,
+    model TEXT NOT NULL,
+    report TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_reports_ticker ON reports (ticker, page, report_date);
+CREATE INDEX IF NOT EXISTS idx_reports_input ON reports (page, input_hash);
+CREATE INDEX IF NOT EXISTS idx_reports_date ON reports (report_date);
+"""
+
+COLUMNS = ("id", "page", "ticker", "label", "report_date", "input_hash", "model", "report", "created_at")
+
+
+def input_hash(prompt, model=DEFAULT_MODEL):
+    """輸入內容的雜湊值 (相同 prompt 與模型視為同一份分析)"""
+    return hashlib.sha256(f"{model}\n{prompt}".encode("utf-8")).hexdigest()
+
+
+class AnalysisHistory:
+    """AI 報告歷史紀錄"""
+
+    def __init__(self, path=DEFAULT_PATH):
+        self.path = path
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn().executescript(SCHEMA)
+
+    def _conn(self):
+        """每個執行緒使用各自的連線"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA busy_timeout=10000")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _select(self, where, params, limit=None, columns=COLUMNS):
+        sql = f"SELECT {', '.join(columns)} FROM reports WHERE {where} ORDER BY created_at DESC"
+        if limit:
+            sql += f" LIMIT {int(limit)}"
+        return [dict(zip(columns, row)) for row in self._conn().execute(sql, params).fetchall()]
+
+    def record(self, page, ticker, prompt, report, label=None, model=DEFAULT_MODEL):
+        """
+        寫入一份報告
+
+        Args:
+            page: 頁面類型 (見 PAGE_LABELS)
+            ticker: 股票代號 (投資組合等沒有單一股票時可為空字串)
+            prompt: 產生報告的 prompt (計算輸入雜湊)
+            report: 報告內容
+            label: 顯示用說明 (例如回測參數)
+
+        Returns:
+            dict: 寫入的紀錄
+        """
+        entry = {
+            "page": page,
+            "ticker": ticker or "",
+            "label": label or ticker or "",
+            "report_date": now_tw().date().isoformat(),
+            "input_hash": input_hash(prompt, model),
+            "model": model,
+            "report": report,
+            "created_at": time.time(),
+        }
+        cursor = self._conn().execute(
+            f"INSERT INTO reports ({', '.join(COLUMNS[1:])}) VALUES ({', '.join('?' * (len(COLUMNS) - 1))})",
+            tuple(entry[c] for c in COLUMNS[1:])
+        )
+        return {"id": cursor.lastrowid, **entry}
+
+    def find(self, page, prompt, model=DEFAULT_MODEL):
+        """以輸入雜湊查詢最近一份相同輸入的報告，沒有時回傳 None"""
+        rows = self._select("page = ? AND input_hash = ?", (page, input_hash(prompt, model)), limit=1)
+        return rows[0] if rows else None
+
+    def get(self, entry_id):
+        rows = self._select("id = ?", (entry_id,))
+        return rows[0] if rows else None
+
+    def latest(self, page, ticker):
+        """某股票在某頁面最近一份報告"""
+        rows = self._select("ticker = ? AND page = ?", (ticker, page), limit=1)
+        return rows[0] if rows else None
+
+    def search(self, page=None, ticker=None, start_date=None, end_date=None, limit=200):
+        """
+        瀏覽紀錄 (不含報告內文，依時間由新到舊)
+
+        Args:
+            page: 頁面類型 (None 表示全部)
+            ticker: 股票代號 (None 表示全部)
+            start_date / end_date: 日期區間 (YYYY-MM-DD，含端點)
+        """
+        conditions, params = ["1 = 1"], []
+        for column, value in (("page", page), ("ticker", ticker)):
+            if value:
+                conditions.append(f"{column} = ?")
+                params.append(value)
+        if start_date:
+            conditions.append("report_date >= ?")
+            params.append(start_date)
+        if end_date:
+            conditions.append("report_date <= ?")
+            params.append(end_date)
+        columns = tuple(c for c in COLUMNS if c != "report")
+        return self._select(" AND ".join(conditions), params, limit=limit, columns=columns)
+
+    def tickers(self):
+        """有紀錄的股票代號"""
+        rows = self._conn().execute("SELECT DISTINCT ticker FROM reports WHERE ticker != '' ORDER BY ticker").fetchall()
+        return [row[0] for row in rows]
+
+    def delete(self, entry_id):
+        self._conn().execute("DELETE FROM reports WHERE id = ?", (entry_id,))
+
+
+def generate_with_history(page, ticker, prompt, label=None, model=DEFAULT_MODEL):
+    """
+    產生 AI 報告：相同輸入已有紀錄時直接讀取，否則呼叫 LLM 並寫入紀錄
+
+    Returns:
+        (text, stale, entry): 報告內容、是否為限流時的過期結果、歷史紀錄 (含 reused 欄位)
+    """
+    history = get_analysis_history()
+    entry = history.find(page, prompt, model)
+    if entry is not None:
+        return entry["report"], False, {**entry, "reused": True}
+
+    text, stale = generate_text(prompt, model=model)
+    if stale:
+        # 過期結果不列入紀錄
+        return text, stale, None
+    entry = history.record(page, ticker, prompt, text, label=label, model=model)
+    return text, stale, {**entry, "reused": False}
+
+
+def format_entry_time(entry):
+    """紀錄時間 (台北時間)"""
+    return datetime.datetime.fromtimestamp(entry["created_at"], TW_TZ).strftime("%Y-%m-%d %H:%M")
+
+
+def diff_reports(old, new, context=2):
+    """
+    比較兩份報告的差異
+
+    Returns:
+        (diff_text, similarity): unified diff 文字與相似度 (0~1)
+    """
+    old_lines, new_lines = old["report"].splitlines(), new["report"].splitlines()
+    diff = difflib.unified_diff(
+        old_lines, new_lines,
+        fromfile=format_entry_time(old), tofile=format_entry_time(new),
+        n=context, lineterm=""
+    )
+    similarity = difflib.SequenceMatcher(None, old["report"], new["report"]).ratio()
+    return "\n".join(diff), similarity
+
+
+_default_history = None
+_default_lock = threading.Lock()
+
+
+def get_analysis_history():
+    """取得程序內共用的 AnalysisHistory 實例"""
+    global _default_history
+    with _default_lock:
+        if _default_history is None:
+            _default_history = AnalysisHistory()
+        return _default_history
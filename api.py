@@ -1,12 +1,75 @@
-from fastapi import FastAPI, HTTPException
+import asyncio
+import json
+import os
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
+from fastapi import FastAPI, HTTPException, WebSocket, WebSocketDisconnect, Request, BackgroundTasks
 from pydantic import BaseModel
-from daily_report import get_market_summary, generate_ai_report
+from daily_report import (
+    get_market_summary, get_market_summary_bulk, format_market_summary, no_data_result,
+    generate_ai_report, get_technical_snapshot, build_quick_report, QUOTE_NO_DATA
+)
+from swr_cache import StaleWhileRevalidateCache
+from shared_cache import get_shared_cache
+from cache_policy import ttl_since
+from symbols import normalize_ticker, is_plausible_ticker, get_symbol_index
+from report_store import load_report, save_report
+from quote_stream import QuoteHub
+from line_bot import verify_signature, parse_events, get_reply_sender, HELP_TEXT
+from request_log import log_request, log_requests
 
 app = FastAPI()
 
+# 行情快取: soft TTL 內直接回傳，soft~hard TTL 之間先回傳舊資料並在背景更新
+# 以 shared_cache 為後端，多個 uvicorn / gunicorn worker 共用同一份行情
+# soft TTL 依抓取時的交易時段計算 (收盤行情確定後保留到下一次試撮)，見 cache_policy
+QUOTE_HARD_TTL = float(os.getenv("QUOTE_HARD_TTL", 120))
+
+quote_cache = StaleWhileRevalidateCache(
+    fetch=lambda ticker: get_market_summary([ticker])[0],
+    soft_ttl=lambda fetched_at: ttl_since("quote", fetched_at),
+    hard_ttl=QUOTE_HARD_TTL,
+    should_cache=lambda quote: quote.ok,
+    store=get_shared_cache(),
+    namespace="quote_result"
+)
+
+# /analyze 端到端延遲預算 (秒)，LLM 最多使用其中 LLM_BUDGET_SHARE 的比例
+ANALYZE_LATENCY_BUDGET = float(os.getenv("ANALYZE_LATENCY_BUDGET", 8))
+LLM_BUDGET_SHARE = float(os.getenv("LLM_BUDGET_SHARE", 0.8))
+BUDGET_MARGIN = 0.3          # 保留給組合回應的時間
+PENDING_REPORT_TTL = 3600    # 背景完成的 AI 報告保留秒數
+
+# 保留背景任務的參考，避免被垃圾回收
+background_tasks = set()
+
+# 批次分析單次最多股票數
+MAX_BATCH_SIZE = int(os.getenv("MAX_BATCH_SIZE", 50))
+
+# 每條 WebSocket 連線最多同時訂閱的股票數 (每檔股票都會占用上游輪詢)
+MAX_WS_SUBSCRIPTIONS = int(os.getenv("MAX_WS_SUBSCRIPTIONS", 20))
+
+# LINE Webhook: 同時產生 AI 報告的股票數，以及已處理事件 ID 的保留秒數 (LINE 重送時略過)
+LINE_REPORT_WORKERS = int(os.getenv("LINE_REPORT_WORKERS", 4))
+LINE_EVENT_TTL = 24 * 3600
+
+def fetch_live_quote(ticker):
+    """抓取單一股票最新報價 (供 WebSocket 推播使用)"""
+    quote = get_market_summary_bulk([ticker])[ticker]
+    return {**quote._asdict(), "message": quote.line.lstrip("- ")}
+
+# 即時報價推播: 每個被訂閱的股票只有一個上游輪詢 (每個 worker 程序各自一份)
+quote_hub = QuoteHub(fetch_live_quote)
+
 class StockRequest(BaseModel):
     stock_id: str
 
+class BatchRequest(BaseModel):
+    tickers: List[str]
+    summary: bool = True  # 是否產生綜合 AI 摘要 (單次 LLM 呼叫)
+
 @app.post("/analyze")
 async def run_analysis(request: StockRequest):
     stock_id = request.stock_id.strip()
@@ -15,29 +78,286 @@ async def run_analysis(request: StockRequest):
     try:
         # 1. 獲取市場數據
         # 如果使用者只輸入代號 (如 2330)，自動補上 .TW (如果是台股)
-        if stock_id.isdigit():
-            stock_id = f"{stock_id}.TW"
-            
-        market_data = get_market_summary([stock_id])
-        
-        if "獲取失敗" in market_data:
-             return {"status": "error", "message": f"無法獲取 {stock_id} 的數據，請確認代號是否正確。"}
-
-        # 2. AI 分析
-        report = generate_ai_report(market_data)
-        
+        stock_id = normalize_ticker(stock_id)
+
+        # 無效代號 (例如查無此名稱) 直接回應，不浪費上游請求
+        if not is_plausible_ticker(stock_id):
+            return {"status": "error", "message": f"找不到「{stock_id}」，請確認股票代號或名稱是否正確。"}
+        log_request(stock_id, "api")
+
+        # 今日已產生過的報告 (網頁、排程或其他 worker) 直接回傳
+        artifact = await asyncio.to_thread(load_report, [stock_id])
+        if artifact is not None:
+            return {"status": "success", "message": artifact["body"],
+                    "data_age": round(time.time() - artifact["generated_at"], 1),
+                    "report_status": "complete", "trading_date": artifact["trading_date"]}
+
+        started = time.monotonic()
+        deadline = started + ANALYZE_LATENCY_BUDGET - BUDGET_MARGIN
+        try:
+            quote, data_age = await asyncio.wait_for(
+                asyncio.to_thread(quote_cache.get, stock_id), timeout=deadline - time.monotonic()
+            )
+        except asyncio.TimeoutError:
+            return {"status": "error", "message": f"{stock_id} 數據讀取逾時，請稍後再試。"}
+
+        if quote.status == QUOTE_NO_DATA:
+            return {"status": "error", "message": f"查無 {stock_id} 的行情，請確認代號是否正確或是否已下市。"}
+        if not quote.ok:
+            return {"status": "error", "message": f"無法獲取 {stock_id} 的數據，請稍後再試。"}
+        market_data = format_market_summary([quote])
+
+        # 2. AI 分析 (與技術指標同時進行)，LLM 只能使用預算內的時間
+        report_task = asyncio.create_task(asyncio.to_thread(generate_report_artifact, stock_id, market_data))
+        indicator_task = asyncio.create_task(asyncio.to_thread(get_technical_snapshot, stock_id))
+        llm_timeout = min(ANALYZE_LATENCY_BUDGET * LLM_BUDGET_SHARE, deadline - time.monotonic())
+        done, _ = await asyncio.wait({report_task}, timeout=max(0, llm_timeout))
+
         # 3. 組合回傳結果
-        full_response = f"{market_data}\n\n{report}"
-        
-        return {"status": "success", "message": full_response}
+        if report_task in done:
+            indicator_task.cancel()
+            full_response = f"{market_data}\n\n{report_task.result()}"
+            return {"status": "success", "message": full_response, "data_age": round(data_age, 1),
+                    "report_status": "complete"}
+
+        # LLM 逾時: 先回傳模板摘要，AI 報告在背景完成後存入共用快取
+        report_id = uuid.uuid4().hex
+        await remember_pending_report(report_id, report_task)
+        try:
+            indicators = await asyncio.wait_for(
+                asyncio.shield(indicator_task), timeout=max(0, deadline - time.monotonic())
+            )
+        except Exception:
+            indicators = None
+        quick_report = build_quick_report(market_data, indicators)
+        return {"status": "success", "message": quick_report, "data_age": round(data_age, 1),
+                "report_status": "pending", "report_id": report_id,
+                "result_url": f"/analyze/result/{report_id}"}
 
     except Exception as e:
         print(f"Error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+def generate_report_artifact(stock_id, market_data):
+    """產生 AI 報告並存為今日的報告產出物 (背景完成時也會寫入)"""
+    return save_report([stock_id], market_data, generate_ai_report(market_data))["report"]
+
+def keep_background(task):
+    """保留背景工作的參照直到完成 (避免被回收)"""
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+
+async def remember_pending_report(report_id, task):
+    """
+    將背景執行中的 AI 報告登記到共用快取，完成後寫入結果 (任何 worker 都可查詢)
+
+    SQLite 寫入可能等待檔案鎖，一律在執行緒中進行，不阻塞事件迴圈。
+    """
+    cache = get_shared_cache()
+    await asyncio.to_thread(cache.set, "pending_report", report_id, {"status": "pending"}, ttl=PENDING_REPORT_TTL)
+
+    def on_done(t):
+        if t.cancelled():
+            result = {"status": "error", "message": "AI 報告已取消"}
+        elif t.exception() is not None:
+            result = {"status": "error", "message": str(t.exception())}
+        else:
+            result = {"status": "complete", "message": t.result()}
+        keep_background(asyncio.create_task(
+            asyncio.to_thread(cache.set, "pending_report", report_id, result, ttl=PENDING_REPORT_TTL)
+        ))
+
+    keep_background(task)
+    task.add_done_callback(on_done)
+
+@app.get("/analyze/result/{report_id}")
+async def get_analysis_result(report_id: str):
+    """查詢逾時後在背景完成的 AI 報告"""
+    result = get_shared_cache().get("pending_report", report_id)
+    if result is None:
+        raise HTTPException(status_code=404, detail="找不到此報告或已過期")
+    return {"report_id": report_id, **result}
+
+@app.post("/analyze/batch")
+async def run_batch_analysis(request: BatchRequest):
+    # 正規化並去除重複代號 (保留輸入順序)
+    tickers = list(dict.fromkeys(normalize_ticker(t) for t in request.tickers if t and t.strip()))
+    if not tickers:
+        raise HTTPException(status_code=400, detail="請提供至少一個股票代號")
+    if len(tickers) > MAX_BATCH_SIZE:
+        raise HTTPException(status_code=400, detail=f"單次最多 {MAX_BATCH_SIZE} 檔股票")
+    print(f"收到批次分析請求：{len(tickers)} 檔")
+
+    try:
+        # 1. 單次批量抓取所有行情 (無效代號不送往上游)
+        valid = [t for t in tickers if is_plausible_ticker(t)]
+        log_requests(valid, "batch")
+        quotes = await asyncio.to_thread(get_market_summary_bulk, valid)
+        for ticker in tickers:
+            if ticker not in quotes:
+                quotes[ticker] = no_data_result(ticker, "查無此股票")
+
+        results = []
+        for ticker in tickers:
+            quote = quotes[ticker]
+            result = {"ticker": ticker, "status": quote.status, "message": quote.line.lstrip("- ")}
+            if quote.ok:
+                result.update(close=quote.close, change=quote.change,
+                              change_pct=quote.change_pct, stale=quote.stale)
+            results.append(result)
+
+        # 2. 所有成功的股票合併為一次 AI 摘要
+        summary = None
+        market_data = "\n".join(quotes[t].line for t in tickers if quotes[t].ok)
+        if request.summary and market_data:
+            summary = await asyncio.to_thread(generate_ai_report, market_data)
+
+        succeeded = sum(1 for r in results if r["status"] == "success")
+        return {
+            "status": "success" if succeeded else "error",
+            "count": len(results),
+            "succeeded": succeeded,
+            "results": results,
+            "summary": summary
+        }
+
+    except Exception as e:
+        print(f"Error: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/line/webhook")
+async def line_webhook(request: Request, background: BackgroundTasks):
+    """LINE Messaging API Webhook：驗證簽章後立即回應，分析與回覆在背景進行"""
+    body = await request.body()
+    if not verify_signature(body, request.headers.get("X-Line-Signature", "")):
+        raise HTTPException(status_code=400, detail="Invalid signature")
+    try:
+        payload = await request.json()
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid JSON")
+    events = parse_events(payload)
+    if events:
+        background.add_task(process_line_events, events)
+    return {"status": "ok", "events": len(events)}
+
+def process_line_events(events):
+    """
+    處理同一次 Webhook 傳送的所有事件：股票去重後以單次批量抓取行情，
+    每檔股票只產生一次報告，再分別回覆各事件
+    """
+    cache = get_shared_cache()
+    events = [e for e in events if not e["event_id"] or cache.get("line_event", e["event_id"]) is None]
+    for event in events:
+        if event["event_id"]:
+            cache.set("line_event", event["event_id"], True, ttl=LINE_EVENT_TTL)
+    if not events:
+        return
+
+    tickers = list(dict.fromkeys(normalize_ticker(q) for e in events for q in e["queries"]))
+    valid = [t for t in tickers if is_plausible_ticker(t)]
+    log_requests(valid, "line")
+    print(f"LINE Webhook：{len(events)} 個事件、{len(valid)} 檔股票")
+
+    # 今日已有報告的股票直接使用，其餘以單次批量抓取行情
+    artifacts = {t: load_report([t]) for t in valid}
+    quotes = get_market_summary_bulk([t for t in valid if artifacts[t] is None])
+
+    def report_for(ticker):
+        if artifacts.get(ticker) is not None:
+            return artifacts[ticker]["body"]
+        if ticker not in quotes:
+            return f"找不到「{ticker}」，請確認股票代號或名稱是否正確。"
+        quote = quotes[ticker]
+        if quote.status == QUOTE_NO_DATA:
+            return f"查無 {ticker} 的行情，請確認代號是否正確或是否已下市。"
+        if not quote.ok:
+            return f"無法獲取 {ticker} 的數據，請稍後再試。"
+        market_data = format_market_summary([quote])
+        return f"{market_data}\n\n{generate_report_artifact(ticker, market_data)}"
+
+    with ThreadPoolExecutor(max_workers=max(1, min(LINE_REPORT_WORKERS, len(tickers)))) as pool:
+        reports = dict(zip(tickers, pool.map(report_for, tickers)))
+
+    sender = get_reply_sender()
+    for event in events:
+        texts = [reports[normalize_ticker(q)] for q in event["queries"]] or [HELP_TEXT]
+        ok, detail = sender.send(event["reply_token"], list(dict.fromkeys(texts)), event["user_id"])
+        if not ok:
+            print(f"LINE 回覆失敗：{detail}")
+
+@app.get("/symbols/search")
+async def search_symbols(q: str, limit: int = 10):
+    """股票代號/名稱查詢 (精確、前綴與模糊比對)，供自動完成使用"""
+    symbols = get_symbol_index().search(q, limit=min(limit, 50))
+    return {"query": q, "results": [{**s._asdict(), "ticker": s.ticker} for s in symbols]}
+
+@app.websocket("/ws/quotes")
+async def stream_quotes(websocket: WebSocket):
+    """
+    即時報價 WebSocket
+
+    連線時可用 query string 直接訂閱: /ws/quotes?tickers=2330,2454
+    連線後可傳送:
+        {"action": "subscribe", "tickers": ["2330"]}
+        {"action": "unsubscribe", "tickers": ["2330"]}
+    伺服器推送: {"type": "quote", "ticker": "2330.TW", "close": ..., "change": ..., ...}
+    無效代號與超過 MAX_WS_SUBSCRIPTIONS 的訂閱不會送往上游，列在回應的 rejected 欄位
+    """
+    await websocket.accept()
+    queue = quote_hub.new_queue()
+    subscribed = set()
+
+    def update(action, tickers):
+        """更新訂閱，回傳被拒絕的代號 (無效或超過訂閱上限)"""
+        rejected = []
+        names = [t for t in tickers if isinstance(t, str) and t.strip()]
+        for ticker in dict.fromkeys(normalize_ticker(t) for t in names):
+            if action == "subscribe" and ticker not in subscribed:
+                if not is_plausible_ticker(ticker) or len(subscribed) >= MAX_WS_SUBSCRIPTIONS:
+                    rejected.append(ticker)
+                    continue
+                subscribed.add(ticker)
+                quote_hub.subscribe(ticker, queue)
+            elif action == "unsubscribe" and ticker in subscribed:
+                subscribed.discard(ticker)
+                quote_hub.unsubscribe(ticker, queue)
+        return rejected
+
+    async def sender():
+        while True:
+            await websocket.send_json(await queue.get())
+
+    rejected = update("subscribe", websocket.query_params.get("tickers", "").split(","))
+    if rejected:
+        await websocket.send_json({"type": "subscribed", "tickers": sorted(subscribed), "rejected": rejected})
+    send_task = asyncio.create_task(sender())
+    try:
+        while True:
+            try:
+                message = json.loads(await websocket.receive_text())
+            except ValueError:
+                message = None
+            if not isinstance(message, dict):
+                await websocket.send_json({"type": "error", "message": "訊息格式錯誤，需為 JSON 物件"})
+                continue
+            action = message.get("action")
+            tickers = message.get("tickers", [])
+            if action in ("subscribe", "unsubscribe") and not isinstance(tickers, list):
+                await websocket.send_json({"type": "error", "message": "tickers 需為代號列表"})
+            elif action in ("subscribe", "unsubscribe"):
+                rejected = update(action, tickers)
+                await websocket.send_json({"type": "subscribed", "tickers": sorted(subscribed), "rejected": rejected})
+            else:
+                await websocket.send_json({"type": "error", "message": f"未知的 action: {action}"})
+    except WebSocketDisconnect:
+        pass
+    finally:
+        send_task.cancel()
+        for ticker in subscribed:
+            quote_hub.unsubscribe(ticker, queue)
+
 if __name__ == "__main__":
     import uvicorn
-    import os
     # Railway 會提供 PORT 環境變數，本地開發則用 8001
     port = int(os.getenv("PORT", 8001))
     uvicorn.run(app, host="0.0.0.0", port=port)
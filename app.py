@@ -1,26 +1,32 @@
 import streamlit as st
-import yfinance as yf
-from google import genai
-import plotly.graph_objects as go
-import plotly.express as px
-from dotenv import load_dotenv
+# Step 1: 環境設定 - 載入環境變數 (需早於其他本地模組)
+from settings import GOOGLE_API_KEY, MAIL_USERNAME, MAIL_PASSWORD, MAIL_TO
 import os
+import re
 import pandas as pd
-import requests
 import time
-import pdfplumber
-import datetime
-import json
-from streamlit_js_eval import streamlit_js_eval, get_page_location
-from daily_report import get_market_summary, generate_ai_report, send_email
-from dca_tool import calculate_dca_performance
-
-# Step 1: 環境設定 - 載入環境變數
-load_dotenv(override=True)
-GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
-MAIL_USERNAME = os.getenv("MAIL_USERNAME")
-MAIL_PASSWORD = os.getenv("MAIL_PASSWORD")
-MAIL_TO = os.getenv("MAIL_TO")
+from daily_report import send_email
+from report_store import get_or_create_report, format_generated_at
+from bar_rollups import load_rollup, TIMEFRAME_LABELS, CHART_MAX_BARS
+from dca_tool import (calculate_dca_performance, calculate_rolling_dca, format_rolling_summary,
+                      simulate_dca_outcomes, format_simulation_summary)
+from rate_limit import guarded_call, STALE_NOTICE
+from shared_cache import get_shared_cache
+from symbols import normalize_ticker, get_symbol_index
+from data_store import get_data_store
+from portfolio_risk import parse_holdings, analyze_portfolio_risk, format_risk_summary
+from portfolio_optimizer import optimize_portfolio
+from followup_chat import build_context, ask_followup
+from analysis_history import (get_analysis_history, generate_with_history, diff_reports,
+                              format_entry_time, PAGE_LABELS)
+from trading_calendar import now_tw
+from cache_policy import cache_ttl
+from request_log import log_request, log_requests
+from browser_storage import get_browser_storage
+from fundamentals import fetch_fundamentals, build_peer_table, get_fundamentals_store, ITEM_LABELS
+
+# 注意：yfinance、plotly、pdfplumber、streamlit_js_eval 皆為重量級套件 (google.genai 由 llm 模組延遲載入)，
+# 改在實際使用的頁面/函數內才 import，以縮短冷啟動與每次 rerun 的時間。
 
 # 設定 Streamlit 頁面配置
 st.set_page_config(page_title="台股全方位 AI 助理", layout="wide", page_icon="📊")
@@ -29,311 +35,20 @@ st.set_page_config(page_title="台股全方位 AI 助理", layout="wide", page_i
 # 現代化金融主題 CSS 樣式
 # ==========================================
 
-CUSTOM_CSS = """
-<style>
-    /* ===== Google Fonts 導入 ===== */
-    @import url('https://fonts.googleapis.com/css2?family=Inter:wght@400;500;600;700&family=Noto+Sans+TC:wght@400;500;700&display=swap');
-    
-    /* ===== 根元素變數 ===== */
-    :root {
-        --bg-primary: #0E1117;
-        --bg-secondary: #1E2530;
-        --bg-card: rgba(30, 41, 59, 0.7);
-        --text-primary: #F1F5F9;
-        --text-secondary: #94A3B8;
-        --accent-blue: #60A5FA;
-        --accent-purple: #A78BFA;
-        --accent-cyan: #22D3EE;
-        --up-color: #10B981;
-        --down-color: #EF4444;
-        --border-subtle: rgba(148, 163, 184, 0.15);
-        --shadow-glow: 0 0 20px rgba(96, 165, 250, 0.15);
-    }
-    
-    /* ===== 主區域背景 ===== */
-    .stApp {
-        background: linear-gradient(135deg, var(--bg-primary) 0%, var(--bg-secondary) 100%);
-        font-family: 'Noto Sans TC', 'Inter', sans-serif;
-    }
-    
-    /* ===== 側邊欄樣式 ===== */
-    [data-testid="stSidebar"] {
-        background: linear-gradient(180deg, rgba(14, 17, 23, 0.95) 0%, rgba(30, 37, 48, 0.95) 100%);
-        backdrop-filter: blur(20px);
-        border-right: 1px solid var(--border-subtle);
-    }
-    
-    [data-testid="stSidebar"] .stMarkdown h1,
-    [data-testid="stSidebar"] .stMarkdown h2 {
-        background: linear-gradient(135deg, var(--accent-blue), var(--accent-cyan));
-        -webkit-background-clip: text;
-        -webkit-text-fill-color: transparent;
-        font-weight: 700;
-        letter-spacing: 0.5px;
-    }
-    
-    /* ===== Radio Button (導航) 樣式 ===== */
-    [data-testid="stSidebar"] .stRadio > div {
-        gap: 0.25rem;
-    }
-    
-    [data-testid="stSidebar"] .stRadio > div > label {
-        background: transparent;
-        padding: 0.75rem 1rem;
-        border-radius: 10px;
-        border: 1px solid transparent;
-        transition: all 0.3s ease;
-        cursor: pointer;
-    }
-    
-    [data-testid="stSidebar"] .stRadio > div > label:hover {
-        background: var(--bg-card);
-        border-color: var(--border-subtle);
-        transform: translateX(4px);
-    }
-    
-    [data-testid="stSidebar"] .stRadio > div > label[data-checked="true"] {
-        background: linear-gradient(135deg, rgba(96, 165, 250, 0.2), rgba(167, 139, 250, 0.1));
-        border-color: var(--accent-blue);
-        box-shadow: var(--shadow-glow);
-    }
-    
-    /* ===== 標題樣式 ===== */
-    h1, h2, h3 {
-        color: var(--text-primary) !important;
-        font-weight: 600;
-    }
-    
-    h1 {
-        font-size: 2rem !important;
-        background: linear-gradient(135deg, var(--accent-blue), var(--accent-purple));
-        -webkit-background-clip: text;
-        -webkit-text-fill-color: transparent;
-        padding-bottom: 0.5rem;
-        border-bottom: 1px solid var(--border-subtle);
-    }
-    
-    /* ===== 指標卡片 (Metrics) 樣式 ===== */
-    [data-testid="stMetric"] {
-        background: var(--bg-card);
-        backdrop-filter: blur(16px);
-        border: 1px solid var(--border-subtle);
-        border-radius: 16px;
-        padding: 1.25rem;
-        transition: all 0.3s ease;
-        box-shadow: 0 4px 6px rgba(0, 0, 0, 0.2);
-    }
-    
-    [data-testid="stMetric"]:hover {
-        transform: translateY(-4px);
-        box-shadow: var(--shadow-glow), 0 8px 16px rgba(0, 0, 0, 0.3);
-        border-color: var(--accent-blue);
-    }
-    
-    [data-testid="stMetricLabel"] {
-        color: var(--text-secondary) !important;
-        font-size: 0.85rem;
-        font-weight: 500;
-        text-transform: uppercase;
-        letter-spacing: 0.5px;
-    }
-    
-    [data-testid="stMetricValue"] {
-        color: var(--text-primary) !important;
-        font-size: 1.75rem !important;
-        font-weight: 700;
-        font-family: 'Inter', monospace;
-    }
-    
-    /* ===== 主按鈕樣式 ===== */
-    .stButton > button {
-        background: linear-gradient(135deg, var(--accent-blue), var(--accent-purple));
-        color: white;
-        border: none;
-        border-radius: 12px;
-        padding: 0.75rem 2rem;
-        font-weight: 600;
-        font-size: 1rem;
-        transition: all 0.3s ease;
-        box-shadow: 0 4px 12px rgba(96, 165, 250, 0.3);
-    }
-    
-    .stButton > button:hover {
-        transform: translateY(-2px) scale(1.02);
-        box-shadow: 0 6px 20px rgba(96, 165, 250, 0.4);
-    }
-    
-    .stButton > button:active {
-        transform: translateY(0) scale(0.98);
-    }
-    
-    /* ===== 輸入框樣式 ===== */
-    .stTextInput > div > div > input,
-    .stNumberInput > div > div > input,
-    .stTextArea > div > div > textarea {
-        background: var(--bg-card) !important;
-        border: 1px solid var(--border-subtle) !important;
-        border-radius: 10px !important;
-        color: var(--text-primary) !important;
-        padding: 0.75rem 1rem !important;
-        transition: all 0.3s ease;
-    }
-    
-    .stTextInput > div > div > input:focus,
-    .stNumberInput > div > div > input:focus,
-    .stTextArea > div > div > textarea:focus {
-        border-color: var(--accent-blue) !important;
-        box-shadow: 0 0 0 3px rgba(96, 165, 250, 0.2) !important;
-    }
-    
-    /* ===== 下拉選單樣式 ===== */
-    .stSelectbox > div > div {
-        background: var(--bg-card) !important;
-        border: 1px solid var(--border-subtle) !important;
-        border-radius: 10px !important;
-    }
-    
-    /* ===== 標籤頁 (Tabs) 樣式 ===== */
-    .stTabs [data-baseweb="tab-list"] {
-        background: var(--bg-card);
-        border-radius: 12px;
-        padding: 0.5rem;
-        gap: 0.25rem;
-    }
-    
-    .stTabs [data-baseweb="tab"] {
-        background: transparent;
-        border-radius: 8px;
-        color: var(--text-secondary);
-        font-weight: 500;
-        padding: 0.75rem 1.5rem;
-        transition: all 0.3s ease;
-    }
-    
-    .stTabs [data-baseweb="tab"]:hover {
-        color: var(--text-primary);
-        background: rgba(96, 165, 250, 0.1);
-    }
-    
-    .stTabs [aria-selected="true"] {
-        background: linear-gradient(135deg, var(--accent-blue), var(--accent-purple)) !important;
-        color: white !important;
-    }
-    
-    /* ===== 圖表容器樣式 ===== */
-    [data-testid="stPlotlyChart"] {
-        background: var(--bg-card);
-        border: 1px solid var(--border-subtle);
-        border-radius: 16px;
-        padding: 1rem;
-        backdrop-filter: blur(12px);
-    }
-    
-    /* ===== 資訊框樣式 ===== */
-    .stAlert {
-        background: var(--bg-card) !important;
-        border: 1px solid var(--border-subtle);
-        border-radius: 12px;
-        backdrop-filter: blur(12px);
-    }
-    
-    [data-testid="stAlertContentInfo"] {
-        background: linear-gradient(135deg, rgba(96, 165, 250, 0.1), rgba(167, 139, 250, 0.05)) !important;
-        border-left: 4px solid var(--accent-blue) !important;
-    }
-    
-    /* ===== 成功/警告/錯誤框樣式 ===== */
-    [data-testid="stAlertContentSuccess"] {
-        background: rgba(16, 185, 129, 0.1) !important;
-        border-left: 4px solid var(--up-color) !important;
-    }
-    
-    [data-testid="stAlertContentWarning"] {
-        background: rgba(245, 158, 11, 0.1) !important;
-        border-left: 4px solid #F59E0B !important;
-    }
-    
-    [data-testid="stAlertContentError"] {
-        background: rgba(239, 68, 68, 0.1) !important;
-        border-left: 4px solid var(--down-color) !important;
-    }
-    
-    /* ===== 資料表格樣式 ===== */
-    .stDataFrame {
-        background: var(--bg-card);
-        border-radius: 12px;
-        overflow: hidden;
-    }
-    
-    /* ===== 檔案上傳器樣式 ===== */
-    [data-testid="stFileUploader"] {
-        background: var(--bg-card);
-        border: 2px dashed var(--border-subtle);
-        border-radius: 12px;
-        padding: 1rem;
-        transition: all 0.3s ease;
-    }
-    
-    [data-testid="stFileUploader"]:hover {
-        border-color: var(--accent-blue);
-    }
-    
-    /* ===== Spinner 樣式 ===== */
-    .stSpinner > div {
-        border-top-color: var(--accent-blue) !important;
-    }
-    
-    /* ===== 分隔線 ===== */
-    hr {
-        border-color: var(--border-subtle) !important;
-    }
-    
-    /* ===== 自定義滾動條 ===== */
-    ::-webkit-scrollbar {
-        width: 8px;
-        height: 8px;
-    }
-    
-    ::-webkit-scrollbar-track {
-        background: var(--bg-primary);
-    }
-    
-    ::-webkit-scrollbar-thumb {
-        background: var(--border-subtle);
-        border-radius: 4px;
-    }
-    
-    ::-webkit-scrollbar-thumb:hover {
-        background: var(--accent-blue);
-    }
-    
-    /* ===== 動畫效果 ===== */
-    @keyframes fadeIn {
-        from { opacity: 0; transform: translateY(10px); }
-        to { opacity: 1; transform: translateY(0); }
-    }
-    
-    .element-container {
-        animation: fadeIn 0.3s ease-out;
-    }
-    
-    /* ===== Expander 樣式 ===== */
-    [data-testid="stExpander"] {
-        background: var(--bg-card);
-        border: 1px solid var(--border-subtle);
-        border-radius: 12px;
-    }
-    
-    /* ===== 數據編輯器樣式 ===== */
-    [data-testid="stDataFrameResizable"] {
-        background: var(--bg-card) !important;
-        border-radius: 12px;
-    }
-</style>
-"""
+CSS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static", "style.css")
 
-# 注入自定義 CSS
-st.markdown(CUSTOM_CSS, unsafe_allow_html=True)
+@st.cache_resource
+def load_custom_css():
+    """讀取並壓縮 CSS (每個程序只讀取一次檔案)"""
+    with open(CSS_PATH, encoding="utf-8") as f:
+        css = f.read()
+    css = re.sub(r"/\*.*?\*/", "", css, flags=re.S)  # 移除註解
+    css = re.sub(r"\s+", " ", css)                   # 壓縮空白
+    css = re.sub(r"\s*([{};,])\s*", r"\1", css)
+    return f"<style>{css.strip()}</style>"
+
+# 注入自定義 CSS (Streamlit 每次 rerun 都需重新輸出元素，但內容已快取並壓縮)
+st.markdown(load_custom_css(), unsafe_allow_html=True)
 
 # ==========================================
 # 共用函數 (Utilities)
@@ -382,20 +97,130 @@ def apply_chart_theme(fig, title=None):
     return fig
 
 def get_stock_data(ticker):
-    """獲取指定股票的歷史股價與基本資料"""
+    """獲取指定股票的歷史股價與基本資料 (優先使用跨程序共用快取)"""
+    import yfinance as yf
     try:
+        cache = get_shared_cache()
         stock = yf.Ticker(ticker)
-        history = stock.history(period="6mo")
-        info = stock.info
+        history, stale = cache.get_or_compute(
+            "bars", (ticker, "6mo"),
+            lambda: guarded_call("yfinance", ("history", ticker, "6mo"), stock.history, period="6mo"),
+            ttl=cache_ttl("bars"),
+            should_cache=lambda result: not result[1] and not result[0].empty
+        )
+        # 鍵為 tuple，與舊版只存 info (不含 stale 旗標) 的快取項目區隔
+        info, info_stale = cache.get_or_compute(
+            "info", (ticker,),
+            lambda: guarded_call("yfinance", ("info", ticker), lambda: stock.info),
+            ttl=cache_ttl("info"),
+            should_cache=lambda result: not result[1]
+        )
         if history.empty:
             return None, None
+        if stale or info_stale:
+            st.warning(STALE_NOTICE)
         return history, info
     except Exception as e:
         st.error(f"獲取數據時發生錯誤: {e}")
         return None, None
 
+def render_price_chart(ticker, history):
+    """
+    K 線圖與週期切換：日線使用分析期間的資料，週 / 月 / 季線由完整日線彙總 (最多顯示 CHART_MAX_BARS 根)
+
+    Args:
+        ticker: 股票代號
+        history: 已加上 MA20 欄位的日 K 線
+    """
+    import plotly.graph_objects as go
+
+    timeframe = st.radio("K 線週期", list(TIMEFRAME_LABELS), format_func=TIMEFRAME_LABELS.get,
+                         horizontal=True, key="stock_timeframe")
+    bars = history
+    if timeframe != "D":
+        try:
+            bars, stale = load_rollup(ticker, timeframe)
+            if stale:
+                st.warning(STALE_NOTICE)
+            bars = bars.assign(MA20=bars['Close'].rolling(window=20).mean()).tail(CHART_MAX_BARS)
+        except Exception as e:
+            st.warning(f"無法取得長期 K 線，改顯示日線: {e}")
+            timeframe, bars = "D", history
+
+    fig = go.Figure()
+    fig.add_trace(go.Candlestick(
+        x=bars.index,
+        open=bars['Open'],
+        high=bars['High'],
+        low=bars['Low'],
+        close=bars['Close'],
+        name='K線',
+        increasing_line_color='#10B981',  # 上漲顏色
+        decreasing_line_color='#EF4444',  # 下跌顏色
+        increasing_fillcolor='#10B981',
+        decreasing_fillcolor='#EF4444'
+    ))
+    fig.add_trace(go.Scatter(
+        x=bars.index,
+        y=bars['MA20'],
+        mode='lines',
+        name='MA20',
+        line=dict(color='#F59E0B', width=2)
+    ))
+    fig.update_layout(height=450, xaxis_rangeslider_visible=False)
+    apply_chart_theme(fig, f"📈 {ticker} 股價走勢圖 ({TIMEFRAME_LABELS[timeframe]})")
+    st.plotly_chart(fig, width='stretch')
+
+def show_history_notice(entry):
+    """相同輸入沿用歷史紀錄時顯示說明"""
+    if entry and entry['reused']:
+        st.caption(f"📚 沿用 {format_entry_time(entry)} 的分析紀錄 (輸入相同，未重新呼叫 AI)")
+
+def format_followup_usage(info):
+    """追問回答的 token 用量說明"""
+    tokens = f"送出 {info['prompt_tokens']} tokens" if info['prompt_tokens'] is not None else "送出新問題"
+    if info['cached']:
+        cached = info['cached_tokens'] if info['cached_tokens'] is not None else "?"
+        return f"⚡ 沿用已分析的脈絡 ({cached} tokens 來自快取)，{tokens}，耗時 {info['elapsed']:.1f} 秒"
+    return f"{tokens}，耗時 {info['elapsed']:.1f} 秒"
+
+def render_followup_chat():
+    """分析報告下方的追問對話 (沿用已解析的文件與數據，不重新分析)"""
+    analysis = st.session_state.stock_analysis
+    context = get_data_store().get(analysis.get('context_key'))
+    if context is None:
+        return
+
+    st.subheader("💬 追問")
+    st.caption("針對上方報告提問，會沿用已解析的財報與數據，不需重新分析")
+    chat = analysis.setdefault('chat', [])
+    for turn in chat:
+        with st.chat_message("user" if turn['role'] == "user" else "assistant"):
+            st.markdown(turn['text'])
+            if turn.get('usage'):
+                st.caption(turn['usage'])
+
+    question = st.chat_input("例如：營收成長的主要動能是什麼？", key="followup_input")
+    if not question:
+        return
+    with st.chat_message("user"):
+        st.markdown(question)
+    with st.chat_message("assistant"):
+        try:
+            with st.spinner("Gemini 正在回答..."):
+                answer, info = ask_followup(context, chat, question)
+        except Exception as e:
+            st.error(f"追問失敗: {e}")
+            return
+        usage = format_followup_usage(info)
+        st.markdown(answer)
+        st.caption(usage)
+    chat.append({"role": "user", "text": question})
+    chat.append({"role": "model", "text": answer, "usage": usage})
+
 def extract_text_from_pdf(uploaded_file):
     """使用 pdfplumber 解析上傳的 PDF"""
+    import pdfplumber
     text = ""
     try:
         with pdfplumber.open(uploaded_file) as pdf:
@@ -405,85 +230,32 @@ def extract_text_from_pdf(uploaded_file):
     except Exception as e:
         return f"PDF 解析失敗: {e}"
 
-def save_to_local_storage(key, data):
-    """
-    儲存資料到瀏覽器 localStorage
-
-    Args:
-        key: 儲存的鍵名
-        data: 要儲存的資料 (會轉換為 JSON)
-    """
-    try:
-        # 將資料轉為 JSON 字串
-        data_json = json.dumps(data, ensure_ascii=False)
-        # 轉義單引號以避免 JavaScript 語法錯誤
-        data_json_escaped = data_json.replace("'", "\\'")
-
-        # 使用 streamlit_js_eval 執行 JavaScript (使用 js_expressions 參數)
-        js_code = f"localStorage.setItem('{key}', '{data_json_escaped}')"
-        streamlit_js_eval(
-            js_expressions=js_code,
-            key=f"save_{key}_{hash(str(data))}"  # 使用 hash 確保 key 唯一性
-        )
-    except Exception as e:
-        # 靜默失敗,不顯示錯誤訊息 (localStorage 是增強功能,非必要)
-        pass
-
-def load_from_local_storage(key, default=None):
-    """
-    從瀏覽器 localStorage 載入資料
-
-    Args:
-        key: 儲存的鍵名
-        default: 預設值
-
-    Returns:
-        載入的資料或預設值
-    """
-    try:
-        # 使用 streamlit_js_eval 執行 JavaScript 取得資料
-        js_code = f"localStorage.getItem('{key}')"
-        result = streamlit_js_eval(
-            js_expressions=js_code,
-            key=f"load_{key}"
+def show_ticker_hint(raw, ticker):
+    """顯示正規化後的代號與股票名稱；無法解析時列出主檔中的候選股票 (自動完成提示)"""
+    index = get_symbol_index()
+    symbol = index.by_code.get(ticker.split('.')[0]) if ticker else None
+    if symbol and ticker == symbol.ticker:
+        st.caption(f"✓ 使用代號: {ticker} ({symbol.name} · {symbol.industry})")
+        return
+    if ticker != raw:
+        st.caption(f"✓ 使用代號: {ticker}")
+    candidates = index.search(raw, limit=5) if raw else []
+    if candidates:
+        st.caption("🔎 您是不是要找: " + "、".join(f"{s.label} ({s.ticker})" for s in candidates))
+
+def render_memory_report():
+    """側邊欄顯示本 session 引用的資料量，以及程序共用資料區的使用狀況"""
+    store = get_data_store()
+    analysis = st.session_state.get('stock_analysis', {})
+    keys = [analysis.get('history_key'), analysis.get('info_key'), st.session_state.get('portfolio_key')]
+    session_bytes = store.size_of(k for k in keys if k)
+    stats = store.stats()
+    with st.sidebar.expander("🧠 記憶體使用"):
+        st.caption(f"本工作階段引用資料: {session_bytes / 1024:.1f} KB")
+        st.caption(
+            f"共用資料區: {stats['bytes'] / 1024 / 1024:.1f} / {stats['max_bytes'] / 1024 / 1024:.0f} MB "
+            f"({stats['entries']} 筆，已淘汰 {stats['evictions']} 筆)"
         )
-        if result:
-            return json.loads(result)
-    except Exception:
-        pass
-    return default
-
-def normalize_ticker(ticker):
-    """
-    正規化股票代號 - 自動補上 .TW 後綴
-
-    Args:
-        ticker: 使用者輸入的股票代號
-
-    Returns:
-        正規化後的股票代號
-
-    Examples:
-        normalize_ticker("2330") -> "2330.TW"
-        normalize_ticker("2330.TW") -> "2330.TW"
-        normalize_ticker("0050") -> "0050.TW"
-    """
-    if not ticker:
-        return ticker
-
-    # 移除前後空白
-    ticker = ticker.strip()
-
-    # 如果已經有後綴,直接返回
-    if '.' in ticker:
-        return ticker.upper()
-
-    # 純數字代號,自動加上 .TW
-    if ticker.isdigit():
-        return f"{ticker}.TW"
-
-    # 其他情況(可能是美股等),原樣返回
-    return ticker.upper()
 
 def format_market_cap(value):
     """將市值轉換為 '億' 單位"""
@@ -517,27 +289,24 @@ def page_stock_analysis():
 
     # 初始化 session state
     if 'stock_analysis' not in st.session_state:
+        # 預設為上次使用的股票代號 (瀏覽器 localStorage)
         st.session_state.stock_analysis = {
-            'ticker': '2330.TW',
-            'history': None,
-            'info': None,
+            'ticker': get_browser_storage().get('last_stock_ticker') or '2330.TW',
+            'history_key': None,   # 資料存放於共用 DataStore，session 只保存鍵值
+            'info_key': None,
             'ai_report': None,
+            'context_key': None,   # 追問用的脈絡 (見 followup_chat)
+            'chat': [],
             'analyzed': False
         }
 
-    # 載入上次使用的股票代號
-    if 'last_ticker' not in st.session_state:
-        last_ticker = load_from_local_storage('last_stock_ticker', '2330.TW')
-        if last_ticker:
-            st.session_state.stock_analysis['ticker'] = last_ticker
-
     col1, col2 = st.columns([1, 3])
     with col1:
         ticker_input_raw = st.text_input(
             "輸入股票代號",
             value=st.session_state.stock_analysis['ticker'],
             key="ticker_input",
-            help="輸入數字代號即可 (例如: 2330),系統會自動補上 .TW"
+            help="輸入代號或名稱即可 (例如: 2330、台積電),系統會自動補上 .TW / .TWO"
         )
 
         # 正規化股票代號
@@ -548,9 +317,8 @@ def page_stock_analysis():
             st.session_state.stock_analysis['analyzed'] = False
             st.session_state.stock_analysis['ticker'] = ticker_input
 
-        # 顯示正規化後的代號
-        if ticker_input != ticker_input_raw:
-            st.caption(f"✓ 使用代號: {ticker_input}")
+        # 顯示正規化後的代號與候選股票
+        show_ticker_hint(ticker_input_raw, ticker_input)
 
         uploaded_file = st.file_uploader("上傳財報 PDF (選填)", type="pdf")
 
@@ -561,24 +329,28 @@ def page_stock_analysis():
             if st.button("🗑️ 清除"):
                 st.session_state.stock_analysis = {
                     'ticker': '2330.TW',
-                    'history': None,
-                    'info': None,
+                    'history_key': None,
+                    'info_key': None,
                     'ai_report': None,
+                    'context_key': None,
+                    'chat': [],
                     'analyzed': False
                 }
                 st.rerun()
 
     if run_analysis:
         # 儲存股票代號到 localStorage
-        save_to_local_storage('last_stock_ticker', ticker_input)
+        get_browser_storage().set('last_stock_ticker', ticker_input)
+        log_request(ticker_input, "stock")
 
         with st.spinner("正在獲取數據..."):
             history, info = get_stock_data(ticker_input)
 
         if history is not None and not history.empty:
-            # 儲存數據到 session state
-            st.session_state.stock_analysis['history'] = history
-            st.session_state.stock_analysis['info'] = info
+            # 數據放入共用存放區 (相同內容只存一份)，session state 只保存鍵值
+            store = get_data_store()
+            st.session_state.stock_analysis['history_key'] = store.put(history)
+            st.session_state.stock_analysis['info_key'] = store.put(info)
             # 1. 數據概覽
             latest_close = history['Close'].iloc[-1]
             change = latest_close - history['Close'].iloc[-2]
@@ -590,30 +362,9 @@ def page_stock_analysis():
             c3.metric("市值", format_market_cap(info.get('marketCap')))
 
             # 2. K線圖
-            history['MA20'] = history['Close'].rolling(window=20).mean()
-            fig = go.Figure()
-            fig.add_trace(go.Candlestick(
-                x=history.index, 
-                open=history['Open'], 
-                high=history['High'],
-                low=history['Low'], 
-                close=history['Close'], 
-                name='K線',
-                increasing_line_color='#10B981',  # 上漲顏色
-                decreasing_line_color='#EF4444',  # 下跌顏色
-                increasing_fillcolor='#10B981',
-                decreasing_fillcolor='#EF4444'
-            ))
-            fig.add_trace(go.Scatter(
-                x=history.index, 
-                y=history['MA20'], 
-                mode='lines', 
-                name='MA20', 
-                line=dict(color='#F59E0B', width=2)
-            ))
-            fig.update_layout(height=450, xaxis_rangeslider_visible=False)
-            apply_chart_theme(fig, f"📈 {ticker_input} 股價走勢圖")
-            st.plotly_chart(fig, width='stretch')
+            # 共用資料為唯讀，以 assign 產生新的 DataFrame 加上 MA20
+            history = history.assign(MA20=history['Close'].rolling(window=20).mean())
+            render_price_chart(ticker_input, history)
 
 
             # 3. AI 分析
@@ -631,12 +382,11 @@ def page_stock_analysis():
             # 呼叫 Gemini
             if GOOGLE_API_KEY:
                 try:
-                    client = genai.Client(api_key=GOOGLE_API_KEY)
-
                     market_cap_str = format_market_cap(info.get('marketCap'))
+                    market_context = f"收盤: {latest_close}, MA20: {history['MA20'].iloc[-1]}, 市值: {market_cap_str}"
                     prompt = f"""
                     請分析台股 {ticker_input}。
-                    【技術面數據】收盤: {latest_close}, MA20: {history['MA20'].iloc[-1]}, 市值: {market_cap_str}
+                    【技術面數據】{market_context}
                     【財報/法說會內容】
                     {report_text[:10000]} (內容過長已截斷)
 
@@ -646,14 +396,19 @@ def page_stock_analysis():
                     3. 投資建議
                     """
                     with st.spinner("Gemini 正在思考中..."):
-                        response = client.models.generate_content(
-                            model='gemini-2.5-flash',
-                            contents=prompt
-                        )
+                        ai_text, stale, entry = generate_with_history("stock", ticker_input, prompt)
+                        if stale:
+                            st.warning(STALE_NOTICE)
+                        show_history_notice(entry)
                         # 儲存 AI 報告到 session state
-                        st.session_state.stock_analysis['ai_report'] = response.text
+                        st.session_state.stock_analysis['ai_report'] = ai_text
                         st.session_state.stock_analysis['analyzed'] = True
-                        st.markdown(response.text)
+                        st.markdown(ai_text)
+                    # 已解析的文件與數據保留給追問使用，新的分析重新開始對話
+                    context = build_context(ticker_input, market_context, report_text, ai_text)
+                    st.session_state.stock_analysis['context_key'] = get_data_store().put(context)
+                    st.session_state.stock_analysis['chat'] = []
+                    render_followup_chat()
                 except Exception as e:
                     st.error(f"AI 分析錯誤: {e}")
             else:
@@ -663,13 +418,18 @@ def page_stock_analysis():
 
     # 顯示快取的分析結果 (切換頁面後回來時顯示)
     elif st.session_state.stock_analysis['analyzed']:
-        st.info("💡 以下是您上次的分析結果,如需重新分析請點擊「🔍 開始分析」")
-
-        history = st.session_state.stock_analysis['history']
-        info = st.session_state.stock_analysis['info']
+        store = get_data_store()
+        history = store.get(st.session_state.stock_analysis['history_key'])
+        info = store.get(st.session_state.stock_analysis['info_key'])
         ticker_input = st.session_state.stock_analysis['ticker']
 
-        if history is not None and not history.empty:
+        if history is None or info is None:
+            # 資料已因容量上限被淘汰
+            st.session_state.stock_analysis['analyzed'] = False
+            st.info("💡 上次的分析資料已釋出，請點擊「🔍 開始分析」重新載入")
+        elif not history.empty:
+            st.info("💡 以下是您上次的分析結果,如需重新分析請點擊「🔍 開始分析」")
+
             # 1. 數據概覽
             latest_close = history['Close'].iloc[-1]
             change = latest_close - history['Close'].iloc[-2]
@@ -681,71 +441,64 @@ def page_stock_analysis():
             c3.metric("市值", format_market_cap(info.get('marketCap')))
 
             # 2. K線圖
-            history['MA20'] = history['Close'].rolling(window=20).mean()
-            fig = go.Figure()
-            fig.add_trace(go.Candlestick(
-                x=history.index,
-                open=history['Open'],
-                high=history['High'],
-                low=history['Low'],
-                close=history['Close'],
-                name='K線',
-                increasing_line_color='#10B981',
-                decreasing_line_color='#EF4444',
-                increasing_fillcolor='#10B981',
-                decreasing_fillcolor='#EF4444'
-            ))
-            fig.add_trace(go.Scatter(
-                x=history.index,
-                y=history['MA20'],
-                mode='lines',
-                name='MA20',
-                line=dict(color='#F59E0B', width=2)
-            ))
-            fig.update_layout(height=450, xaxis_rangeslider_visible=False)
-            apply_chart_theme(fig, f"📈 {ticker_input} 股價走勢圖")
-            st.plotly_chart(fig, width='stretch')
+            # 共用資料為唯讀，以 assign 產生新的 DataFrame 加上 MA20
+            history = history.assign(MA20=history['Close'].rolling(window=20).mean())
+            render_price_chart(ticker_input, history)
 
             # 3. 顯示快取的 AI 分析
             if st.session_state.stock_analysis['ai_report']:
                 st.subheader("🤖 Gemini 深度分析報告")
                 st.markdown(st.session_state.stock_analysis['ai_report'])
+                render_followup_chat()
+
+    # 本工作階段尚未分析時，顯示此股票最近一次的分析紀錄 (本地索引查詢，不呼叫 AI)
+    else:
+        latest = get_analysis_history().latest("stock", ticker_input)
+        if latest:
+            st.info(f"📚 {ticker_input} 最近一次分析於 {format_entry_time(latest)}，"
+                    "點擊「🔍 開始分析」可取得最新結果，或至「📚 分析紀錄」比較歷次報告")
+            with st.expander("查看上次的 AI 分析報告"):
+                st.markdown(latest['report'])
 
 # ==========================================
 # 頁面 2: 投資組合與心態
 # ==========================================
 
 def page_portfolio():
+    import plotly.express as px
+
     st.header("🧘 投資組合與心態健檢")
 
     st.info("💡 您的投資組合會永久儲存在瀏覽器中，下次使用時會自動載入。")
 
     # 初始化 session state - 嘗試從 localStorage 載入
-    if 'portfolio_data' not in st.session_state:
+    # (投資組合放在共用 DataStore，session state 只保存鍵值；資料被淘汰時重新載入)
+    store = get_data_store()
+    if store.get(st.session_state.get('portfolio_key')) is None:
         # 嘗試從 localStorage 載入
-        stored_data = load_from_local_storage('stock_portfolio')
+        stored_data = get_browser_storage().get('stock_portfolio')
 
         if stored_data:
             try:
-                st.session_state.portfolio_data = pd.DataFrame(stored_data)
+                st.session_state.portfolio_key = store.put(pd.DataFrame(stored_data))
                 st.success("✓ 已載入您上次儲存的投資組合")
             except Exception:
                 # 載入失敗,使用預設範例
-                st.session_state.portfolio_data = pd.DataFrame({
+                st.session_state.portfolio_key = store.put(pd.DataFrame({
                     "股票代號": ["2330.TW", "2454.TW", "0050.TW"],
                     "持有比例(%)": [40.0, 30.0, 30.0]
-                })
+                }))
         else:
             # 首次使用,顯示預設範例
-            st.session_state.portfolio_data = pd.DataFrame({
+            st.session_state.portfolio_key = store.put(pd.DataFrame({
                 "股票代號": ["2330.TW", "2454.TW", "0050.TW"],
                 "持有比例(%)": [40.0, 30.0, 30.0]
-            })
+            }))
             st.info("👋 首次使用!以下是範例投資組合,您可以直接修改。")
 
     # 編輯表格 (移到按鈕前面,避免重新渲染問題)
     edited_df = st.data_editor(
-        st.session_state.portfolio_data,
+        store.get(st.session_state.portfolio_key),
         num_rows="dynamic",
         use_container_width=True,
         key="portfolio_editor"
@@ -756,23 +509,27 @@ def page_portfolio():
     with col1:
         if st.button("💾 儲存組合"):
             # 更新 session state 並儲存到 localStorage
-            st.session_state.portfolio_data = edited_df
+            st.session_state.portfolio_key = store.put(edited_df)
             portfolio_dict = edited_df.to_dict('records')
-            save_to_local_storage('stock_portfolio', portfolio_dict)
+            get_browser_storage().set('stock_portfolio', portfolio_dict)
             st.success("✓ 投資組合已儲存!")
             st.rerun()
     with col2:
         if st.button("🗑️ 清空組合"):
-            st.session_state.portfolio_data = pd.DataFrame(columns=["股票代號", "持有比例(%)"])
-            save_to_local_storage('stock_portfolio', [])
+            st.session_state.portfolio_key = store.put(pd.DataFrame(columns=["股票代號", "持有比例(%)"]))
+            get_browser_storage().set('stock_portfolio', [])
             st.rerun()
     with col3:
         st.caption("提示：編輯後請點擊「💾 儲存組合」以永久保存")
 
+    # 最佳化限制 (放在按鈕前，避免調整時清除分析結果)
+    max_weight = st.slider("單一持股權重上限 (%) - 用於效率前緣與再平衡建議", 10, 100, 40, step=5) / 100
+
     # 分析按鈕
     if st.button("📊 分析投資組合", type="primary"):
         # 先更新 session state
-        st.session_state.portfolio_data = edited_df
+        st.session_state.portfolio_key = store.put(edited_df)
+        log_requests([t for t, _ in parse_holdings(edited_df)], "portfolio")
         if not edited_df.empty:
             # 繪製圓餅圖
             fig = px.pie(
@@ -785,29 +542,99 @@ def page_portfolio():
             apply_chart_theme(fig, "💰 資產配置分佈")
             st.plotly_chart(fig, width='stretch')
 
+            # 量化風險指標
+            st.subheader("📉 量化風險指標")
+            with st.spinner("正在計算投資組合風險..."):
+                risk_df, risk = analyze_portfolio_risk(parse_holdings(edited_df))
+
+            risk_text = "無法計算 (缺少歷史數據)"
+            if risk_df is not None:
+                if risk.get('stale'):
+                    st.warning(STALE_NOTICE)
+                if risk['missing']:
+                    st.warning(f"以下代號查無歷史數據，已排除於風險計算外: {', '.join(risk['missing'])}")
+                risk_text = format_risk_summary(risk_df, risk)
+                level = int(risk['confidence'] * 100)
+
+                r1, r2, r3, r4 = st.columns(4)
+                r1.metric("年化波動率", f"{risk['volatility']:.2f}%")
+                r2.metric(f"單日 {level}% VaR", f"{risk['var_hist']:.2f}%", f"參數法 {risk['var_param']:.2f}%", delta_color="off")
+                r3.metric(f"單日 {level}% CVaR", f"{risk['cvar_hist']:.2f}%", f"參數法 {risk['cvar_param']:.2f}%", delta_color="off")
+                r4.metric("Beta (vs 0050)", f"{risk['beta']:.2f}" if risk['beta'] is not None else "N/A")
+                st.caption(f"資料期間 {risk['start']} ~ {risk['end']}，共 {risk['observations']} 個交易日；VaR / CVaR 為單日損失比例")
+
+                c1, c2 = st.columns(2)
+                with c1:
+                    st.dataframe(risk_df.round(2), hide_index=True, width='stretch')
+                with c2:
+                    fig_corr = px.imshow(
+                        risk['correlation'].round(2),
+                        text_auto=True,
+                        zmin=-1, zmax=1,
+                        color_continuous_scale='RdBu_r'
+                    )
+                    apply_chart_theme(fig_corr, "🔗 相關係數矩陣")
+                    st.plotly_chart(fig_corr, width='stretch')
+            else:
+                st.info(f"無法計算風險指標: {risk.get('error')}")
+
+            # 效率前緣與再平衡建議
+            st.subheader("⚖️ 效率前緣與再平衡建議")
+            with st.spinner("正在計算效率前緣..."):
+                rebalance_df, opt = optimize_portfolio(parse_holdings(edited_df), max_weight=max_weight)
+
+            if rebalance_df is not None:
+                frontier = opt['frontier']
+                fig_frontier = px.line(
+                    x=frontier['Volatility'] * 100, y=frontier['Return'] * 100,
+                    labels={'x': '年化波動率 (%)', 'y': '年化預期報酬 (%)'}
+                )
+                for name, key, color in (("目前組合", 'current', '#F59E0B'),
+                                         ("最小變異數", 'min_variance', '#60A5FA'),
+                                         ("最大 Sharpe", 'max_sharpe', '#10B981')):
+                    fig_frontier.add_scatter(
+                        x=[opt[key]['volatility'] * 100], y=[opt[key]['return'] * 100],
+                        mode='markers', name=name, marker=dict(size=14, color=color)
+                    )
+                apply_chart_theme(fig_frontier, f"📈 效率前緣 (單一持股上限 {opt['max_weight'] * 100:.0f}%)")
+                st.plotly_chart(fig_frontier, width='stretch')
+
+                o1, o2, o3 = st.columns(3)
+                for col, name, key in ((o1, "目前組合", 'current'), (o2, "最小變異數", 'min_variance'), (o3, "最大 Sharpe", 'max_sharpe')):
+                    col.metric(name, f"Sharpe {opt[key]['sharpe']:.2f}",
+                               f"報酬 {opt[key]['return'] * 100:.1f}% / 波動 {opt[key]['volatility'] * 100:.1f}%", delta_color="off")
+
+                st.markdown("**建議再平衡 (調整至最大 Sharpe 組合)**")
+                st.dataframe(rebalance_df.round(2), hide_index=True, width='stretch')
+                st.caption(f"預期報酬以近一年歷史報酬估計，無風險利率 {opt['risk_free'] * 100:.1f}%；歷史績效不代表未來，建議僅作為調整方向參考")
+            else:
+                st.info(f"無法計算效率前緣: {opt.get('error')}")
+
             # AI 分析
             if GOOGLE_API_KEY:
                 try:
-                    client = genai.Client(api_key=GOOGLE_API_KEY)
-
                     portfolio_str = edited_df.to_string()
                     prompt = f"""
                     我是台股投資人，這是我的目前持倉：
                     {portfolio_str}
 
+                    量化風險指標 (近一年日報酬)：
+                    {risk_text}
+
                     請擔任我的「投資心態教練」，幫我分析：
-                    1. **風險評估**：這樣的配置是否過度集中？有無產業風險？
+                    1. **風險評估**：這樣的配置是否過度集中？有無產業風險？請引用上方的波動率、VaR、Beta 與風險貢獻說明。
                     2. **穩健性評分** (1-10分)：並說明理由。
                     3. **調整建議**：為了達到長期穩健獲利，建議如何調整？(例如增加債券、分散產業等)
                     4. **心態建設**：給予一段關於長期投資的心態小語。
                     """
 
                     with st.spinner("AI 教練正在評估您的配置..."):
-                        response = client.models.generate_content(
-                            model='gemini-2.5-flash',
-                            contents=prompt
-                        )
-                        st.markdown(response.text)
+                        holdings_label = "、".join(f"{t} {w:g}%" for t, w in parse_holdings(edited_df))
+                        ai_text, stale, entry = generate_with_history("portfolio", "", prompt, label=holdings_label)
+                        if stale:
+                            st.warning(STALE_NOTICE)
+                        show_history_notice(entry)
+                        st.markdown(ai_text)
                 except Exception as e:
                     st.error(f"AI 分析錯誤: {e}")
             else:
@@ -840,13 +667,13 @@ def page_daily_report():
         st.subheader("3. 報告預覽與發送")
         if st.button("生成今日日報"):
             with st.spinner("正在抓取數據並撰寫報告..."):
-                market_data = get_market_summary(watchlist)
-                report = generate_ai_report(market_data)
+                # 同一觀察名單在同一交易日只產生一次 (與排程、API 共用)
+                artifact = get_or_create_report(watchlist)
                 
-                st.session_state['daily_report_content'] = f"{market_data}\n\n{report}"
-                st.session_state['daily_report_subject'] = f"📊 台股每日 AI 摘要 ({datetime.date.today()})"
+                st.session_state['daily_report_content'] = artifact['body']
+                st.session_state['daily_report_subject'] = artifact['subject']
                 
-                st.success("報告生成完成！")
+                st.success(f"報告生成完成！(交易日 {artifact['trading_date']}，產生於 {format_generated_at(artifact)})")
 
         if 'daily_report_content' in st.session_state:
             st.text_area("報告內容預覽", value=st.session_state['daily_report_content'], height=300)
@@ -870,33 +697,92 @@ def page_daily_report():
 # 頁面 4: 基本面 AI 分析
 # ==========================================
 
+def page_peer_comparison():
+    import plotly.express as px
+
+    peers_input = st.text_area(
+        "輸入同業股票代號 (用逗號分隔)",
+        value="2330, 2303, 2454, 3711, 2379",
+        key="peer_tickers",
+        help="例如半導體族群；可輸入代號或名稱"
+    )
+    peers = list(dict.fromkeys(normalize_ticker(x.strip()) for x in peers_input.split(",") if x.strip()))
+
+    if st.button("開始同業比較"):
+        log_requests(peers, "peer")
+        started = time.perf_counter()
+        with st.spinner(f"正在並行抓取 {len(peers)} 家公司的財務數據..."):
+            bundles = fetch_fundamentals(peers)
+            table = build_peer_table(bundles)
+
+        failed = [f"{t} ({b['error']})" for t, b in bundles.items() if "error" in b]
+        if failed:
+            st.warning("以下公司抓取失敗: " + "、".join(failed))
+        partial = [f"{t} ({', '.join(b['errors'])})" for t, b in bundles.items() if b.get('errors')]
+        if partial:
+            st.warning("以下公司部分資料抓取失敗: " + "、".join(partial))
+        if any(b.get('stale') for b in bundles.values()):
+            st.warning(STALE_NOTICE)
+        if table.empty:
+            st.error("沒有可比較的財務數據")
+            return
+
+        st.caption(f"共 {len(table)} 家公司，耗時 {time.perf_counter() - started:.1f} 秒 (最新年度年報)")
+        display = table.copy()
+        display["營收"] = display["營收"].apply(format_market_cap)
+        st.dataframe(display.round(2), hide_index=True, width='stretch')
+
+        labels = table["股票代號"] + " " + table["公司"]
+        c1, c2 = st.columns(2)
+        with c1:
+            df_margin = table.set_index(labels)[["毛利率(%)", "營益率(%)", "淨利率(%)"]]
+            fig = px.bar(df_margin, barmode='group', color_discrete_sequence=CHART_COLORS)
+            apply_chart_theme(fig, "💹 獲利能力比較")
+            fig.update_layout(height=400, xaxis_title=None, yaxis_title="%")
+            st.plotly_chart(fig, width='stretch', key="chart_peer_margin")
+        with c2:
+            df_leverage = table.set_index(labels)[["負債比(%)", "ROE(%)", "營收成長率(%)"]]
+            fig = px.bar(df_leverage, barmode='group', color_discrete_sequence=CHART_COLORS)
+            apply_chart_theme(fig, "🏦 成長與財務結構比較")
+            fig.update_layout(height=400, xaxis_title=None, yaxis_title="%")
+            st.plotly_chart(fig, width='stretch', key="chart_peer_leverage")
+
 def page_fundamental_analysis():
+    import plotly.express as px
+
     st.header("📊 基本面 AI 分析")
     st.info("深入分析公司財務報表：損益表、資產負債表與現金流量表。")
 
+    mode = st.radio("分析模式", ["單一公司", "同業比較"], horizontal=True, key="fund_mode")
+    if mode == "同業比較":
+        page_peer_comparison()
+        return
+
     ticker_input_raw = st.text_input(
         "輸入股票代號",
         value="2330.TW",
         key="fund_ticker",
-        help="輸入數字代號即可 (例如: 2330),系統會自動補上 .TW"
+        help="輸入代號或名稱即可 (例如: 2330、台積電),系統會自動補上 .TW / .TWO"
     )
     ticker_input = normalize_ticker(ticker_input_raw)
 
-    # 顯示正規化後的代號
-    if ticker_input != ticker_input_raw:
-        st.caption(f"✓ 使用代號: {ticker_input}")
+    # 顯示正規化後的代號與候選股票
+    show_ticker_hint(ticker_input_raw, ticker_input)
 
     if st.button("開始基本面分析"):
+        log_request(ticker_input, "fundamental")
         # 只在 spinner 內做數據獲取
         with st.spinner("正在獲取財務數據..."):
             try:
-                stock = yf.Ticker(ticker_input)
-                info = stock.info
-
-                # 獲取三大報表 (年報)
-                financials = stock.financials.T  # 損益表
-                balance_sheet = stock.balance_sheet.T  # 資產負債表
-                cashflow = stock.cashflow.T  # 現金流量表
+                # 基本資料與三大報表 (年報) 並行抓取
+                bundle = fetch_fundamentals([ticker_input])[ticker_input]
+                if "error" in bundle:
+                    raise RuntimeError(bundle["error"])
+                info = bundle["info"]
+                financials = bundle["financials"]        # 損益表
+                balance_sheet = bundle["balance_sheet"]  # 資產負債表
+                cashflow = bundle["cashflow"]            # 現金流量表
+                store = get_fundamentals_store()         # 標準化後的長格式資料 (含預先計算的比率)
             except Exception as e:
                 st.error(f"發生錯誤: {e}")
                 st.stop()
@@ -918,22 +804,12 @@ def page_fundamental_analysis():
                 with tab1:
                     st.subheader("損益表關鍵指標")
                     if not financials.empty:
-                        # 嘗試選取關鍵欄位 (yfinance 欄位名稱可能會變，需做容錯)
-                        cols_to_plot = ['Total Revenue', 'Gross Profit', 'Operating Income', 'Net Income']
-                        available_cols = [c for c in cols_to_plot if c in financials.columns]
-                        
-                        # 中文對照表
-                        col_map = {
-                            'Total Revenue': '總營收', 
-                            'Gross Profit': '毛利', 
-                            'Operating Income': '營業利益', 
-                            'Net Income': '淨利'
-                        }
-
-                        if available_cols:
-                            df_plot = financials[available_cols].sort_index()
+                        # 標準化項目 (已在匯入時處理各公司欄位名稱差異)
+                        df_plot = store.history(ticker_input, ['revenue', 'gross_profit', 'operating_income', 'net_income'])
+
+                        if not df_plot.empty:
                             # 重新命名欄位為中文
-                            df_plot = df_plot.rename(columns=col_map)
+                            df_plot = df_plot.rename(columns=ITEM_LABELS)
                             
                             fig = px.bar(df_plot, barmode='group', color_discrete_sequence=CHART_COLORS)
                             apply_chart_theme(fig, "📈 年度營收與獲利趨勢")
@@ -950,26 +826,11 @@ def page_fundamental_analysis():
                 with tab2:
                     st.subheader("資產負債結構")
                     if not balance_sheet.empty:
-                        cols_to_plot = ['Total Assets', 'Total Liabilities Net Minority Interest', 'Stockholders Equity']
-                        # 修正：有些版本 yfinance 欄位名稱不同
-                        if 'Total Liabilities Net Minority Interest' not in balance_sheet.columns:
-                             if 'Total Liabilities' in balance_sheet.columns:
-                                 cols_to_plot[1] = 'Total Liabilities'
-                        
-                        available_cols = [c for c in cols_to_plot if c in balance_sheet.columns]
-                        
-                        # 中文對照表
-                        col_map = {
-                            'Total Assets': '總資產',
-                            'Total Liabilities Net Minority Interest': '總負債',
-                            'Total Liabilities': '總負債',
-                            'Stockholders Equity': '股東權益'
-                        }
-
-                        if available_cols:
-                            df_plot = balance_sheet[available_cols].sort_index()
+                        df_plot = store.history(ticker_input, ['total_assets', 'total_liabilities', 'equity'])
+
+                        if not df_plot.empty:
                             # 重新命名欄位為中文
-                            df_plot = df_plot.rename(columns=col_map)
+                            df_plot = df_plot.rename(columns=ITEM_LABELS)
 
                             fig = px.bar(df_plot, barmode='group', color_discrete_sequence=CHART_COLORS)
                             apply_chart_theme(fig, "🏦 資產負債結構趨勢")
@@ -986,20 +847,11 @@ def page_fundamental_analysis():
                 with tab3:
                     st.subheader("現金流量分析")
                     if not cashflow.empty:
-                        cols_to_plot = ['Operating Cash Flow', 'Investing Cash Flow', 'Financing Cash Flow']
-                        available_cols = [c for c in cols_to_plot if c in cashflow.columns]
-                        
-                        # 中文對照表
-                        col_map = {
-                            'Operating Cash Flow': '營運現金流',
-                            'Investing Cash Flow': '投資現金流',
-                            'Financing Cash Flow': '籌資現金流'
-                        }
-
-                        if available_cols:
-                            df_plot = cashflow[available_cols].sort_index()
+                        df_plot = store.history(ticker_input, ['operating_cash_flow', 'investing_cash_flow', 'financing_cash_flow'])
+
+                        if not df_plot.empty:
                             # 重新命名欄位為中文
-                            df_plot = df_plot.rename(columns=col_map)
+                            df_plot = df_plot.rename(columns=ITEM_LABELS)
 
                             fig = px.bar(df_plot, barmode='group', color_discrete_sequence=CHART_COLORS)
                             apply_chart_theme(fig, "💵 現金流量趨勢")
@@ -1022,6 +874,10 @@ def page_fundamental_analysis():
                             fin_summary = financials.iloc[:2].to_string() if not financials.empty else "無數據"
                             bs_summary = balance_sheet.iloc[:2].to_string() if not balance_sheet.empty else "無數據"
                             cf_summary = cashflow.iloc[:2].to_string() if not cashflow.empty else "無數據"
+                            ratio_items = ['gross_margin', 'operating_margin', 'net_margin', 'revenue_growth',
+                                           'roe', 'debt_ratio', 'current_ratio', 'fcf_margin']
+                            ratios = store.history(ticker_input, ratio_items).rename(columns=ITEM_LABELS)
+                            ratio_summary = ratios.round(2).to_string() if not ratios.empty else "無數據"
 
                             prompt = f"""
                             請擔任專業的財務分析師，針對 {ticker_input} 的財務報表進行深度分析。
@@ -1035,6 +891,9 @@ def page_fundamental_analysis():
                             【現金流量表摘要 (近兩年)】
                             {cf_summary}
 
+                            【財務比率 (各年度)】
+                            {ratio_summary}
+
                             請提供以下分析報告 (使用繁體中文 Markdown)：
                             1. **獲利能力分析**：營收成長率、毛利率、淨利率的變化趨勢。
                             2. **財務結構與償債能力**：資產負債配置是否健康？有無流動性風險？
@@ -1043,12 +902,11 @@ def page_fundamental_analysis():
                             """
 
                             try:
-                                client = genai.Client(api_key=GOOGLE_API_KEY)
-                                response = client.models.generate_content(
-                                    model='gemini-2.5-flash',
-                                    contents=prompt
-                                )
-                                st.markdown(response.text)
+                                ai_text, stale, entry = generate_with_history("fundamental", ticker_input, prompt)
+                                if stale:
+                                    st.warning(STALE_NOTICE)
+                                show_history_notice(entry)
+                                st.markdown(ai_text)
                             except Exception as e:
                                 st.error(f"AI 分析失敗: {e}")
                     else:
@@ -1062,6 +920,8 @@ def page_fundamental_analysis():
 # ==========================================
 
 def page_dca_backtest():
+    import plotly.graph_objects as go
+
     st.header("⏳ 定期定額 (DCA) 歷史回測")
     st.info("模擬每月固定金額投資，計算歷史報酬與風險，並由 AI 進行策略分析。")
 
@@ -1073,24 +933,29 @@ def page_dca_backtest():
             "輸入股票代號",
             value="2330.TW",
             key="dca_ticker",
-            help="輸入數字代號即可 (例如: 2330),系統會自動補上 .TW"
+            help="輸入代號或名稱即可 (例如: 2330、台積電),系統會自動補上 .TW / .TWO"
         )
         ticker_input = normalize_ticker(ticker_input_raw)
 
-        # 顯示正規化後的代號
-        if ticker_input != ticker_input_raw:
-            st.caption(f"✓ 使用代號: {ticker_input}")
+        # 顯示正規化後的代號與候選股票
+        show_ticker_hint(ticker_input_raw, ticker_input)
 
         monthly_amount = st.number_input("每月扣款金額 (TWD)", min_value=1000, value=10000, step=1000)
         years = st.selectbox("回測年數", [1, 3, 5, 10], index=1)
+        mc_methods = {"區塊拔靴法 (歷史報酬重抽)": "bootstrap", "常態分布 (參數模型)": "parametric"}
+        mc_method = st.selectbox("未來情境模擬方法", list(mc_methods.keys()))
         
         run_dca = st.button("開始回測")
 
     if run_dca:
+        log_request(ticker_input, "dca")
         with st.spinner(f"正在回測 {ticker_input} 過去 {years} 年的表現..."):
             df_result, metrics = calculate_dca_performance(ticker_input, monthly_amount, years)
             
             if df_result is not None:
+                if metrics.get('stale'):
+                    st.warning(STALE_NOTICE)
+
                 # 1. 顯示績效指標
                 st.subheader("📊 回測結果")
                 m1, m2, m3, m4 = st.columns(4)
@@ -1139,8 +1004,76 @@ def page_dca_backtest():
                 apply_chart_theme(fig, f"📊 {ticker_input} 定期定額 {years} 年績效走勢")
                 st.plotly_chart(fig, width='stretch')
 
+                # 3. 滾動起始月份分析 (所有可能的起始月份)
+                st.subheader("🎲 不同起始月份的結果分布")
+                with st.spinner("正在計算所有起始月份的報酬分布..."):
+                    df_dist, dist_summary = calculate_rolling_dca(ticker_input, monthly_amount, years)
+
+                rolling_text = "無法計算 (歷史資料不足)"
+                if df_dist is not None:
+                    rolling_text = format_rolling_summary(dist_summary)
+                    st.caption(f"以 {dist_summary['first_start']} ~ {dist_summary['last_start']} 之間每個月份作為起點，各投資 {years} 年")
+                    d1, d2, d3, d4 = st.columns(4)
+                    d1.metric("報酬中位數", f"{dist_summary['return_p50']:.2f}%")
+                    d2.metric("最差 5% 報酬", f"{dist_summary['return_p5']:.2f}%")
+                    d3.metric("虧損機率", f"{dist_summary['loss_probability']:.1f}%")
+                    d4.metric("MDD 中位數", f"{dist_summary['mdd_p50']:.2f}%")
+
+                    h1, h2 = st.columns(2)
+                    fig_ret = go.Figure(go.Histogram(x=df_dist['Return_Pct'], nbinsx=40, marker_color='#60A5FA'))
+                    fig_ret.add_vline(x=ret_pct, line_dash="dash", line_color="#F59E0B")
+                    fig_ret.update_layout(xaxis_title="總報酬率 (%)", yaxis_title="起始月份數", height=350)
+                    apply_chart_theme(fig_ret, "報酬率分布 (虛線為本次回測)")
+                    h1.plotly_chart(fig_ret, width='stretch')
+
+                    fig_mdd = go.Figure(go.Histogram(x=df_dist['Max_Drawdown'], nbinsx=40, marker_color='#EF4444'))
+                    fig_mdd.update_layout(xaxis_title="最大回撤 (%)", yaxis_title="起始月份數", height=350)
+                    apply_chart_theme(fig_mdd, "最大回撤分布")
+                    h2.plotly_chart(fig_mdd, width='stretch')
+                else:
+                    st.info(f"無法計算起始月份分布: {dist_summary.get('error')}")
+
+                # 4. 蒙地卡羅模擬未來路徑 (扇形圖)
+                st.subheader("🔮 未來情境模擬")
+                with st.spinner("正在模擬 10,000 條未來路徑..."):
+                    df_fan, sim_summary = simulate_dca_outcomes(
+                        ticker_input, monthly_amount, years, method=mc_methods[mc_method]
+                    )
+
+                simulation_text = "無法模擬"
+                if df_fan is not None:
+                    simulation_text = format_simulation_summary(sim_summary)
+                    s1, s2, s3, s4 = st.columns(4)
+                    s1.metric("期末資產中位數", f"${sim_summary['value_p50']:,.0f}", f"{sim_summary['return_p50']:.2f}%")
+                    s2.metric("悲觀情境 (5%)", f"${sim_summary['value_p5']:,.0f}", f"{sim_summary['return_p5']:.2f}%")
+                    s3.metric("樂觀情境 (95%)", f"${sim_summary['value_p95']:,.0f}", f"{sim_summary['return_p95']:.2f}%")
+                    s4.metric("虧損機率", f"{sim_summary['loss_probability']:.1f}%")
+
+                    fig_fan = go.Figure()
+                    for low, high, color in (("P5", "P95", 'rgba(96, 165, 250, 0.15)'),
+                                             ("P25", "P75", 'rgba(96, 165, 250, 0.35)')):
+                        fig_fan.add_trace(go.Scatter(x=df_fan.index, y=df_fan[high], mode='lines',
+                                                     line=dict(width=0), showlegend=False, hoverinfo='skip'))
+                        fig_fan.add_trace(go.Scatter(x=df_fan.index, y=df_fan[low], mode='lines', line=dict(width=0),
+                                                     fill='tonexty', fillcolor=color, name=f"{low[1:]}% ~ {high[1:]}%"))
+                    fig_fan.add_trace(go.Scatter(x=df_fan.index, y=df_fan['P50'], mode='lines', name='中位數',
+                                                 line=dict(color='#10B981', width=2.5)))
+                    fig_fan.add_trace(go.Scatter(x=df_fan.index, y=df_fan['Total_Cost'], mode='lines', name='累積投入成本',
+                                                 line=dict(color='#F59E0B', width=2, dash='dash')))
+                    fig_fan.update_layout(
+                        xaxis_title="投資月數",
+                        yaxis_title="金額 (TWD)",
+                        hovermode="x unified",
+                        legend=dict(orientation="h", y=1.02, yanchor="bottom", x=1, xanchor="right"),
+                        height=450
+                    )
+                    apply_chart_theme(fig_fan, f"🔮 {ticker_input} 未來 {years} 年定期定額情境 ({sim_summary['n_paths']:,} 條路徑)")
+                    st.plotly_chart(fig_fan, width='stretch')
+                    st.caption(f"模擬耗時 {sim_summary['elapsed']:.2f} 秒；過去報酬不代表未來績效，僅供參考")
+                else:
+                    st.info(f"無法進行模擬: {sim_summary.get('error')}")
 
-                # 3. AI 策略分析
+                # 5. AI 策略分析
                 st.subheader("🤖 Gemini 策略分析報告")
                 if GOOGLE_API_KEY:
                     with st.spinner("AI 正在分析此策略的風險與報酬..."):
@@ -1153,21 +1086,26 @@ def page_dca_backtest():
                         *   **總報酬率**：{ret_pct:.2f}%
                         *   **最大回撤 (MDD)**：{mdd:.2f}% (這段期間資產從高點下跌的最大幅度)
                         *   **年化波動率**：{metrics['volatility']:.2f}%
+                        *   **不同起始月份的結果分布**：{rolling_text}
+                        *   **未來情境模擬**：{simulation_text}
 
                         請提供一份專業的分析報告 (使用繁體中文 Markdown)：
                         1.  **績效評價**：這樣的報酬率在該期間是否優於大盤或定存？
                         2.  **風險分析**：MDD {mdd:.2f}% 代表投資人需承受多大的心理壓力？波動率是否過高？
                         3.  **微笑曲線效應**：根據走勢 (AI 無法看圖，請根據一般 DCA 特性說明)，這段期間是否有發揮定期定額「低檔多買」的優勢？
-                        4.  **投資建議**：適合哪種類型的投資人？(保守/穩健/積極)
+                        4.  **起點敏感度**：對照不同起始月份的報酬分布，本次結果屬於幸運還是不幸的起點？並根據未來情境模擬說明可能的結果範圍。
+                        5.  **投資建議**：適合哪種類型的投資人？(保守/穩健/積極)
                         """
 
                         try:
-                            client = genai.Client(api_key=GOOGLE_API_KEY)
-                            response = client.models.generate_content(
-                                model='gemini-2.5-flash',
-                                contents=prompt
+                            ai_text, stale, entry = generate_with_history(
+                                "dca", ticker_input, prompt,
+                                label=f"{ticker_input} 每月 {monthly_amount:,} 元 / {years} 年"
                             )
-                            st.markdown(response.text)
+                            if stale:
+                                st.warning(STALE_NOTICE)
+                            show_history_notice(entry)
+                            st.markdown(ai_text)
                         except Exception as e:
                             st.error(f"AI 分析失敗: {e}")
                 else:
@@ -1175,11 +1113,81 @@ def page_dca_backtest():
             else:
                 st.error(f"回測失敗: {metrics.get('error')}")
 
+# ==========================================
+# 頁面 6: 分析紀錄
+# ==========================================
+
+def page_analysis_history():
+    st.header("📚 AI 分析紀錄")
+    st.info("各頁面產生的 AI 報告都會保存在本機，可依股票與頁面查詢，並比較不同日期的內容差異。")
+
+    records = get_analysis_history()
+    col1, col2, col3 = st.columns(3)
+    page = col1.selectbox("頁面", [None] + list(PAGE_LABELS),
+                          format_func=lambda p: "全部" if p is None else PAGE_LABELS[p], key="history_page")
+    ticker = col2.selectbox("股票", [None] + records.tickers(),
+                            format_func=lambda t: "全部" if t is None else t, key="history_ticker")
+    days = col3.selectbox("期間", [7, 30, 90, 365, None],
+                          format_func=lambda d: "全部" if d is None else f"近 {d} 天", index=1, key="history_days")
+    start_date = (now_tw().date() - pd.Timedelta(days=days)).isoformat() if days else None
+
+    entries = records.search(page=page, ticker=ticker, start_date=start_date)
+    if not entries:
+        st.info("目前沒有符合條件的紀錄")
+        return
+
+    def describe(entry):
+        return f"{format_entry_time(entry)}｜{PAGE_LABELS.get(entry['page'], entry['page'])}｜{entry['label']}"
+
+    st.dataframe(pd.DataFrame([{
+        "時間": format_entry_time(e),
+        "頁面": PAGE_LABELS.get(e['page'], e['page']),
+        "股票": e['ticker'],
+        "說明": e['label'],
+    } for e in entries]), hide_index=True, width='stretch')
+
+    labels = {e['id']: describe(e) for e in entries}
+    selected = records.get(st.selectbox("查看報告", list(labels), format_func=labels.get, key="history_entry"))
+    if selected is None:
+        return
+
+    tab_view, tab_diff = st.tabs(["📄 報告內容", "🔀 與其他日期比較"])
+    with tab_view:
+        st.caption(describe(selected))
+        st.markdown(selected['report'])
+
+    with tab_diff:
+        # 同一頁面、同一股票的其他紀錄
+        peers = [e for e in records.search(page=selected['page'], ticker=selected['ticker'])
+                 if e['id'] != selected['id']]
+        if not peers:
+            st.info("此股票在同一頁面沒有其他紀錄可比較")
+        else:
+            peer_labels = {e['id']: describe(e) for e in peers}
+            other = records.get(st.selectbox("比較對象", list(peer_labels), format_func=peer_labels.get,
+                                             key="history_compare"))
+            old, new = sorted([other, selected], key=lambda e: e['created_at'])
+            diff_text, similarity = diff_reports(old, new)
+            st.metric("內容相似度", f"{similarity * 100:.0f}%")
+            if diff_text:
+                st.code(diff_text, language="diff")
+            else:
+                st.info("兩份報告內容相同")
+
 # ==========================================
 # 主程式路由
 # ==========================================
 
 def main():
+    # ===== 瀏覽器 localStorage 同步 (每個 session 一個元件，固定放在側邊欄最上方) =====
+    storage = get_browser_storage()
+    storage_slot = st.sidebar.empty()
+    if not storage.ready and storage.sync(storage_slot):
+        # 首次執行：先一次讀取所有保存的資料，讀取完成後頁面直接以保存的狀態渲染
+        # (元件無法使用時 sync 回傳 False，直接以預設值渲染)
+        st.caption("載入中...")
+        return
+
     # ===== 側邊欄 Logo 區塊 =====
     st.sidebar.markdown("""
     <div style="text-align: center; padding: 1.5rem 0 1rem 0;">
@@ -1203,7 +1211,8 @@ def main():
         "📊 基本面 AI 分析": "基本面 AI 分析",
         "🧘 投資組合健檢": "投資組合健檢",
         "⏳ 定期定額回測": "定期定額回測",
-        "🤖 自動化日報助理": "自動化日報助理"
+        "🤖 自動化日報助理": "自動化日報助理",
+        "📚 分析紀錄": "分析紀錄"
     }
     
     st.sidebar.markdown("<p style='color: #94A3B8; font-size: 0.75rem; text-transform: uppercase; letter-spacing: 1px; margin-bottom: 0.5rem;'>功能選單</p>", unsafe_allow_html=True)
@@ -1231,6 +1240,12 @@ def main():
         page_dca_backtest()
     elif selected_page == "自動化日報助理":
         page_daily_report()
+    elif selected_page == "分析紀錄":
+        page_analysis_history()
+
+    render_memory_report()
+    # 送出本次執行中有變動的資料
+    storage.sync(storage_slot)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,134 @@
+"""
+多週期 K 線彙總 (週線 / 月線 / 季線)
+
+由同一份日 K 線彙總出週、月、季的 OHLCV，存放在共用快取中並增量維護：
+日線新增資料時只重算最後一個 (可能尚未結束的) 週期，其餘週期直接沿用；
+滾動期間 ("1y"、"5y" 等) 的起點每天往後移時，只重算起點所在的週期並捨棄更早的週期。
+還原權值 (除權息) 使歷史價格改變時，會偵測到並整份重算。
+
+每一列以週期起始日為索引 (週一 / 月初 / 季初)，欄位：
+    Open / High / Low / Close / Volume: 週期內的 OHLCV
+    First_Close: 週期內第一個交易日的收盤價 (定期定額的買入價)
+    Bars: 週期內的交易日數
+"""
+import pandas as pd
+from shared_cache import get_shared_cache
+
+TIMEFRAME_LABELS = {"D": "日線", "W": "週線", "M": "月線", "Q": "季線"}
+
+# pandas resample 規則 (以週期起始日為標籤)
+RESAMPLE_RULES = {"W": "W-MON", "M": "MS", "Q": "QS"}
+
+# 彙總結果快取秒數 (日線更新時會增量維護，不需要太短)
+ROLLUP_CACHE_TTL = 7 * 24 * 3600
+
+# 長期 K 線圖最多顯示的根數
+CHART_MAX_BARS = 300
+
+
+def rollup_bars(daily, timeframe):
+    """
+    將日 K 線彙總為指定週期 (向量化計算)
+
+    Args:
+        daily: 含 Open / High / Low / Close / Volume 欄位、以日期為索引的 DataFrame
+        timeframe: "W" / "M" / "Q"
+
+    Returns:
+        pd.DataFrame: 各週期的 OHLCV、First_Close 與 Bars
+    """
+    resampler = daily.resample(RESAMPLE_RULES[timeframe], label="left", closed="left")
+    bars = resampler.agg({
+        "Open": "first",
+        "High": "max",
+        "Low": "min",
+        "Close": "last",
+        "Volume": "sum",
+    })
+    bars["First_Close"] = resampler["Close"].first()
+    bars["Bars"] = resampler["Close"].count()
+    # 連假等整個週期都沒有交易的區間不保留
+    return bars[bars["Bars"] > 0]
+
+
+def update_rollup(rollup, daily, timeframe):
+    """
+    以新的日 K 線增量更新既有的彙總結果：只重算日線起點所在的週期與最後一個週期起的資料，
+    中間完整的週期直接沿用
+
+    Args:
+        rollup: 先前的彙總結果 (起點不晚於 daily 的起點)
+        daily: 目前的日 K 線 (需涵蓋 rollup 最後一個週期的起始日之後)
+        timeframe: "W" / "M" / "Q"
+    """
+    if rollup.empty:
+        return rollup_bars(daily, timeframe)
+    last_start = rollup.index[-1]
+    # 起始日晚於日線起點的週期完整落在日線範圍內，可直接沿用
+    middle = rollup[(rollup.index > daily.index[0]) & (rollup.index < last_start)]
+    head_end = middle.index[0] if len(middle) else last_start
+    parts = [
+        rollup_bars(daily[daily.index < head_end], timeframe),
+        middle,
+        rollup_bars(daily[daily.index >= last_start], timeframe),
+    ]
+    return pd.concat([part for part in parts if not part.empty])
+
+
+def _can_extend(cached, daily):
+    """快取的彙總結果是否能以目前的日線增量更新 (快取起點不晚於日線起點，且歷史價格未被還原權值調整)"""
+    through = cached["through"]
+    return (
+        cached["start"] <= daily.index[0]
+        and through in daily.index
+        and abs(float(daily.at[through, "Close"]) - cached["through_close"]) <= 1e-6 * max(abs(cached["through_close"]), 1.0)
+    )
+
+
+def get_rollup(ticker, timeframe, daily, period):
+    """
+    取得日 K 線的週期彙總 (依 ticker / period / timeframe 快取並增量維護)
+
+    Args:
+        ticker: 股票代號
+        timeframe: "W" / "M" / "Q"
+        daily: 目前的日 K 線
+        period: 日 K 線的資料長度 (作為快取鍵的一部分)
+
+    Returns:
+        pd.DataFrame: 彙總結果，見 rollup_bars
+    """
+    if daily.empty:
+        return rollup_bars(daily, timeframe)
+
+    cache = get_shared_cache()
+    key = (ticker, period, timeframe)
+    cached = cache.get("rollup", key)
+    last_date = daily.index[-1]
+    if cached is not None and _can_extend(cached, daily):
+        if cached["start"] == daily.index[0] and cached["through"] == last_date:
+            return cached["bars"]
+        bars = update_rollup(cached["bars"], daily, timeframe)
+    else:
+        bars = rollup_bars(daily, timeframe)
+
+    cache.set("rollup", key, {
+        "bars": bars,
+        "start": daily.index[0],
+        "through": last_date,
+        "through_close": float(daily["Close"].iloc[-1]),
+    }, ttl=ROLLUP_CACHE_TTL)
+    return bars
+
+
+def load_rollup(ticker, timeframe, period="max"):
+    """
+    取得股票的週 / 月 / 季 K 線 (日線來自共用快取)
+
+    Returns:
+        (bars, stale): 彙總結果與日線是否為限流時的過期資料
+    """
+    from dca_tool import get_price_history
+
+    daily, stale = get_price_history(ticker, period)
+    return get_rollup(ticker, timeframe, daily, period), stale
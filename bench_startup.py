@@ -0,0 +1,93 @@
+"""
+啟動時間基準測試
+
+量測冷啟動 (全新 Python 程序) 時各入口模組的 import 時間，
+以及 Streamlit 腳本首次執行與後續 rerun 的耗時。
+
+用法:
+    python bench_startup.py            # 預設各重複 5 次
+    python bench_startup.py --runs 10
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# 冷啟動 import 量測目標 (每次都在全新程序中執行)
+IMPORT_TARGETS = [
+    ("api (uvicorn 入口)", "import api"),
+    ("daily_report", "import daily_report"),
+    ("dca_tool", "import dca_tool"),
+    ("streamlit", "import streamlit"),
+    ("yfinance", "import yfinance"),
+    ("google.genai", "from google import genai"),
+    ("plotly", "import plotly.graph_objects, plotly.express"),
+    ("pdfplumber", "import pdfplumber"),
+]
+
+# 在子程序中執行 Streamlit 腳本並回報首次執行與 rerun 時間
+APP_SCRIPT = """
+import time
+from streamlit.testing.v1 import AppTest
+at = AppTest.from_file("app.py", default_timeout=60)
+t0 = time.perf_counter(); at.run(); first = time.perf_counter() - t0
+reruns = []
+for _ in range({reruns}):
+    t0 = time.perf_counter(); at.run(); reruns.append(time.perf_counter() - t0)
+print(first, *reruns)
+"""
+
+
+def time_import(statement):
+    """在全新程序中量測 import 耗時 (秒)"""
+    code = f"import time; t0 = time.perf_counter(); {statement}; print(time.perf_counter() - t0)"
+    result = subprocess.run(
+        [sys.executable, "-c", code], cwd=PROJECT_DIR, capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+    return float(result.stdout.strip().splitlines()[-1])
+
+
+def time_app(reruns):
+    """量測 app.py 首次執行與 rerun 的耗時 (秒)"""
+    result = subprocess.run(
+        [sys.executable, "-c", APP_SCRIPT.format(reruns=reruns)],
+        cwd=PROJECT_DIR, capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+    values = [float(x) for x in result.stdout.strip().splitlines()[-1].split()]
+    return values[0], values[1:]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="量測冷啟動與 rerun 時間")
+    parser.add_argument("--runs", type=int, default=5, help="每個項目的重複次數")
+    args = parser.parse_args()
+
+    print(f"=== 冷啟動 import 時間 (中位數，{args.runs} 次) ===")
+    for label, statement in IMPORT_TARGETS:
+        try:
+            samples = [time_import(statement) for _ in range(args.runs)]
+            print(f"{label:<22} {statistics.median(samples) * 1000:8.1f} ms")
+        except RuntimeError as e:
+            print(f"{label:<22}     失敗: {e}")
+
+    print("\n=== Streamlit 腳本執行時間 ===")
+    try:
+        start = time.perf_counter()
+        first, reruns = time_app(args.runs)
+        print(f"{'首次執行':<22} {first * 1000:8.1f} ms")
+        print(f"{'rerun (中位數)':<22} {statistics.median(reruns) * 1000:8.1f} ms")
+        print(f"{'總耗時 (含程序啟動)':<22} {(time.perf_counter() - start) * 1000:8.1f} ms")
+    except RuntimeError as e:
+        print(f"app.py 執行失敗: {e}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+"""
+瀏覽器 localStorage 同步
+
+每個 session 只掛載一個 streamlit_js_eval 元件 (固定的 key，每次執行都渲染在同一位置)：
+- 首次執行時以一段 JavaScript 一次讀取所有保存的鍵 (投資組合、上次查詢的股票代號)，
+  之後從 session 內的副本讀取，不再與瀏覽器來回
+- 寫入時只記錄內容有變動的鍵；同一次執行內的多次寫入合併，於執行結束時以一段 JavaScript 送出，
+  且不要求回傳值，不會觸發額外的重新執行
+- 元件的參數改變時會在同一個 iframe 內重新執行，不需要重新掛載
+元件無法使用時 (未安裝 streamlit_js_eval 等)，資料只保存在目前的 session 中。
+"""
+import json
+import streamlit as st
+
+COMPONENT_KEY = "browser_storage"
+STATE_KEY = "_browser_storage"
+
+# 保存在 localStorage 的鍵 (沿用既有的鍵名，舊版保存的資料可直接讀取)
+PERSISTED_KEYS = ("last_stock_ticker", "stock_portfolio")
+
+
+def build_load_js(keys=PERSISTED_KEYS):
+    """一次讀取所有鍵的 JavaScript (回傳 {key: JSON 字串})"""
+    return (
+        "(() => { const items = {}; try { "
+        f"for (const k of {json.dumps(list(keys))}) {{ const v = localStorage.getItem(k); if (v !== null) items[k] = v; }} "
+        "} catch (e) {} return JSON.stringify(items); })()"
+    )
+
+
+def build_write_js(changes, seq):
+    """寫入變動鍵的 JavaScript (seq 使每次送出的程式碼都不同，確保元件重新執行)"""
+    statements = " ".join(
+        f"localStorage.setItem({json.dumps(key)}, {json.dumps(raw, ensure_ascii=False)});"
+        for key, raw in sorted(changes.items())
+    )
+    return f"/* {seq} */ try {{ {statements} }} catch (e) {{}}"
+
+
+class BrowserStorage:
+    """單一 session 的 localStorage 副本"""
+
+    def __init__(self):
+        self.values = {}       # key -> 資料
+        self.persisted = {}    # key -> 瀏覽器中目前的 JSON 字串
+        self.dirty = {}        # key -> 尚未送出的 JSON 字串
+        self.loaded = False    # 已取得瀏覽器中的資料
+        self.attempted = False # 已送出讀取請求
+        self.available = True  # 元件可使用 (匯入或渲染失敗後不再嘗試)
+        self.seq = 0
+        self._js = build_load_js()
+        self._want_output = True
+
+    @property
+    def ready(self):
+        """頁面可開始渲染 (已載入，或讀取請求已送出一輪仍無回應時退回預設值)"""
+        return self.loaded or self.attempted
+
+    def _load(self):
+        """從元件的回傳值取得瀏覽器中的資料 (只處理一次)"""
+        if self.loaded:
+            return
+        raw = st.session_state.get(COMPONENT_KEY)
+        if not raw:
+            return
+        try:
+            items = json.loads(raw)
+        except (TypeError, ValueError):
+            items = {}
+        for key, value in items.items():
+            self.persisted[key] = value
+            if key in self.dirty:
+                continue  # 載入前已在本 session 寫入，以新的值為準
+            try:
+                self.values[key] = json.loads(value)
+            except ValueError:
+                pass
+        self.loaded = True
+
+    def get(self, key, default=None):
+        self._load()
+        return self.values.get(key, default)
+
+    def set(self, key, value):
+        """
+        寫入資料 (內容與瀏覽器中相同時不會送出)
+
+        Args:
+            key: 鍵名 (見 PERSISTED_KEYS)
+            value: 可轉為 JSON 的資料
+        """
+        self._load()
+        self.values[key] = value
+        raw = json.dumps(value, ensure_ascii=False)
+        if self.persisted.get(key) == raw:
+            self.dirty.pop(key, None)
+        else:
+            self.dirty[key] = raw
+
+    def sync(self, container):
+        """
+        渲染同步元件 (每次執行呼叫一次，且位置固定)：尚未載入時讀取，有變動時送出寫入
+
+        Args:
+            container: 放置元件的容器 (例如 st.sidebar.empty())
+
+        Returns:
+            bool: 元件是否已渲染；無法使用時回傳 False，並視為已載入 (以預設值渲染頁面)
+        """
+        if not self.available:
+            return False
+        self._load()
+        if not self.loaded:
+            self.attempted = True
+        elif self.dirty:
+            self.seq += 1
+            self._js, self._want_output = build_write_js(self.dirty, self.seq), False
+            self.persisted.update(self.dirty)
+            self.dirty = {}
+        try:
+            from streamlit_js_eval import streamlit_js_eval
+            with container:
+                streamlit_js_eval(js_expressions=self._js, want_output=self._want_output, key=COMPONENT_KEY)
+        except Exception as e:
+            # localStorage 是增強功能，元件無法使用時資料只保存在 session 中
+            # (不會有回傳值觸發重新執行，不可等待載入)
+            print(f"瀏覽器儲存元件無法使用，改為只保存在 session 中: {e}")
+            self.available = False
+            self.loaded = True
+            return False
+        return True
+
+
+def get_browser_storage():
+    """取得目前 session 的 BrowserStorage"""
+    if STATE_KEY not in st.session_state:
+        st.session_state[STATE_KEY] = BrowserStorage()
+    return st.session_state[STATE_KEY]
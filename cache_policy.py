@@ -0,0 +1,45 @@
+"""
+快取有效期限政策 (依台股交易時段)
+
+各種市場資料的快取秒數集中在此計算，所有快取都透過 cache_ttl 取得有效期限：
+- 試撮、盤中到盤後定價交易結束前，行情仍在變動，使用各資料類型的基本秒數
+- 當日行情確定後、週末、國定假日與颱風停止交易時，行情在下一次試撮前不會變動，
+  快取保留到下一次試撮開始 (不短於基本秒數)
+休市日來自交易日曆檔，見 trading_calendar。
+"""
+import datetime
+import os
+from trading_calendar import TW_TZ, now_tw, is_data_settled, next_market_open
+
+# 行情變動期間各資料類型的快取秒數
+ACTIVE_TTL = {
+    "quote": float(os.getenv("QUOTE_SOFT_TTL", 15)),  # 即時報價
+    "bars": 300,                                      # 近期日 K 線 (最後一根仍在變動)
+    "history": 3600,                                  # 多年期日 K 線 (回測用，最後一根的影響小)
+    "info": 3600,                                     # 公司基本資料 (市值、本益比隨股價變動)
+    "fundamentals": 12 * 3600,                        # 財務報表
+    "report": float(os.getenv("INTRADAY_REPORT_TTL", 600)),  # 每日 AI 報告 (盤中版本)
+}
+
+
+def cache_ttl(data_type, now=None):
+    """
+    計算資料的快取秒數
+
+    Args:
+        data_type: 資料類型 (見 ACTIVE_TTL)
+        now: 資料抓取的時間 (台北時間，預設為現在)
+
+    Returns:
+        float: 快取秒數
+    """
+    now = now or now_tw()
+    active_ttl = ACTIVE_TTL[data_type]
+    if not is_data_settled(now):
+        return active_ttl
+    return max(active_ttl, (next_market_open(now) - now).total_seconds())
+
+
+def ttl_since(data_type, fetched_at):
+    """以抓取時間戳記計算快取秒數 (供 StaleWhileRevalidateCache 使用)"""
+    return cache_ttl(data_type, datetime.datetime.fromtimestamp(fetched_at, TW_TZ))
@@ -0,0 +1,150 @@
+"""
+快取預熱工具
+
+依 request_log 的近期查詢熱門度排序股票，預先抓取前 N 名的日 K 線、基本面，
+並可選擇預先產生每日 AI 報告，讓每天第一批查詢就命中共用快取。
+盤後定價交易結束後抓到的 K 線在下一次開盤前不會變動，快取會保留到下一次試撮開始 (見 cache_policy)。
+
+用法:
+    python cache_warmer.py                      # 前 30 名的 K 線與基本面
+    python cache_warmer.py --top 50 --ai        # 同時產生前 10 名的 AI 報告
+    python cache_warmer.py --dry-run            # 只列出熱門排行
+
+建議排程 (crontab，台北時間)：
+    40 14 * * 1-5  python cache_warmer.py --ai     # 盤後定價交易結束後
+此時寫入的 K 線、基本面與報告都保留到下一次試撮開始，不需要另外在開盤前執行
+(試撮前抓到的資料也只保留到試撮開始，開盤後的第一批查詢仍會重新抓取)。
+"""
+# 設定 (settings 會載入 .env，需早於其他本地模組)
+from settings import GOOGLE_API_KEY
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+from rate_limit import guarded_call
+from shared_cache import get_shared_cache
+from symbols import normalize_ticker, is_plausible_ticker
+from request_log import rank_tickers
+from daily_report import WATCHLIST, split_known_missing
+from cache_policy import cache_ttl
+
+# 預熱的 K 線期間 (個股頁面 6 個月、API 技術指標 3 個月)
+DEFAULT_PERIODS = ("3mo", "6mo")
+# 同時抓取的股票數 (實際速率仍受 rate_limit 限制)
+WARM_WORKERS = 4
+
+
+def warm_bars(ticker, period, ttl):
+    """
+    重新抓取日 K 線並寫入共用快取 (與 get_price_history 等使用相同的快取鍵)
+
+    Returns:
+        bool: 是否成功寫入
+    """
+    import yfinance as yf
+    hist, stale = guarded_call("yfinance", ("history", ticker, period), yf.Ticker(ticker).history, period=period)
+    if stale or hist.empty:
+        return False
+    get_shared_cache().set("bars", (ticker, period), (hist, stale), ttl=ttl)
+    return True
+
+
+def select_tickers(top_n, days, include=()):
+    """
+    熱門股票 + 額外指定的股票 (去除重複、無效代號與近期確認查無資料的代號)
+
+    Returns:
+        (tickers, ranking): 預熱的股票列表與熱門排行 [(ticker, score, count)]
+    """
+    ranking = rank_tickers(days=days, top_n=top_n)
+    candidates = list(dict.fromkeys([t for t, _, _ in ranking] + [normalize_ticker(t) for t in include]))
+    tickers, _ = split_known_missing([t for t in candidates if is_plausible_ticker(t)])
+    return tickers, ranking
+
+
+def warm(tickers, periods=DEFAULT_PERIODS, fundamentals=True, ai_top=0):
+    """
+    預熱快取
+
+    Args:
+        tickers: 依熱門度排序的股票列表
+        periods: 預熱的 K 線期間
+        fundamentals: 是否預熱基本面 (三大報表)
+        ai_top: 為前幾名股票預先產生每日 AI 報告 (0 表示不產生)
+
+    Returns:
+        dict: 各項目的成功 / 失敗數與耗時
+    """
+    started = time.perf_counter()
+    stats = {"bars_ok": 0, "bars_failed": 0, "fundamentals_ok": 0, "fundamentals_failed": 0,
+             "reports_ok": 0, "reports_failed": 0}
+    ttl = cache_ttl("bars")
+
+    def bars_job(args):
+        try:
+            return warm_bars(*args, ttl)
+        except Exception as e:
+            print(f"  {args[0]} {args[1]} K 線預熱失敗: {e}")
+            return False
+
+    jobs = [(t, p) for t in tickers for p in periods]
+    with ThreadPoolExecutor(max_workers=WARM_WORKERS) as pool:
+        for ok in pool.map(bars_job, jobs):
+            stats["bars_ok" if ok else "bars_failed"] += 1
+
+    if fundamentals and tickers:
+        from fundamentals import fetch_fundamentals
+        for ticker, bundle in fetch_fundamentals(tickers).items():
+            stats["fundamentals_failed" if "error" in bundle else "fundamentals_ok"] += 1
+
+    if ai_top:
+        from report_store import get_or_create_report, is_complete
+        for ticker in tickers[:ai_top]:
+            try:
+                artifact = get_or_create_report([ticker])
+                stats["reports_ok" if is_complete(artifact) else "reports_failed"] += 1
+            except Exception as e:
+                print(f"  {ticker} AI 報告預熱失敗: {e}")
+                stats["reports_failed"] += 1
+
+    stats["elapsed"] = round(time.perf_counter() - started, 1)
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="依查詢熱門度預熱共用快取")
+    parser.add_argument("--top", type=int, default=30, help="預熱前幾名熱門股票")
+    parser.add_argument("--days", type=int, default=7, help="熱門度統計天數")
+    parser.add_argument("--periods", default=",".join(DEFAULT_PERIODS), help="預熱的 K 線期間 (逗號分隔)")
+    parser.add_argument("--include", default=",".join(WATCHLIST), help="一律預熱的股票 (逗號分隔)")
+    parser.add_argument("--no-fundamentals", action="store_true", help="不預熱基本面")
+    parser.add_argument("--ai", action="store_true", help="預先產生熱門股票的每日 AI 報告")
+    parser.add_argument("--ai-top", type=int, default=10, help="--ai 時產生報告的股票數")
+    parser.add_argument("--dry-run", action="store_true", help="只列出熱門排行，不抓取資料")
+    args = parser.parse_args()
+
+    include = [t for t in args.include.split(",") if t.strip()]
+    tickers, ranking = select_tickers(args.top, args.days, include)
+
+    print(f"=== 近 {args.days} 天熱門股票 (前 {args.top} 名) ===")
+    for i, (ticker, score, count) in enumerate(ranking, 1):
+        print(f"{i:>3}. {ticker:<10} 熱度 {score:>8.2f}  ({count} 次查詢)")
+    print(f"預熱 {len(tickers)} 檔股票 (含額外指定)，K 線快取保留 {cache_ttl('bars') / 3600:.1f} 小時")
+    if args.dry_run:
+        return
+
+    if args.ai and not GOOGLE_API_KEY:
+        print("⚠️ 未設定 GOOGLE_API_KEY，略過 AI 報告預熱")
+        args.ai = False
+
+    periods = [p.strip() for p in args.periods.split(",") if p.strip()]
+    stats = warm(tickers, periods, fundamentals=not args.no_fundamentals, ai_top=args.ai_top if args.ai else 0)
+    print(f"K 線：成功 {stats['bars_ok']} / 失敗 {stats['bars_failed']}")
+    if not args.no_fundamentals:
+        print(f"基本面：成功 {stats['fundamentals_ok']} / 失敗 {stats['fundamentals_failed']}")
+    if args.ai:
+        print(f"AI 報告：成功 {stats['reports_ok']} / 失敗 {stats['reports_failed']}")
+    print(f"耗時 {stats['elapsed']} 秒")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,46 +1,261 @@
+# 設定 (settings 會載入 .env，需早於其他本地模組)
+from settings import GOOGLE_API_KEY, MAIL_USERNAME, MAIL_PASSWORD, MAIL_TO
 import os
 import smtplib
+import threading
+from collections import namedtuple
+from contextlib import contextmanager
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
-import yfinance as yf
-from google import genai
-from dotenv import load_dotenv
 import datetime
-
-# 載入環境變數
-load_dotenv(override=True)
-
-# 設定
-GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
-MAIL_USERNAME = os.getenv("MAIL_USERNAME")  # 您的 Gmail
-MAIL_PASSWORD = os.getenv("MAIL_PASSWORD")  # 您的 Gmail 應用程式密碼
-MAIL_TO = os.getenv("MAIL_TO")              # 收件人 Email
+from rate_limit import guarded_call, STALE_NOTICE
+from llm import generate_text
+from shared_cache import get_shared_cache
+from cache_policy import cache_ttl
 
 # 監控清單
 WATCHLIST = ["2330.TW", "2454.TW", "0050.TW"]
 
+# 查無資料 (代號錯誤或已下市) 的負向快取秒數，期間內重複查詢不再送往上游
+NO_DATA_TTL = float(os.getenv("NO_DATA_TTL", 6 * 3600))
+
+# 行情查詢結果的狀態
+QUOTE_SUCCESS = "success"
+QUOTE_NO_DATA = "no_data"   # 上游回應成功但沒有足夠的 K 棒 (代號錯誤、已下市)
+QUOTE_ERROR = "error"       # 上游錯誤 (網路、限流等)，不寫入負向快取
+
+
+class QuoteResult(namedtuple("QuoteResult", ["ticker", "status", "close", "change", "change_pct", "stale", "error"])):
+    """單一股票的行情查詢結果"""
+    __slots__ = ()
+
+    @property
+    def ok(self):
+        return self.status == QUOTE_SUCCESS
+
+    @property
+    def line(self):
+        """摘要文字，例如 '- 2330.TW: 1000.00 (+5.00 / +0.50%)'"""
+        if self.status == QUOTE_SUCCESS:
+            stale_mark = " (延遲資料)" if self.stale else ""
+            return f"- {self.ticker}: {self.close:.2f} ({self.change:+.2f} / {self.change_pct:+.2f}%){stale_mark}"
+        if self.status == QUOTE_NO_DATA:
+            return f"- {self.ticker}: {self.error or '查無資料 (代號錯誤或已下市)'}"
+        return f"- {self.ticker}: 獲取失敗 ({self.error})"
+
+
+def quote_from_closes(ticker, closes, stale):
+    """由收盤價序列建立查詢結果 (不足兩根 K 棒視為查無資料)"""
+    if len(closes) < 2:
+        return QuoteResult(ticker, QUOTE_NO_DATA, None, None, None, stale, None)
+    close = float(closes.iloc[-1])
+    prev = float(closes.iloc[-2])
+    change = close - prev
+    pct = (change / prev) * 100
+    return QuoteResult(ticker, QUOTE_SUCCESS, round(close, 2), round(change, 2), round(pct, 2), stale, None)
+
+
+def no_data_result(ticker, reason=None):
+    """查無資料的結果 (例如不在股票主檔中的代號)"""
+    return QuoteResult(ticker, QUOTE_NO_DATA, None, None, None, False, reason)
+
+
+def split_known_missing(tickers):
+    """
+    依負向快取分出近期已確認查無資料的代號
+
+    Returns:
+        (to_fetch, missing): 需要查詢上游的代號, 負向快取命中的查詢結果 dict
+    """
+    cache = get_shared_cache()
+    missing = {t: no_data_result(t) for t in tickers if cache.get("no_data", t) is not None}
+    return [t for t in tickers if t not in missing], missing
+
+
+# 上游明確回報查無資料的 yfinance 例外 (以類別名稱判斷，與 rate_limit 相同)
+NO_DATA_ERRORS = ("YFPricesMissingError", "YFTzMissingError")
+
+
+_raise_lock = threading.Lock()
+_raise_depth = 0
+_hide_exceptions_backup = True
+
+
+@contextmanager
+def yfinance_errors_raised():
+    """
+    區塊內讓 yfinance 拋出網路與上游錯誤 (預設會隱藏錯誤並回傳空表)
+
+    yfinance 的設定為全域，以計數支援多個執行緒同時使用：第一個進入時關閉 hide_exceptions，
+    最後一個離開時還原 (期間其他執行緒的 yfinance 呼叫也會拋出錯誤，呼叫端皆有例外處理)
+    """
+    import yfinance as yf
+    global _raise_depth, _hide_exceptions_backup
+    with _raise_lock:
+        if _raise_depth == 0:
+            _hide_exceptions_backup = yf.config.debug.hide_exceptions
+            yf.config.debug.hide_exceptions = False
+        _raise_depth += 1
+    try:
+        yield
+    finally:
+        with _raise_lock:
+            _raise_depth -= 1
+            if _raise_depth == 0:
+                yf.config.debug.hide_exceptions = _hide_exceptions_backup
+
+
+def remember_missing(result):
+    """上游正常回應但查無資料時寫入負向快取 (過期資料不列入，避免誤判)"""
+    if result.status == QUOTE_NO_DATA and not result.stale:
+        get_shared_cache().set("no_data", result.ticker, True, ttl=NO_DATA_TTL)
+
+
+def format_market_summary(results):
+    """將查詢結果轉為市場摘要文字 (供 AI prompt、Email 使用)"""
+    return "".join(f"{r.line}\n" for r in results)
+
+
 def get_market_summary(tickers):
-    summary = ""
-    for ticker in tickers:
+    """
+    逐檔取得近兩日行情
+
+    Args:
+        tickers: 已正規化的股票代號列表
+
+    Returns:
+        list[QuoteResult]: 與 tickers 同順序的查詢結果
+    """
+    import yfinance as yf
+    to_fetch, results = split_known_missing(tickers)
+    for ticker in to_fetch:
         try:
+            # yfinance 預設隱藏網路與上游錯誤並回傳空表；讓錯誤拋出才能區分「查無資料」與「暫時失敗」
             stock = yf.Ticker(ticker)
-            hist = stock.history(period="2d")
-            if len(hist) >= 2:
-                close = hist['Close'].iloc[-1]
-                prev = hist['Close'].iloc[-2]
-                change = close - prev
-                pct = (change / prev) * 100
-                summary += f"- {ticker}: {close:.2f} ({change:+.2f} / {pct:+.2f}%)\n"
+            with yfinance_errors_raised():
+                hist, stale = guarded_call("yfinance", ("history", ticker, "2d"), stock.history, period="2d")
         except Exception as e:
-            summary += f"- {ticker}: 獲取失敗 ({e})\n"
-    return summary
+            if type(e).__name__ in NO_DATA_ERRORS:
+                results[ticker] = no_data_result(ticker)
+                remember_missing(results[ticker])
+            else:
+                results[ticker] = QuoteResult(ticker, QUOTE_ERROR, None, None, None, False, str(e))
+            continue
+        results[ticker] = quote_from_closes(ticker, hist['Close'].dropna() if not hist.empty else [], stale)
+        # 空表仍可能是未拋出的上游異常，只有上游回傳了 K 棒 (但不足兩根) 才寫入負向快取
+        if not hist.empty:
+            remember_missing(results[ticker])
+    return [results[t] for t in tickers]
+
+def get_market_summary_bulk(tickers):
+    """
+    以單次 yf.download 取得多檔股票的近期行情
+
+    Args:
+        tickers: 已正規化的股票代號列表
+
+    Returns:
+        dict: ticker -> QuoteResult
+    """
+    import yfinance as yf
+    to_fetch, results = split_known_missing(tickers)
+    if not to_fetch:
+        return results
+
+    try:
+        # 抓 5 日以確保連假後仍有兩根 K 棒
+        data, stale = guarded_call(
+            "yfinance", ("download", tuple(to_fetch), "5d"),
+            yf.download, list(to_fetch),
+            period="5d", group_by="ticker", auto_adjust=True, progress=False, threads=True
+        )
+    except Exception as e:
+        results.update({t: QuoteResult(t, QUOTE_ERROR, None, None, None, False, str(e)) for t in to_fetch})
+        return results
+
+    # yf.download 會把單檔的上游錯誤 (逾時、5xx) 轉為全為 NaN 的欄位，無法與查無資料區分：
+    # 沒有任何 K 棒的代號改以 get_market_summary 逐檔確認後才寫入負向快取；
+    # 整批都沒有資料時可能是上游異常，不逐檔重查
+    confirmed = not data.empty and bool(data.notna().any().any())
+    recheck = []
+    for ticker in to_fetch:
+        try:
+            closes = data[ticker]['Close'].dropna()
+        except KeyError:
+            closes = []
+        results[ticker] = quote_from_closes(ticker, closes, stale)
+        if len(closes):
+            remember_missing(results[ticker])
+        elif confirmed and not stale:
+            recheck.append(ticker)
+    if recheck:
+        results.update(zip(recheck, get_market_summary(recheck)))
+    return results
+
+def get_technical_snapshot(ticker):
+    """
+    以近 3 個月日線計算簡易技術指標 (供模板摘要使用)
+
+    Returns:
+        dict: close, ma5, ma20, high_20d, low_20d, volume_ratio；資料不足時回傳 None
+    """
+    import yfinance as yf
+    hist, _ = get_shared_cache().get_or_compute(
+        "bars", (ticker, "3mo"),
+        lambda: guarded_call("yfinance", ("history", ticker, "3mo"), yf.Ticker(ticker).history, period="3mo"),
+        ttl=cache_ttl("bars"),
+        should_cache=lambda result: not result[1] and not result[0].empty
+    )
+    if len(hist) < 20:
+        return None
+    close = hist['Close']
+    volume = hist['Volume']
+    avg_volume = volume.iloc[-21:-1].mean()
+    return {
+        "close": float(close.iloc[-1]),
+        "ma5": float(close.iloc[-5:].mean()),
+        "ma20": float(close.iloc[-20:].mean()),
+        "high_20d": float(hist['High'].iloc[-20:].max()),
+        "low_20d": float(hist['Low'].iloc[-20:].min()),
+        "volume_ratio": float(volume.iloc[-1] / avg_volume) if avg_volume else None
+    }
+
+def build_quick_report(market_data, indicators=None):
+    """
+    不經 LLM、以固定模板產生的快速摘要 (AI 報告逾時時的備援)
+
+    Args:
+        market_data: format_market_summary 的文字結果
+        indicators: get_technical_snapshot 的結果 (可為 None)
+
+    Returns:
+        str: 摘要文字
+    """
+    lines = ["【快速摘要】AI 報告生成中，以下為系統依數據自動產生的重點：", market_data.strip()]
+    if indicators:
+        close, ma5, ma20 = indicators["close"], indicators["ma5"], indicators["ma20"]
+        if close > ma5 > ma20:
+            trend = "短線多頭排列 (收盤 > MA5 > MA20)"
+        elif close < ma5 < ma20:
+            trend = "短線空頭排列 (收盤 < MA5 < MA20)"
+        elif close >= ma20:
+            trend = "位於月線之上，整理偏多"
+        else:
+            trend = "位於月線之下，整理偏弱"
+        lines.append(f"- 趨勢：{trend}")
+        lines.append(f"- 均線：MA5 {ma5:.2f} / MA20 {ma20:.2f}")
+        position = (close - indicators["low_20d"]) / (indicators["high_20d"] - indicators["low_20d"] or 1) * 100
+        lines.append(f"- 20 日區間：{indicators['low_20d']:.2f} ~ {indicators['high_20d']:.2f} (目前位於區間 {position:.0f}% 位置)")
+        if indicators["volume_ratio"] is not None:
+            volume_note = "放量" if indicators["volume_ratio"] >= 1.5 else "量縮" if indicators["volume_ratio"] <= 0.7 else "量能持平"
+            lines.append(f"- 成交量：為 20 日均量的 {indicators['volume_ratio']:.1f} 倍 ({volume_note})")
+    lines.append("完整 AI 分析稍後可透過 report_id 查詢。")
+    return "\n".join(lines)
 
 def generate_ai_report(market_data):
     if not GOOGLE_API_KEY:
         return "錯誤：未設定 GOOGLE_API_KEY"
 
-    client = genai.Client(api_key=GOOGLE_API_KEY)
-
     prompt = f"""
     請撰寫一份簡短的台股收盤日報。
 
@@ -53,11 +268,10 @@ def generate_ai_report(market_data):
     3. 語氣專業且激勵人心。
     """
     try:
-        response = client.models.generate_content(
-            model='gemini-2.5-flash',
-            contents=prompt
-        )
-        return response.text
+        text, stale = generate_text(prompt)
+        if stale:
+            return f"{STALE_NOTICE}\n\n{text}"
+        return text
     except Exception as e:
         return f"AI 生成失敗: {e}"
 
@@ -88,19 +302,15 @@ def send_email(subject, body, username=None, password=None, to_addr=None):
         return False, f"❌ Email 發送失敗: {e}"
 
 def main():
+    from report_store import get_or_create_report, format_generated_at
     print(f"[{datetime.datetime.now()}] 開始執行每日自動分析...")
     
-    # 1. 獲取數據
-    market_data = get_market_summary(WATCHLIST)
-    print("數據獲取完成。")
-    
-    # 2. AI 分析
-    report = generate_ai_report(market_data)
-    print("AI 報告生成完成。")
+    # 1~2. 獲取數據與 AI 分析 (同一交易日若已由網頁或 API 產生，直接沿用)
+    artifact = get_or_create_report(WATCHLIST)
+    print(f"報告已就緒 (交易日 {artifact['trading_date']}，產生於 {format_generated_at(artifact)})。")
     
     # 3. 寄送 Email
-    subject = f"📊 台股每日 AI 摘要 ({datetime.date.today()})"
-    send_email(subject, f"{market_data}\n\n{report}")
+    send_email(artifact['subject'], artifact['body'])
 
 if __name__ == "__main__":
     main()
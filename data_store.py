@@ -0,0 +1,126 @@
+"""
+程序內共用的唯讀資料存放區
+
+Streamlit 的 session_state 每個使用者各存一份，若直接放入 DataFrame，
+記憶體會隨同時連線數線性成長 (即使大家都在看 2330)。
+改為將資料放入本存放區，session_state 只保存鍵值：
+- 以內容雜湊作為鍵：相同內容只存一份 (跨 session 去重)
+- 容量上限 (DATA_STORE_MAX_MB)：超過時依最近存取時間 (LRU) 淘汰
+- 取出的資料為共用物件，呼叫端不可修改 (需要新增欄位時請用 assign / copy)
+"""
+import hashlib
+import os
+import pickle
+import threading
+from collections import OrderedDict
+
+DEFAULT_MAX_MB = float(os.getenv("DATA_STORE_MAX_MB", 128))
+
+
+def estimate_size(value):
+    """估算物件佔用的記憶體 (bytes)"""
+    import pandas as pd
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(deep=True).sum())
+    if isinstance(value, pd.Series):
+        return int(value.memory_usage(deep=True))
+    try:
+        return len(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+    except Exception:
+        return 0
+
+
+def content_key(value):
+    """依內容計算鍵值，內容相同的物件會得到相同的鍵"""
+    import pandas as pd
+    digest = hashlib.sha1()
+    if isinstance(value, pd.DataFrame):
+        digest.update(b"df")
+        digest.update(repr(list(value.columns)).encode("utf-8"))
+        digest.update(pd.util.hash_pandas_object(value, index=True).values.tobytes())
+    else:
+        digest.update(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+    return digest.hexdigest()
+
+
+class DataStore:
+    """以內容去重、具容量上限的 LRU 存放區 (執行緒安全)"""
+
+    def __init__(self, max_mb=DEFAULT_MAX_MB):
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self._entries = OrderedDict()   # key -> (value, size)
+        self._lock = threading.Lock()
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def put(self, value):
+        """
+        存入資料 (已有相同內容時直接沿用)
+
+        Returns:
+            str: 資料鍵值
+        """
+        key = content_key(value)
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return key
+        size = estimate_size(value)
+        with self._lock:
+            if key not in self._entries:
+                self._entries[key] = (value, size)
+                self.total_bytes += size
+                self._evict()
+            return key
+
+    def get(self, key):
+        """取得資料；不存在或已被淘汰時回傳 None"""
+        if key is None:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def size_of(self, keys):
+        """計算一組鍵值 (例如某個 session 引用的資料) 佔用的記憶體"""
+        with self._lock:
+            return sum(self._entries[k][1] for k in set(keys) if k in self._entries)
+
+    def _evict(self):
+        """超過容量上限時淘汰最久未使用的資料 (最新放入的一筆會保留)"""
+        while self.total_bytes > self.max_bytes and len(self._entries) > 1:
+            _, (_, size) = self._entries.popitem(last=False)
+            self.total_bytes -= size
+            self.evictions += 1
+
+    def stats(self):
+        """回傳存放區使用狀況"""
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self.total_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+_default_store = None
+_default_lock = threading.Lock()
+
+
+def get_data_store():
+    """取得程序內共用的 DataStore 實例"""
+    global _default_store
+    with _default_lock:
+        if _default_store is None:
+            _default_store = DataStore()
+        return _default_store
@@ -1,6 +1,36 @@
-import yfinance as yf
+import os
+import time
 import pandas as pd
 import numpy as np
+from rate_limit import guarded_call
+from shared_cache import get_shared_cache
+from bar_rollups import get_rollup
+from cache_policy import cache_ttl
+
+# 滾動回測輸出的百分位數
+DISTRIBUTION_PERCENTILES = (5, 25, 50, 75, 95)
+
+# 蒙地卡羅模擬設定
+TRADING_DAYS_PER_MONTH = 21
+MC_BLOCK_DAYS = 20                                          # 區塊拔靴法的區塊長度 (交易日)
+MC_CHUNK_PATHS = int(os.getenv("DCA_MC_CHUNK_PATHS", 2500))  # 每個批次模擬的路徑數 (控制記憶體用量)
+MC_WORKERS = int(os.getenv("DCA_MC_WORKERS", 1))             # >1 時以多個程序平行模擬
+
+def get_price_history(ticker, period):
+    """
+    取得日 K 線 (優先使用跨程序共用快取)
+
+    Returns:
+        (hist, stale): 日資料與是否為限流時的過期資料
+    """
+    import yfinance as yf
+    stock = yf.Ticker(ticker)
+    return get_shared_cache().get_or_compute(
+        "bars", (ticker, period),
+        lambda: guarded_call("yfinance", ("history", ticker, period), stock.history, period=period),
+        ttl=cache_ttl("history"),
+        should_cache=lambda result: not result[1] and not result[0].empty
+    )
 
 def calculate_dca_performance(ticker, monthly_amount, years):
     """
@@ -19,16 +49,15 @@ def calculate_dca_performance(ticker, monthly_amount, years):
         # 1. 獲取歷史數據
         # yfinance 的 period 參數: '1y', '2y', '5y', '10y', 'max'
         period = f"{years}y"
-        stock = yf.Ticker(ticker)
         # 獲取日資料
-        hist = stock.history(period=period)
+        hist, stale = get_price_history(ticker, period)
         
         if hist.empty:
             return None, {"error": "無法獲取歷史數據"}
 
         # 2. 模擬每月定期定額
-        # 將數據重取樣為每月第一天 (Month Start)
-        monthly_data = hist['Close'].resample('MS').first()
+        # 每月第一個交易日的收盤價 (直接讀取月線彙總，以月初為索引)
+        monthly_data = get_rollup(ticker, "M", hist, period)['First_Close']
         
         # 建立投資紀錄
         investments = []
@@ -101,10 +130,223 @@ def calculate_dca_performance(ticker, monthly_amount, years):
             "total_return_pct": total_return_pct,
             "max_drawdown": max_drawdown,
             "volatility": volatility,
-            "years": years
+            "years": years,
+            "stale": stale
         }
         
         return df_daily, metrics
 
     except Exception as e:
         return None, {"error": str(e)}
+
+
+def calculate_rolling_dca(ticker, monthly_amount, years, period="max"):
+    """
+    滾動起始月份的定期定額分析：一次計算「每一個可能的起始月份」投資 N 年的結果
+
+    以每月買入股數的前綴和 (prefix sum) 取得任意區間的累積股數，
+    所有起始月份的報酬與最大回撤在同一次向量化運算中完成，不需逐一重跑回測。
+    (最大回撤以月底資產價值計算，較日資料略為保守)
+
+    Args:
+        ticker (str): 股票代號
+        monthly_amount (float): 每月扣款金額
+        years (int): 每個起始月份的投資年數
+        period (str): 使用的歷史資料長度
+
+    Returns:
+        df_dist (pd.DataFrame): 每個起始月份的 Start / End / Return_Pct / Max_Drawdown
+        summary (dict): 報酬與 MDD 的百分位數、虧損機率等摘要
+    """
+    try:
+        hist, stale = get_price_history(ticker, period)
+        if hist.empty:
+            return None, {"error": "無法獲取歷史數據"}
+
+        # 每月第一個交易日買入、以月底收盤計算資產價值 (讀取月線彙總)
+        monthly = get_rollup(ticker, "M", hist, period)
+        buy_price = monthly['First_Close']
+        month_close = monthly['Close'].to_numpy()
+        horizon = int(years * 12)
+        n_months = len(buy_price)
+        n_starts = n_months - horizon + 1
+        if n_starts < 1:
+            return None, {"error": f"歷史資料不足 {years} 年"}
+
+        # 前綴和：cum_shares[m] = 前 m 個月累積買入的股數
+        shares = monthly_amount / buy_price.to_numpy()
+        cum_shares = np.concatenate(([0.0], np.cumsum(shares)))
+
+        starts = np.arange(n_starts)
+        # months[s, k] = 起始月份 s 的第 k 個月 (n_starts x horizon 的三角區間)
+        months = starts[:, None] + np.arange(horizon)[None, :]
+        held = cum_shares[months + 1] - cum_shares[starts][:, None]
+        values = held * month_close[months]
+        costs = monthly_amount * np.arange(1, horizon + 1)
+
+        final_value = values[:, -1]
+        total_cost = costs[-1]
+        return_pct = (final_value / total_cost - 1) * 100
+
+        running_max = np.maximum.accumulate(values, axis=1)
+        max_drawdown = ((values - running_max) / running_max).min(axis=1) * 100
+
+        df_dist = pd.DataFrame({
+            'Start': buy_price.index[starts],
+            'End': buy_price.index[starts + horizon - 1],
+            'Final_Value': final_value,
+            'Return_Pct': return_pct,
+            'Max_Drawdown': max_drawdown,
+        })
+
+        summary = summarize_rolling_dca(df_dist)
+        summary.update({"years": years, "total_cost": total_cost, "stale": stale})
+        return df_dist, summary
+
+    except Exception as e:
+        return None, {"error": str(e)}
+
+
+def summarize_rolling_dca(df_dist):
+    """
+    將滾動回測結果整理為百分位數摘要 (供頁面與 AI prompt 使用)
+
+    Returns:
+        dict: count, first_start, last_start, loss_probability, return_pXX, mdd_pXX
+    """
+    summary = {
+        "count": len(df_dist),
+        "first_start": df_dist['Start'].iloc[0].strftime('%Y-%m'),
+        "last_start": df_dist['Start'].iloc[-1].strftime('%Y-%m'),
+        "loss_probability": float((df_dist['Return_Pct'] < 0).mean() * 100),
+    }
+    returns = np.percentile(df_dist['Return_Pct'], DISTRIBUTION_PERCENTILES)
+    mdds = np.percentile(df_dist['Max_Drawdown'], DISTRIBUTION_PERCENTILES)
+    for p, r, m in zip(DISTRIBUTION_PERCENTILES, returns, mdds):
+        summary[f"return_p{p}"] = float(r)
+        summary[f"mdd_p{p}"] = float(m)
+    return summary
+
+
+def format_rolling_summary(summary):
+    """將滾動回測摘要轉為文字 (供 AI prompt 使用)"""
+    return (
+        f"以 {summary['first_start']} ~ {summary['last_start']} 共 {summary['count']} 個起始月份各投資 {summary['years']} 年："
+        f"報酬率 5%/25%/50%/75%/95% 百分位為 "
+        f"{summary['return_p5']:.1f}% / {summary['return_p25']:.1f}% / {summary['return_p50']:.1f}% / "
+        f"{summary['return_p75']:.1f}% / {summary['return_p95']:.1f}%，"
+        f"虧損機率 {summary['loss_probability']:.1f}%，"
+        f"最大回撤中位數 {summary['mdd_p50']:.1f}% (最差 5% 情境 {summary['mdd_p5']:.1f}%)"
+    )
+
+
+def _simulate_chunk(log_returns, monthly_amount, months, n_paths, method, block_days, seed):
+    """
+    模擬一批定期定額路徑
+
+    Returns:
+        np.ndarray: (n_paths, months) 每月月底的資產價值
+    """
+    rng = np.random.default_rng(seed)
+    if method == "bootstrap":
+        # 區塊拔靴法：隨機抽取連續的歷史日報酬區塊，保留波動聚集等短期相關性
+        days = months * TRADING_DAYS_PER_MONTH
+        n_blocks = -(-days // block_days)
+        starts = rng.integers(0, len(log_returns) - block_days + 1, size=(n_paths, n_blocks))
+        idx = (starts[:, :, None] + np.arange(block_days)).reshape(n_paths, -1)[:, :days]
+        monthly_log = log_returns[idx].reshape(n_paths, months, TRADING_DAYS_PER_MONTH).sum(axis=2)
+    else:
+        # 參數法：以歷史日報酬的平均與標準差建立常態分布的月報酬
+        mu, sigma = log_returns.mean(), log_returns.std()
+        monthly_log = rng.normal(
+            mu * TRADING_DAYS_PER_MONTH, sigma * np.sqrt(TRADING_DAYS_PER_MONTH), size=(n_paths, months)
+        )
+
+    # 相對價格：prices[:, m] 為第 m 個月月初 (等於前一個月月底)，期初為 1
+    prices = np.exp(np.concatenate([np.zeros((n_paths, 1)), np.cumsum(monthly_log, axis=1)], axis=1))
+    shares = np.cumsum(monthly_amount / prices[:, :-1], axis=1)
+    return shares * prices[:, 1:]
+
+
+def simulate_dca_outcomes(ticker, monthly_amount, years, n_paths=10000, method="bootstrap",
+                          history_period="10y", block_days=MC_BLOCK_DAYS, seed=None, workers=MC_WORKERS):
+    """
+    以蒙地卡羅模擬未來定期定額的可能結果
+
+    從歷史日報酬重新抽樣 (區塊拔靴法) 或以常態分布參數模擬，一次以 NumPy 陣列產生大量路徑；
+    路徑分批計算以控制記憶體，workers > 1 時各批次分散到多個程序執行。
+
+    Args:
+        ticker (str): 股票代號
+        monthly_amount (float): 每月扣款金額
+        years (int): 模擬的投資年數
+        n_paths (int): 模擬路徑數
+        method (str): "bootstrap" (區塊拔靴法) 或 "parametric" (常態分布)
+        history_period (str): 用來估計報酬分布的歷史資料長度
+        block_days (int): 拔靴法的區塊長度 (交易日)
+        seed (int): 亂數種子 (None 表示每次不同)
+        workers (int): 平行模擬的程序數
+
+    Returns:
+        df_fan (pd.DataFrame): 每月資產價值的百分位數 (P5 ~ P95) 與累積投入成本，用於扇形圖
+        summary (dict): 期末資產百分位數、虧損機率等摘要
+    """
+    try:
+        hist, stale = get_price_history(ticker, history_period)
+        if hist.empty:
+            return None, {"error": "無法獲取歷史數據"}
+
+        log_returns = np.log(hist['Close']).diff().dropna().to_numpy()
+        if len(log_returns) < block_days * 2:
+            return None, {"error": "歷史資料不足以進行模擬"}
+
+        months = int(years * 12)
+        started = time.perf_counter()
+
+        # 分批：每批使用獨立的亂數種子，結果與執行方式 (單程序/多程序) 無關
+        chunk_sizes = [min(MC_CHUNK_PATHS, n_paths - i) for i in range(0, n_paths, MC_CHUNK_PATHS)]
+        seeds = np.random.SeedSequence(seed).spawn(len(chunk_sizes))
+        args = [(log_returns, monthly_amount, months, size, method, block_days, s)
+                for size, s in zip(chunk_sizes, seeds)]
+        if workers > 1 and len(args) > 1:
+            from concurrent.futures import ProcessPoolExecutor
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                chunks = list(pool.map(_simulate_chunk, *zip(*args)))
+        else:
+            chunks = [_simulate_chunk(*a) for a in args]
+        values = np.concatenate(chunks)
+
+        costs = monthly_amount * np.arange(1, months + 1)
+        fan = np.percentile(values, DISTRIBUTION_PERCENTILES, axis=0)
+        df_fan = pd.DataFrame({f"P{p}": row for p, row in zip(DISTRIBUTION_PERCENTILES, fan)})
+        df_fan.index = pd.RangeIndex(1, months + 1, name="Month")
+        df_fan['Total_Cost'] = costs
+
+        final_return_pct = (values[:, -1] / costs[-1] - 1) * 100
+        summary = {
+            "method": method,
+            "n_paths": n_paths,
+            "years": years,
+            "total_cost": float(costs[-1]),
+            "loss_probability": float((final_return_pct < 0).mean() * 100),
+            "elapsed": time.perf_counter() - started,
+            "stale": stale,
+        }
+        for p, value, ret in zip(DISTRIBUTION_PERCENTILES, fan[:, -1],
+                                 np.percentile(final_return_pct, DISTRIBUTION_PERCENTILES)):
+            summary[f"value_p{p}"] = float(value)
+            summary[f"return_p{p}"] = float(ret)
+        return df_fan, summary
+
+    except Exception as e:
+        return None, {"error": str(e)}
+
+
+def format_simulation_summary(summary):
+    """將蒙地卡羅模擬摘要轉為文字 (供 AI prompt 使用)"""
+    method = "歷史報酬區塊拔靴法" if summary['method'] == "bootstrap" else "常態分布參數模型"
+    return (
+        f"以{method}模擬 {summary['n_paths']:,} 條未來 {summary['years']} 年的路徑："
+        f"期末報酬率 5%/50%/95% 百分位為 {summary['return_p5']:.1f}% / {summary['return_p50']:.1f}% / "
+        f"{summary['return_p95']:.1f}%，虧損機率 {summary['loss_probability']:.1f}%"
+    )
@@ -0,0 +1,137 @@
+"""
+分析報告的追問對話
+
+首次分析時已整理好的資料 (行情、財報/PDF 內容與 AI 報告) 以 Gemini 的 context cache 保存，
+之後每次追問只需送出對話紀錄與新問題，不必重新解析 PDF、抓取行情或送出完整的長 prompt。
+- 同一份脈絡 (不論哪位使用者、哪個程序) 只建立一次 context cache，名稱記錄在共用快取中
+- 脈絡太短 (低於 Gemini 快取的最小長度) 或建立失敗時，改以固定的 system instruction 送出脈絡，
+  前綴相同仍可利用 Gemini 的隱式快取
+- client 可替換為替身物件 (需提供 models.generate_content，caches.create 可選)，方便在無網路時測試
+"""
+import os
+import time
+from settings import GOOGLE_API_KEY
+from rate_limit import guarded_call
+from shared_cache import get_shared_cache
+from llm import DEFAULT_MODEL, prompt_hash
+
+# context cache 的有效秒數 (共用快取中的紀錄會提前一分鐘過期，避免引用已失效的 cache)
+CONTEXT_CACHE_TTL = int(os.getenv("FOLLOWUP_CACHE_TTL", 3600))
+# 脈絡短於此字數時不建立 context cache (Gemini 快取有最小 token 數限制)
+MIN_CACHE_CHARS = 2000
+# 脈絡中文件內容的字數上限 (首次分析的 prompt 只使用前 10000 字)
+CONTEXT_DOCUMENT_CHARS = 30000
+# 每次追問最多帶入的歷史對話輪數
+MAX_HISTORY_TURNS = 10
+
+SYSTEM_INSTRUCTION = (
+    "你是台股投資分析助理。使用者已閱讀以下資料與 AI 分析報告，接下來會針對報告提出追問。"
+    "請根據資料以繁體中文簡潔回答；資料中沒有的資訊請明確說明，不要臆測。"
+)
+
+
+def build_context(ticker, market_context, document, report):
+    """
+    組合追問使用的脈絡
+
+    Args:
+        ticker: 股票代號
+        market_context: 技術面與基本面數據文字
+        document: 財報 / 法說會內容 (PDF 解析結果)
+        report: 首次分析產生的 AI 報告
+    """
+    return (
+        f"【股票】{ticker}\n\n"
+        f"【市場數據】\n{market_context}\n\n"
+        f"【財報/法說會內容】\n{document[:CONTEXT_DOCUMENT_CHARS]}\n\n"
+        f"【AI 分析報告】\n{report}"
+    )
+
+
+def _default_client():
+    from google import genai
+    return genai.Client(api_key=GOOGLE_API_KEY)
+
+
+def get_context_cache(context, model=DEFAULT_MODEL, client=None):
+    """
+    取得 (或建立) 脈絡的 Gemini context cache
+
+    Returns:
+        str: cache 名稱；脈絡太短、client 不支援或建立失敗時回傳 None
+    """
+    cache = get_shared_cache()
+    key = prompt_hash(context, model)
+    name = cache.get("llm_context", key)
+    if name is not None or len(context) < MIN_CACHE_CHARS:
+        return name
+
+    client = client or _default_client()
+    if not hasattr(client, "caches"):
+        return None
+    try:
+        created, _ = guarded_call(
+            "gemini", None, client.caches.create,
+            model=model,
+            config={
+                "system_instruction": SYSTEM_INSTRUCTION,
+                "contents": [{"role": "user", "parts": [{"text": context}]}],
+                "ttl": f"{CONTEXT_CACHE_TTL}s",
+                "display_name": f"followup-{key[:12]}",
+            },
+        )
+    except Exception as e:
+        print(f"建立 context cache 失敗，改用 system instruction: {e}")
+        return None
+    cache.set("llm_context", key, created.name, ttl=max(CONTEXT_CACHE_TTL - 60, 60))
+    return created.name
+
+
+def ask_followup(context, history, question, model=DEFAULT_MODEL, client=None):
+    """
+    針對已分析的報告追問 (只送出對話紀錄與新問題，脈絡由 context cache 提供)
+
+    Args:
+        context: build_context 的結果
+        history: 先前的對話 [{"role": "user" / "model", "text": ...}]
+        question: 新的問題
+        model: 模型名稱
+        client: genai.Client 或替身物件
+
+    Returns:
+        (answer, info): 回答文字，以及 cached (是否使用 context cache)、
+                        prompt_tokens / cached_tokens (token 用量)、elapsed (秒)
+    """
+    client = client or _default_client()
+    contents = [
+        {"role": turn["role"], "parts": [{"text": turn["text"]}]}
+        for turn in history[-MAX_HISTORY_TURNS * 2:]
+    ]
+    contents.append({"role": "user", "parts": [{"text": question}]})
+
+    started = time.perf_counter()
+    cache_name = get_context_cache(context, model, client)
+
+    def call(config):
+        response, _ = guarded_call("gemini", None, client.models.generate_content,
+                                   model=model, contents=contents, config=config)
+        return response
+
+    if cache_name is not None:
+        try:
+            response = call({"cached_content": cache_name})
+        except Exception as e:
+            # cache 已在 Gemini 端過期或被刪除：清除紀錄後改用 system instruction
+            print(f"context cache 無法使用，改用 system instruction: {e}")
+            get_shared_cache().delete("llm_context", prompt_hash(context, model))
+            cache_name = None
+    if cache_name is None:
+        response = call({"system_instruction": f"{SYSTEM_INSTRUCTION}\n\n{context}"})
+
+    usage = getattr(response, "usage_metadata", None)
+    return response.text, {
+        "cached": cache_name is not None,
+        "prompt_tokens": getattr(usage, "prompt_token_count", None),
+        "cached_tokens": getattr(usage, "cached_content_token_count", None),
+        "elapsed": time.perf_counter() - started,
+    }
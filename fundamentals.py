@@ -0,0 +1,318 @@
+"""
+基本面資料抓取與同業比較
+
+- 多檔股票以執行緒池並行抓取，單一公司的 info 與三大報表也同時抓取；
+  並行數不超過 yfinance 限流 bucket 的容量，請求依序排隊取得 token (不會因本地等待逾時而遺漏公司)
+- info 與每份報表各佔用一個 yfinance 限流額度，總耗時約為「公司數 × 4 ÷ YFINANCE_RATE」秒，
+  實際送出的上游請求數不超過設定的速率
+- 單份報表失敗時保留其他已取得的資料 (記錄在 errors)，全部失敗才視為該公司抓取失敗
+- 抓取結果存入跨程序共用快取
+- 匯入時將各公司欄位名稱不一的寬表報表，對應為標準項目的長格式表 (ticker, period, item, value)，
+  並同時預先計算毛利率、營益率、ROE、負債比等比率；跨公司、跨年度查詢只需掃描欄位
+"""
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pandas as pd
+from rate_limit import queued_call, burst_size
+from shared_cache import get_shared_cache
+from cache_policy import cache_ttl
+
+# 同時進行的上游 HTTP 請求數上限 (每家公司同時抓取 4 份資料)
+FUNDAMENTALS_WORKERS = int(os.getenv("FUNDAMENTALS_WORKERS", 16))
+
+# 報表名稱 -> 取得 (年報，列為期間) 的函數
+STATEMENT_PARTS = {
+    "info": lambda stock: stock.info,
+    "financials": lambda stock: stock.financials.T,        # 損益表
+    "balance_sheet": lambda stock: stock.balance_sheet.T,  # 資產負債表
+    "cashflow": lambda stock: stock.cashflow.T,            # 現金流量表
+}
+
+
+# 標準項目 -> (所屬報表, yfinance 可能使用的欄位名稱，依優先順序)
+ITEM_ALIASES = {
+    "revenue": ("financials", ["Total Revenue", "Operating Revenue"]),
+    "gross_profit": ("financials", ["Gross Profit"]),
+    "operating_income": ("financials", ["Operating Income", "Total Operating Income As Reported"]),
+    "net_income": ("financials", ["Net Income", "Net Income Common Stockholders"]),
+    "eps": ("financials", ["Diluted EPS", "Basic EPS"]),
+    "total_assets": ("balance_sheet", ["Total Assets"]),
+    "total_liabilities": ("balance_sheet", ["Total Liabilities Net Minority Interest", "Total Liabilities"]),
+    "equity": ("balance_sheet", ["Stockholders Equity", "Common Stock Equity", "Total Equity Gross Minority Interest"]),
+    "current_assets": ("balance_sheet", ["Current Assets"]),
+    "current_liabilities": ("balance_sheet", ["Current Liabilities"]),
+    "operating_cash_flow": ("cashflow", ["Operating Cash Flow", "Cash Flow From Continuing Operating Activities"]),
+    "investing_cash_flow": ("cashflow", ["Investing Cash Flow", "Cash Flow From Continuing Investing Activities"]),
+    "financing_cash_flow": ("cashflow", ["Financing Cash Flow", "Cash Flow From Continuing Financing Activities"]),
+    "capital_expenditure": ("cashflow", ["Capital Expenditure"]),
+    "free_cash_flow": ("cashflow", ["Free Cash Flow"]),
+}
+
+# 匯入時預先計算的比率 (%)：比率 -> (分子, 分母)
+RATIO_DEFINITIONS = {
+    "gross_margin": ("gross_profit", "revenue"),
+    "operating_margin": ("operating_income", "revenue"),
+    "net_margin": ("net_income", "revenue"),
+    "roe": ("net_income", "equity"),
+    "debt_ratio": ("total_liabilities", "total_assets"),
+    "debt_to_equity": ("total_liabilities", "equity"),
+    "current_ratio": ("current_assets", "current_liabilities"),
+    "fcf_margin": ("free_cash_flow", "revenue"),
+}
+
+# 顯示用中文名稱
+ITEM_LABELS = {
+    "revenue": "總營收", "gross_profit": "毛利", "operating_income": "營業利益", "net_income": "淨利", "eps": "EPS",
+    "total_assets": "總資產", "total_liabilities": "總負債", "equity": "股東權益",
+    "current_assets": "流動資產", "current_liabilities": "流動負債",
+    "operating_cash_flow": "營運現金流", "investing_cash_flow": "投資現金流", "financing_cash_flow": "籌資現金流",
+    "capital_expenditure": "資本支出", "free_cash_flow": "自由現金流",
+    "gross_margin": "毛利率(%)", "operating_margin": "營益率(%)", "net_margin": "淨利率(%)",
+    "revenue_growth": "營收成長率(%)", "roe": "ROE(%)", "debt_ratio": "負債比(%)",
+    "debt_to_equity": "負債權益比(%)", "current_ratio": "流動比率(%)", "fcf_margin": "自由現金流率(%)",
+}
+
+LONG_COLUMNS = ["ticker", "period", "statement", "item", "value"]
+
+
+def normalize_statements(ticker, bundle):
+    """
+    將單一公司的三大報表 (寬表) 轉為標準項目的長格式表，並計算比率
+
+    Returns:
+        pd.DataFrame: 欄位 ticker, period, statement, item, value (比率的 statement 為 "ratio")
+    """
+    wide = {}
+    sources = {}
+    for item, (statement, aliases) in ITEM_ALIASES.items():
+        df = bundle.get(statement)
+        if df is None or df.empty:
+            continue
+        column = next((c for c in aliases if c in df.columns), None)
+        if column is not None:
+            wide[item] = pd.to_numeric(df[column], errors="coerce")
+            sources[item] = statement
+    if not wide:
+        return pd.DataFrame(columns=LONG_COLUMNS)
+
+    values = pd.DataFrame(wide).sort_index()
+    values.index = pd.to_datetime(values.index)
+    if "free_cash_flow" not in values and {"operating_cash_flow", "capital_expenditure"} <= set(values):
+        values["free_cash_flow"] = values["operating_cash_flow"] + values["capital_expenditure"]
+        sources["free_cash_flow"] = "cashflow"
+
+    # 比率在匯入時一次以欄位運算算好
+    ratios = {}
+    for ratio, (numerator, denominator) in RATIO_DEFINITIONS.items():
+        if numerator in values and denominator in values:
+            ratios[ratio] = values[numerator] / values[denominator].replace(0, np.nan) * 100
+    if "revenue" in values:
+        previous = values["revenue"].shift(1)
+        ratios["revenue_growth"] = (values["revenue"] - previous) / previous.abs().replace(0, np.nan) * 100
+
+    frames = []
+    for table, statement_of in ((values, sources.get), (pd.DataFrame(ratios, index=values.index), lambda _: "ratio")):
+        if table.empty:
+            continue
+        long = table.rename_axis("period").reset_index().melt(id_vars="period", var_name="item", value_name="value")
+        long["statement"] = long["item"].map(statement_of)
+        frames.append(long)
+    long = pd.concat(frames, ignore_index=True).dropna(subset=["value"])
+    long["ticker"] = ticker
+    return long[LONG_COLUMNS]
+
+
+class FundamentalsStore:
+    """
+    標準化基本面資料的長格式欄式表
+
+    以 (ticker, item) -> 列位置 建立索引；查詢為欄位的向量化篩選，不需要每次重新整理寬表
+    """
+
+    def __init__(self):
+        self._frames = {}     # ticker -> 長格式表
+        self._table = None
+        self._index = None
+        self._lock = threading.Lock()
+
+    def ingest(self, ticker, long):
+        """匯入 (或覆蓋) 單一公司的長格式資料"""
+        with self._lock:
+            self._frames[ticker] = long
+            self._table = None
+
+    def __contains__(self, ticker):
+        return ticker in self._frames
+
+    def table(self):
+        """合併後的完整長格式表 (ticker / statement / item 為 categorical 欄位)"""
+        with self._lock:
+            if self._table is None:
+                frames = [f for f in self._frames.values() if not f.empty]
+                table = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=LONG_COLUMNS)
+                for col in ("ticker", "statement", "item"):
+                    table[col] = table[col].astype("category")
+                table = table.sort_values(["ticker", "item", "period"], ignore_index=True)
+                self._table = table
+                self._index = table.groupby(["ticker", "item"], observed=True).indices
+            return self._table, self._index
+
+    def query(self, tickers=None, items=None):
+        """
+        查詢長格式資料
+
+        Args:
+            tickers: 股票代號列表 (None 表示全部)
+            items: 標準項目或比率列表 (None 表示全部)
+        """
+        table, index = self.table()
+        if tickers is None or items is None:
+            mask = np.ones(len(table), dtype=bool)
+            if tickers is not None:
+                mask &= table["ticker"].isin(tickers).to_numpy()
+            if items is not None:
+                mask &= table["item"].isin(items).to_numpy()
+            return table[mask]
+        positions = [index[(t, i)] for t in tickers for i in items if (t, i) in index]
+        return table.iloc[np.concatenate(positions)] if positions else table.iloc[0:0]
+
+    def history(self, ticker, items):
+        """單一公司多年度資料 (列為期間、欄為項目)"""
+        rows = self.query([ticker], items)
+        wide = rows.pivot_table(index="period", columns="item", values="value", observed=True)
+        return wide.reindex(columns=[i for i in items if i in wide.columns]).rename_axis(columns=None)
+
+    def latest(self, tickers, items):
+        """各公司最近一期的資料 (列為公司、欄為項目)"""
+        rows = self.query(tickers, items)
+        latest_period = rows.groupby("ticker", observed=True)["period"].transform("max")
+        rows = rows[rows["period"] == latest_period]
+        wide = rows.pivot_table(index="ticker", columns="item", values="value", observed=True)
+        return wide.reindex(index=[t for t in tickers if t in wide.index],
+                            columns=[i for i in items if i in wide.columns])
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_fundamentals_store():
+    """取得程序內共用的 FundamentalsStore"""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = FundamentalsStore()
+        return _store
+
+
+def _empty_part(part):
+    """抓取失敗的資料以空值代替 (info 為空 dict，報表為空表)"""
+    return {} if part == "info" else pd.DataFrame()
+
+
+def _fetch_bundle(ticker):
+    """
+    同時抓取單一公司的 info 與三大報表 (每份資料各自排隊通過限流器)
+
+    Returns:
+        (bundle, stale): 各份資料 (失敗的部分為空值，錯誤訊息記錄在 bundle["errors"])，
+                         以及是否有任一份為限流時的過期資料
+
+    Raises:
+        RuntimeError: 全部資料都抓取失敗
+    """
+    import yfinance as yf
+    stock = yf.Ticker(ticker)
+    with ThreadPoolExecutor(max_workers=len(STATEMENT_PARTS)) as pool:
+        futures = {
+            part: pool.submit(queued_call, "yfinance", ("fundamentals", ticker, part), fetch, stock)
+            for part, fetch in STATEMENT_PARTS.items()
+        }
+    bundle, errors, stale = {}, {}, False
+    for part, future in futures.items():
+        try:
+            bundle[part], part_stale = future.result()
+            stale = stale or part_stale
+        except Exception as e:
+            bundle[part] = _empty_part(part)
+            errors[part] = str(e)
+    if len(errors) == len(STATEMENT_PARTS):
+        raise RuntimeError("; ".join(f"{part}: {msg}" for part, msg in errors.items()))
+    return {**bundle, "errors": errors}, stale
+
+
+def fetch_fundamentals(tickers, max_workers=FUNDAMENTALS_WORKERS):
+    """
+    並行抓取多檔股票的基本資料與三大報表
+
+    Args:
+        tickers: 已正規化的股票代號列表
+        max_workers: 最大並行請求數
+
+    Returns:
+        dict: ticker -> {"info", "financials", "balance_sheet", "cashflow", "long", "stale", "errors"}；
+              全部資料抓取失敗時為 {"error": 錯誤訊息}。成功的公司會同時匯入 get_fundamentals_store()
+    """
+    cache = get_shared_cache()
+    store = get_fundamentals_store()
+    results = {}
+    missing = []
+    for ticker in tickers:
+        cached = cache.get("fundamentals", ticker)
+        if cached is not None:
+            if "long" not in cached:
+                cached["long"] = normalize_statements(ticker, cached)
+            results[ticker] = cached
+            store.ingest(ticker, cached["long"])
+        else:
+            missing.append(ticker)
+    if not missing:
+        return results
+
+    # 同時抓取的公司數不超過 bucket 容量能立即供應的數量，其餘排隊等待，避免大量執行緒爭搶 token
+    companies = max(1, min(max_workers // len(STATEMENT_PARTS), len(missing),
+                           -(-burst_size("yfinance") // len(STATEMENT_PARTS))))
+    with ThreadPoolExecutor(max_workers=companies) as pool:
+        futures = {
+            ticker: pool.submit(_fetch_bundle, ticker)
+            for ticker in missing
+        }
+
+    for ticker in missing:
+        try:
+            bundle, stale = futures[ticker].result()
+        except Exception as e:
+            results[ticker] = {"error": str(e)}
+            continue
+        bundle = {**bundle, "stale": stale, "long": normalize_statements(ticker, bundle)}
+        if not stale and not bundle["errors"] and not bundle["financials"].empty:
+            cache.set("fundamentals", ticker, bundle, ttl=cache_ttl("fundamentals"))
+        store.ingest(ticker, bundle["long"])
+        results[ticker] = bundle
+    return results
+
+
+# 同業比較表的欄位
+PEER_ITEMS = ["revenue", "gross_margin", "operating_margin", "net_margin", "revenue_growth",
+              "roe", "debt_ratio", "debt_to_equity", "fcf_margin"]
+
+
+def build_peer_table(bundles, store=None):
+    """
+    將多家公司的最新年度資料整理為同業比較表 (直接讀取標準化表中預先算好的比率)
+
+    Args:
+        bundles: fetch_fundamentals 的回傳值
+        store: FundamentalsStore (預設為程序共用的實例)
+
+    Returns:
+        pd.DataFrame: 每列一家公司，欄位為營收與各項比率 (%)；抓取失敗的公司不列入
+    """
+    store = store or get_fundamentals_store()
+    tickers = [t for t, b in bundles.items() if "error" not in b]
+    latest = store.latest(tickers, PEER_ITEMS).reindex(columns=PEER_ITEMS)
+    table = latest.rename(columns=ITEM_LABELS).rename(columns={"總營收": "營收"}).rename_axis(columns=None)
+    table.insert(0, "公司", [bundles[t]["info"].get("shortName") or t for t in latest.index])
+    return table.rename_axis("股票代號").reset_index()
@@ -0,0 +1,132 @@
+"""
+LINE Messaging API Webhook 工具
+
+取代 LINE → n8n → /analyze → n8n → LINE 的串接：api.py 的 /line/webhook 直接接收 LINE 事件，
+驗證簽章後立即回應 200，分析在背景完成後再透過回覆器 (reply sender) 送回 LINE。
+同一次 Webhook 傳送的多個事件會合併處理 (重複的股票只分析一次)。
+
+回覆器可替換：測試時設定 LINE_API_BASE 指向本機 mock 伺服器，或以 set_reply_sender() 注入。
+"""
+import base64
+import hashlib
+import hmac
+import os
+import re
+from settings import LINE_CHANNEL_SECRET, LINE_CHANNEL_ACCESS_TOKEN
+
+LINE_API_BASE = os.getenv("LINE_API_BASE", "https://api.line.me")
+
+# LINE 單次回覆最多 5 則訊息、每則最多 5000 字
+MAX_MESSAGES_PER_REPLY = 5
+MAX_TEXT_LENGTH = 5000
+
+# 單則訊息最多解析的股票數
+MAX_TICKERS_PER_MESSAGE = int(os.getenv("LINE_MAX_TICKERS_PER_MESSAGE", 5))
+
+HELP_TEXT = "請輸入股票代號或名稱，例如「2330」或「台積電」，多檔股票可用空白或逗號分隔。"
+
+
+def verify_signature(body, signature, secret=None):
+    """
+    驗證 X-Line-Signature (以 Channel Secret 對原始 body 計算 HMAC-SHA256 後 Base64 編碼)
+
+    Args:
+        body: 原始請求內容 (bytes)
+        signature: X-Line-Signature 標頭值
+        secret: Channel Secret，預設使用 LINE_CHANNEL_SECRET
+    """
+    secret = secret or LINE_CHANNEL_SECRET
+    if not secret or not signature:
+        return False
+    digest = hmac.new(secret.encode("utf-8"), body, hashlib.sha256).digest()
+    return hmac.compare_digest(base64.b64encode(digest).decode("ascii"), signature)
+
+
+def split_query(text):
+    """將使用者輸入拆成多個查詢字串 (空白、逗號、頓號分隔)"""
+    return [q for q in re.split(r"[\s,，、]+", text.strip()) if q][:MAX_TICKERS_PER_MESSAGE]
+
+
+def parse_events(payload):
+    """
+    取出需要回覆的文字訊息事件 (略過 follow、貼圖等其他事件與重送的事件)
+
+    Returns:
+        list[dict]: event_id, reply_token, user_id, queries
+    """
+    events = []
+    for event in payload.get("events", []):
+        if event.get("type") != "message" or event.get("message", {}).get("type") != "text":
+            continue
+        if not event.get("replyToken"):
+            continue
+        events.append({
+            "event_id": event.get("webhookEventId"),
+            "reply_token": event["replyToken"],
+            "user_id": event.get("source", {}).get("userId"),
+            "queries": split_query(event["message"].get("text", "")),
+        })
+    return events
+
+
+def build_messages(texts):
+    """將文字轉為 LINE 訊息物件 (超過則數或長度時截斷)"""
+    messages = []
+    for text in texts[:MAX_MESSAGES_PER_REPLY]:
+        if len(text) > MAX_TEXT_LENGTH:
+            text = text[:MAX_TEXT_LENGTH - 1] + "…"
+        messages.append({"type": "text", "text": text})
+    return messages
+
+
+class LineReplySender:
+    """透過 LINE Messaging API 回覆訊息；reply token 失效時改以 push 傳送"""
+
+    def __init__(self, api_base=LINE_API_BASE, access_token=None, timeout=10):
+        self.api_base = api_base.rstrip("/")
+        self.access_token = access_token or LINE_CHANNEL_ACCESS_TOKEN
+        self.timeout = timeout
+
+    def _post(self, path, payload):
+        import requests
+        response = requests.post(
+            f"{self.api_base}{path}", json=payload, timeout=self.timeout,
+            headers={"Authorization": f"Bearer {self.access_token}"}
+        )
+        return response.status_code == 200, response.text
+
+    def send(self, reply_token, texts, user_id=None):
+        """
+        回覆一個事件
+
+        Returns:
+            (bool, str): 是否成功, 訊息
+        """
+        if not self.access_token:
+            return False, "未設定 LINE_CHANNEL_ACCESS_TOKEN"
+        messages = build_messages(texts)
+        try:
+            ok, detail = self._post("/v2/bot/message/reply", {"replyToken": reply_token, "messages": messages})
+            # 分析時間超過 reply token 的有效期限時，改用 push 送給同一位使用者
+            if not ok and user_id:
+                ok, detail = self._post("/v2/bot/message/push", {"to": user_id, "messages": messages})
+            return ok, detail
+        except Exception as e:
+            return False, str(e)
+
+
+_sender = None
+
+
+def get_reply_sender():
+    """取得目前使用的回覆器 (預設為 LineReplySender)"""
+    global _sender
+    if _sender is None:
+        _sender = LineReplySender()
+    return _sender
+
+
+def set_reply_sender(sender):
+    """替換回覆器 (需提供 send(reply_token, texts, user_id) 方法)"""
+    global _sender
+    _sender = sender
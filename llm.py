@@ -0,0 +1,53 @@
+"""
+Gemini 呼叫工具
+
+統一處理 Gemini 的限流/重試 (rate_limit) 與跨程序結果快取 (shared_cache)：
+相同 prompt 在快取有效期間內只會呼叫一次 LLM。
+"""
+import hashlib
+import os
+from settings import GOOGLE_API_KEY
+from rate_limit import guarded_call
+from shared_cache import get_shared_cache
+
+DEFAULT_MODEL = "gemini-2.5-flash"
+# LLM 結果快取秒數
+LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", 6 * 3600))
+
+
+def prompt_hash(prompt, model=DEFAULT_MODEL):
+    """計算 prompt 的雜湊值 (作為快取鍵)"""
+    return hashlib.sha256(f"{model}\n{prompt}".encode("utf-8")).hexdigest()
+
+
+def generate_text(prompt, model=DEFAULT_MODEL, use_cache=True):
+    """
+    呼叫 Gemini 產生文字
+
+    Args:
+        prompt: 提示詞
+        model: 模型名稱
+        use_cache: 是否使用跨程序快取
+
+    Returns:
+        (text, is_stale): 生成的文字，以及是否為限流時回傳的過期結果
+    """
+    from google import genai
+
+    def call():
+        client = genai.Client(api_key=GOOGLE_API_KEY)
+        response, stale = guarded_call(
+            "gemini", prompt,
+            client.models.generate_content,
+            model=model,
+            contents=prompt
+        )
+        return response.text, stale
+
+    if not use_cache:
+        return call()
+    return get_shared_cache().get_or_compute(
+        "llm", prompt_hash(prompt, model), call,
+        ttl=LLM_CACHE_TTL,
+        should_cache=lambda result: not result[1]
+    )
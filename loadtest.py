@@ -0,0 +1,339 @@
+"""
+API 壓力測試工具
+
+以替身 (stub) 取代 yfinance 與 Gemini，並注入可設定的延遲，在本機啟動 api.py，
+再以多執行緒送出 /analyze 請求，回報吞吐量、p50/p95/p99 延遲與錯誤率。
+可用來在部署前評估 worker 數、快取 TTL、延遲預算等設定的影響。
+
+請求組成：
+- 熱門股 (--hot-tickers)：多數使用者查詢同一批股票，依 --hot-ratio 的比例送出
+- 長尾股 (--tail-size)：從股票主檔與隨機代號中抽樣，幾乎不會命中快取
+- 突發流量 (--burst-every / --burst-size)：每隔一段時間同時送出大量同一檔熱門股請求
+
+用法:
+    python loadtest.py                                   # 預設 20 併發、30 秒
+    python loadtest.py --concurrency 50 --duration 60 --workers 2
+    python loadtest.py --yf-latency 0.3 --llm-latency 6 --hot-ratio 0.5
+    python loadtest.py --url http://localhost:8001       # 對已啟動的服務施壓 (不使用替身)
+
+替身伺服器仍會經過 rate_limit 的本機限流 (YFINANCE_RATE / GEMINI_RATE)，
+若要單獨觀察 API 本身的上限，可一併調高，例如：
+    YFINANCE_RATE=1000 YFINANCE_BURST=1000 GEMINI_RATE=1000 GEMINI_BURST=1000 python loadtest.py
+"""
+import argparse
+import http.client
+import json
+import os
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from urllib.parse import urlparse
+
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+# ==========================================
+# 上游替身 (在 API 子程序中安裝)
+# ==========================================
+
+def _stub_sleep(env_name):
+    """依環境變數注入延遲與錯誤"""
+    time.sleep(float(os.getenv(env_name, 0)) * random.uniform(0.8, 1.2))
+    if random.random() < float(os.getenv("LOADTEST_ERROR_RATE", 0)):
+        raise RuntimeError("stub upstream error")
+
+
+def _stub_history(ticker, period):
+    import numpy as np
+    import pandas as pd
+    days = {"2d": 2, "5d": 5, "3mo": 63, "6mo": 126, "1y": 250}.get(period, 250)
+    index = pd.bdate_range(end=pd.Timestamp.today().normalize(), periods=days)
+    rng = np.random.default_rng(abs(hash(ticker)) % (2 ** 32))
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.01, days)))
+    return pd.DataFrame({
+        "Open": close, "High": close * 1.01, "Low": close * 0.99, "Close": close,
+        "Volume": rng.integers(1_000, 100_000, days),
+    }, index=index)
+
+
+class StubTicker:
+    """yfinance.Ticker 替身"""
+
+    def __init__(self, ticker, *args, **kwargs):
+        self.ticker = ticker
+
+    def history(self, period="1mo", **kwargs):
+        _stub_sleep("LOADTEST_YF_LATENCY")
+        return _stub_history(self.ticker, period)
+
+    @property
+    def info(self):
+        _stub_sleep("LOADTEST_YF_LATENCY")
+        return {"shortName": self.ticker, "currentPrice": 100.0, "marketCap": 1e12, "trailingPE": 15.0}
+
+
+def stub_download(tickers, period="5d", **kwargs):
+    """yfinance.download 替身 (group_by="ticker" 格式)"""
+    import pandas as pd
+    _stub_sleep("LOADTEST_YF_LATENCY")
+    tickers = [tickers] if isinstance(tickers, str) else list(tickers)
+    return pd.concat({t: _stub_history(t, period) for t in tickers}, axis=1)
+
+
+class StubModels:
+    def generate_content(self, model, contents, **kwargs):
+        _stub_sleep("LOADTEST_LLM_LATENCY")
+        return type("StubResponse", (), {"text": f"[stub {model}] 分析報告 ({len(contents)} 字提示詞)"})()
+
+
+class StubClient:
+    """google.genai.Client 替身"""
+
+    def __init__(self, *args, **kwargs):
+        self.models = StubModels()
+
+
+def install_stubs():
+    """以替身取代 yfinance 與 Gemini (必須在 import api 之前呼叫)"""
+    import yfinance
+    from google import genai
+    yfinance.Ticker = StubTicker
+    yfinance.download = stub_download
+    genai.Client = StubClient
+    os.environ.setdefault("GOOGLE_API_KEY", "loadtest-stub")
+
+
+def create_stub_app():
+    """uvicorn factory：安裝替身後回傳 api.app (每個 worker 程序各自呼叫)"""
+    install_stubs()
+    sys.path.insert(0, PROJECT_DIR)
+    import api
+    return api.app
+
+
+# ==========================================
+# 啟動 API 子程序
+# ==========================================
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_stub_server(args):
+    """以替身上游啟動 uvicorn，回傳 (process, base_url)"""
+    port = free_port()
+    env = dict(os.environ)
+    workdir = tempfile.mkdtemp(prefix="loadtest-")
+    env.update({
+        "LOADTEST_YF_LATENCY": str(args.yf_latency),
+        "LOADTEST_LLM_LATENCY": str(args.llm_latency),
+        "LOADTEST_ERROR_RATE": str(args.error_rate),
+        # 每次測試使用全新的共用快取、查詢紀錄與報告歷史，避免受先前資料影響，
+        # 也避免隨機的長尾代號寫入正式的熱門度紀錄 (cache_warmer 會依此預熱)
+        "SHARED_CACHE_PATH": os.path.join(workdir, "cache.db"),
+        "REQUEST_LOG_PATH": os.path.join(workdir, "request_log.jsonl"),
+        "ANALYSIS_HISTORY_PATH": os.path.join(workdir, "analysis_history.db"),
+    })
+    cmd = [
+        sys.executable, "-m", "uvicorn", "loadtest:create_stub_app", "--factory",
+        "--host", "127.0.0.1", "--port", str(port), "--workers", str(args.workers),
+        "--log-level", "warning",
+    ]
+    process = subprocess.Popen(cmd, cwd=PROJECT_DIR, env=env)
+    base_url = f"http://127.0.0.1:{port}"
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError("API 子程序啟動失敗")
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.5).close()
+            return process, base_url
+        except OSError:
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError("等待 API 啟動逾時")
+
+
+# ==========================================
+# 請求產生與統計
+# ==========================================
+
+def build_tail_tickers(size, seed=0):
+    """長尾股票池：股票主檔 + 隨機 4 碼代號"""
+    from symbols import get_symbol_index
+    rng = random.Random(seed)
+    pool = [s.ticker for s in get_symbol_index().symbols]
+    while len(pool) < size:
+        pool.append(f"{rng.randint(1100, 9999)}.TW")
+    rng.shuffle(pool)
+    return pool[:size]
+
+
+class Recorder:
+    """收集每個請求的結果 (執行緒安全)"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = []
+        self.errors = {}
+        self.report_status = {}
+        self.kinds = {}
+
+    def add(self, kind, latency, error=None, report_status=None):
+        with self.lock:
+            self.latencies.append(latency)
+            self.kinds[kind] = self.kinds.get(kind, 0) + 1
+            if error:
+                self.errors[error] = self.errors.get(error, 0) + 1
+            if report_status:
+                self.report_status[report_status] = self.report_status.get(report_status, 0) + 1
+
+
+def send_analyze(base_url, ticker, timeout):
+    """送出一次 /analyze 請求，回傳 (error, report_status)"""
+    url = urlparse(base_url)
+    conn = http.client.HTTPConnection(url.hostname, url.port, timeout=timeout)
+    try:
+        conn.request("POST", "/analyze", body=json.dumps({"stock_id": ticker}),
+                     headers={"Content-Type": "application/json"})
+        response = conn.getresponse()
+        body = response.read()
+        if response.status != 200:
+            return f"HTTP {response.status}", None
+        data = json.loads(body)
+        if data.get("status") != "success":
+            return "status=error", None
+        return None, data.get("report_status")
+    except socket.timeout:
+        return "timeout", None
+    except Exception as e:
+        return type(e).__name__, None
+    finally:
+        conn.close()
+
+
+def timed_request(recorder, base_url, kind, ticker, timeout):
+    started = time.perf_counter()
+    error, report_status = send_analyze(base_url, ticker, timeout)
+    recorder.add(kind, time.perf_counter() - started, error, report_status)
+
+
+def worker_loop(recorder, base_url, args, hot, tail, stop_at, seed):
+    rng = random.Random(seed)
+    while time.time() < stop_at:
+        if rng.random() < args.hot_ratio:
+            timed_request(recorder, base_url, "hot", rng.choice(hot), args.timeout)
+        else:
+            timed_request(recorder, base_url, "tail", rng.choice(tail), args.timeout)
+
+
+def burst_loop(recorder, base_url, args, hot, stop_at):
+    """每隔 burst_every 秒，同時送出 burst_size 個同一檔熱門股的請求"""
+    rng = random.Random(1)
+    while time.time() + args.burst_every < stop_at:
+        time.sleep(args.burst_every)
+        ticker = rng.choice(hot)
+        threads = [threading.Thread(target=timed_request, args=(recorder, base_url, "burst", ticker, args.timeout))
+                   for _ in range(args.burst_size)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+
+def percentile(values, p):
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    k = (len(ordered) - 1) * p / 100
+    lo, hi = int(k), min(int(k) + 1, len(ordered) - 1)
+    return ordered[lo] + (ordered[hi] - ordered[lo]) * (k - lo)
+
+
+def summarize(recorder, elapsed):
+    total = len(recorder.latencies)
+    errors = sum(recorder.errors.values())
+    return {
+        "requests": total,
+        "duration": round(elapsed, 2),
+        "throughput": round(total / elapsed, 2) if elapsed else 0,
+        "p50": round(percentile(recorder.latencies, 50), 3),
+        "p95": round(percentile(recorder.latencies, 95), 3),
+        "p99": round(percentile(recorder.latencies, 99), 3),
+        "mean": round(statistics.fmean(recorder.latencies), 3) if total else None,
+        "error_rate": round(errors / total * 100, 2) if total else 0,
+        "errors": recorder.errors,
+        "report_status": recorder.report_status,
+        "mix": recorder.kinds,
+    }
+
+
+def print_summary(summary, args):
+    print(f"\n=== /analyze 壓力測試結果 ({args.concurrency} 併發, {summary['duration']} 秒) ===")
+    print(f"請求數     : {summary['requests']}  (組成 {summary['mix']})")
+    print(f"吞吐量     : {summary['throughput']} req/s")
+    print(f"延遲 (秒)  : p50 {summary['p50']}  p95 {summary['p95']}  p99 {summary['p99']}  平均 {summary['mean']}")
+    print(f"錯誤率     : {summary['error_rate']}%  {summary['errors'] or ''}")
+    print(f"報告狀態   : {summary['report_status']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="api.py 壓力測試 (替身上游)")
+    parser.add_argument("--url", help="對已啟動的服務施壓 (不啟動替身伺服器)")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn worker 數")
+    parser.add_argument("--concurrency", type=int, default=20, help="同時進行的請求數")
+    parser.add_argument("--duration", type=float, default=30, help="測試秒數")
+    parser.add_argument("--timeout", type=float, default=30, help="單一請求逾時秒數")
+    parser.add_argument("--yf-latency", type=float, default=0.2, help="yfinance 替身延遲 (秒)")
+    parser.add_argument("--llm-latency", type=float, default=3.0, help="Gemini 替身延遲 (秒)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="替身上游錯誤比例 (0~1)")
+    parser.add_argument("--hot-tickers", default="2330,2454,0050,2317", help="熱門股 (逗號分隔)")
+    parser.add_argument("--hot-ratio", type=float, default=0.8, help="熱門股請求比例")
+    parser.add_argument("--tail-size", type=int, default=500, help="長尾股票池大小")
+    parser.add_argument("--burst-every", type=float, default=0, help="突發流量間隔秒數 (0 表示關閉)")
+    parser.add_argument("--burst-size", type=int, default=50, help="每次突發的請求數")
+    parser.add_argument("--json", action="store_true", help="以 JSON 輸出結果")
+    args = parser.parse_args()
+
+    process = None
+    base_url = args.url
+    if not base_url:
+        process, base_url = start_stub_server(args)
+        print(f"已啟動替身 API: {base_url} (workers={args.workers}, "
+              f"yfinance {args.yf_latency}s, Gemini {args.llm_latency}s, 錯誤率 {args.error_rate})")
+
+    try:
+        hot = [t.strip() for t in args.hot_tickers.split(",") if t.strip()]
+        tail = build_tail_tickers(args.tail_size)
+        recorder = Recorder()
+        started = time.time()
+        stop_at = started + args.duration
+        threads = [threading.Thread(target=worker_loop, args=(recorder, base_url, args, hot, tail, stop_at, i))
+                   for i in range(args.concurrency)]
+        if args.burst_every > 0:
+            threads.append(threading.Thread(target=burst_loop, args=(recorder, base_url, args, hot, stop_at)))
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        summary = summarize(recorder, time.time() - started)
+        if args.json:
+            print(json.dumps(summary, ensure_ascii=False))
+        else:
+            print_summary(summary, args)
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait(timeout=10)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,205 @@
+"""
+均值-變異數最佳化與效率前緣
+
+只使用 NumPy (不依賴外部求解器)：以加速投影梯度法 (FISTA) 求解
+    min 0.5 * w'Σw - t * μ'w    s.t. sum(w) = 1, 0 <= w <= 最大權重
+t = 0 為最小變異數組合；掃描不同的 t 即得到效率前緣，並從中挑出 Sharpe 最高的組合。
+30 檔以上持股也能在互動操作中即時重算。
+"""
+import os
+import numpy as np
+import pandas as pd
+from portfolio_risk import load_close_prices, BENCHMARK, RISK_LOOKBACK, TRADING_DAYS
+
+RISK_FREE_RATE = float(os.getenv("RISK_FREE_RATE", 0.015))
+DEFAULT_MAX_WEIGHT = 0.4
+FRONTIER_POINTS = 40
+
+
+def project_capped_simplex(v, cap):
+    """
+    將向量投影到 {w | sum(w) = 1, 0 <= w <= cap}
+
+    求平移量 tau 使 clip(v - tau, 0, cap) 的總和為 1：總和是 tau 的遞減分段線性函數，
+    轉折點為 v 與 v - cap，找到夾住 1 的相鄰轉折點後線性內插即為精確解
+    """
+    breakpoints = np.sort(np.concatenate((v - cap, v)))
+    totals = np.clip(v[None, :] - breakpoints[:, None], 0, cap).sum(axis=1)
+    k = min(np.searchsorted(-totals, -1.0, side="right") - 1, len(breakpoints) - 2)
+    k = max(k, 0)
+    span = totals[k] - totals[k + 1]
+    tau = breakpoints[k] + (totals[k] - 1.0) / span * (breakpoints[k + 1] - breakpoints[k]) if span > 0 else breakpoints[k]
+    return np.clip(v - tau, 0, cap)
+
+
+def solve_mean_variance(mu, cov, t, cap, w0=None, max_iter=2000, tol=1e-10):
+    """
+    求解 min 0.5 * w'Σw - t * μ'w (長部位、單一持股上限 cap)
+
+    Args:
+        mu: 年化預期報酬向量
+        cov: 年化共變異數矩陣
+        t: 報酬偏好 (0 為最小變異數)
+        cap: 單一持股權重上限
+        w0: 初始權重 (warm start)
+
+    Returns:
+        np.ndarray: 最佳權重
+    """
+    n = len(mu)
+    step = 1.0 / max(np.linalg.eigvalsh(cov)[-1], 1e-12)
+    w = project_capped_simplex(np.full(n, 1.0 / n) if w0 is None else w0, cap)
+    y, momentum = w.copy(), 1.0
+    for _ in range(max_iter):
+        w_next = project_capped_simplex(y - step * (cov @ y - t * mu), cap)
+        momentum_next = (1 + np.sqrt(1 + 4 * momentum ** 2)) / 2
+        y = w_next + (momentum - 1) / momentum_next * (w_next - w)
+        if np.abs(w_next - w).max() < tol:
+            w = w_next
+            break
+        w, momentum = w_next, momentum_next
+    return w
+
+
+def efficient_frontier(mu, cov, cap, points=FRONTIER_POINTS, risk_free=RISK_FREE_RATE):
+    """
+    計算效率前緣
+
+    Returns:
+        frontier (pd.DataFrame): T (報酬偏好) / Return / Volatility / Sharpe (年化，小數)
+        weights (np.ndarray): (points, n) 每個前緣點的權重
+    """
+    # 權重上限下可達到的最高報酬：依預期報酬由高到低填滿上限
+    greedy = np.zeros(len(mu))
+    remaining = 1.0
+    for i in np.argsort(-mu):
+        greedy[i] = min(cap, remaining)
+        remaining -= greedy[i]
+    max_return = greedy @ mu
+
+    # t 的尺度：讓報酬項與變異數項大小相當，從最小變異數掃到最高報酬為止
+    scale = np.trace(cov) / len(mu) / max(np.abs(mu).mean(), 1e-6)
+    ts = np.concatenate(([0.0], scale * np.geomspace(1e-3, 1e3, points - 1)))
+    weights = []
+    used = []
+    w = None
+    for t in ts:
+        w = solve_mean_variance(mu, cov, t, cap, w0=w)
+        weights.append(w)
+        used.append(t)
+        if w @ mu >= max_return - 1e-6 * max(abs(max_return), 1.0):
+            break
+    weights = np.array(weights)
+    frontier = _frontier_table(weights, mu, cov, risk_free)
+    frontier.insert(0, "T", used)
+    return frontier, weights
+
+
+def _frontier_table(weights, mu, cov, risk_free):
+    returns = weights @ mu
+    vols = np.sqrt(np.einsum("ij,jk,ik->i", weights, cov, weights))
+    return pd.DataFrame({
+        "Return": returns,
+        "Volatility": vols,
+        "Sharpe": (returns - risk_free) / vols,
+    })
+
+
+def max_sharpe_portfolio(mu, cov, cap, frontier, weights, risk_free=RISK_FREE_RATE, iterations=12):
+    """
+    從效率前緣上 Sharpe 最高的點出發，在相鄰兩點之間以黃金分割搜尋 t 細化最大 Sharpe 組合
+    (Sharpe 沿效率前緣為單峰函數)
+    """
+    best = int(frontier["Sharpe"].idxmax())
+    lo = frontier["T"].iloc[max(best - 1, 0)]
+    hi = frontier["T"].iloc[min(best + 1, len(frontier) - 1)]
+    best_w, best_sharpe = weights[best], frontier["Sharpe"].iloc[best]
+    ratio = (np.sqrt(5) - 1) / 2
+
+    def sharpe_at(t):
+        w = solve_mean_variance(mu, cov, t, cap, w0=weights[best])
+        return (w @ mu - risk_free) / np.sqrt(w @ cov @ w), w
+
+    for _ in range(iterations if hi > lo else 0):
+        a, b = hi - ratio * (hi - lo), lo + ratio * (hi - lo)
+        (sa, wa), (sb, wb) = sharpe_at(a), sharpe_at(b)
+        for s, w in ((sa, wa), (sb, wb)):
+            if s > best_sharpe:
+                best_sharpe, best_w = s, w
+        if sa >= sb:
+            hi = b
+        else:
+            lo = a
+    return best_w
+
+
+def estimate_inputs(closes, tickers):
+    """由收盤價估計年化預期報酬與共變異數"""
+    returns = closes[tickers].pct_change().dropna()
+    if len(returns) < 20:
+        raise ValueError("共同交易日不足，無法進行最佳化")
+    mu = returns.mean().to_numpy() * TRADING_DAYS
+    cov = np.cov(returns.to_numpy(), rowvar=False).reshape(len(tickers), len(tickers)) * TRADING_DAYS
+    return mu, cov
+
+
+def optimize_portfolio(holdings, max_weight=DEFAULT_MAX_WEIGHT, period=RISK_LOOKBACK, risk_free=RISK_FREE_RATE):
+    """
+    計算目前持股的效率前緣、最小變異數與最大 Sharpe 組合，以及再平衡建議
+
+    Args:
+        holdings: [(ticker, 比例)]，見 portfolio_risk.parse_holdings
+        max_weight: 單一持股權重上限 (0~1)
+        period: 估計報酬與共變異數的歷史資料長度
+        risk_free: 無風險利率 (年化)
+
+    Returns:
+        rebalance_df (pd.DataFrame): 各持股目前權重、最小變異數、最大 Sharpe 權重與建議調整
+        result (dict): frontier、各組合的報酬/波動率；失敗時含 "error"
+    """
+    if not holdings:
+        return None, {"error": "沒有有效的持股資料"}
+    try:
+        tickers = [t for t, _ in holdings]
+        # 與風險分析請求相同的代號組合 (含大盤基準)，共用同一份收盤價快取，不重複下載
+        closes, stale = load_close_prices(tickers + [BENCHMARK], period)
+        closes = closes[[t for t in closes.columns if t in tickers]]
+        missing = [t for t in tickers if t not in closes.columns or closes[t].dropna().empty]
+        tickers = [t for t in tickers if t not in missing]
+        if len(tickers) < 2:
+            return None, {"error": "至少需要兩檔有歷史數據的持股才能最佳化"}
+
+        # 權重上限過低時無法滿足總和為 1，放寬為平均權重
+        cap = max(max_weight, 1.0 / len(tickers))
+        mu, cov = estimate_inputs(closes.dropna(how="all"), tickers)
+        current = np.array([w for t, w in holdings if t in tickers], dtype=float)
+        current = current / current.sum()
+
+        frontier, weights = efficient_frontier(mu, cov, cap, risk_free=risk_free)
+        min_var = weights[0]
+        max_sharpe = max_sharpe_portfolio(mu, cov, cap, frontier, weights, risk_free)
+
+        def point(w):
+            ret, vol = float(w @ mu), float(np.sqrt(w @ cov @ w))
+            return {"return": ret, "volatility": vol, "sharpe": (ret - risk_free) / vol}
+
+        rebalance_df = pd.DataFrame({
+            "股票代號": tickers,
+            "目前權重(%)": current * 100,
+            "最小變異數(%)": min_var * 100,
+            "最大 Sharpe(%)": max_sharpe * 100,
+        })
+        rebalance_df["建議調整(%)"] = rebalance_df["最大 Sharpe(%)"] - rebalance_df["目前權重(%)"]
+
+        return rebalance_df, {
+            "frontier": frontier,
+            "current": point(current),
+            "min_variance": point(min_var),
+            "max_sharpe": point(max_sharpe),
+            "max_weight": cap,
+            "risk_free": risk_free,
+            "missing": missing,
+            "stale": stale,
+        }
+    except Exception as e:
+        return None, {"error": str(e)}
@@ -0,0 +1,201 @@
+"""
+投資組合風險引擎
+
+以持股的對齊日報酬序列計算：
+- 共變異數 / 相關係數矩陣、投資組合年化波動率
+- 歷史法與參數法 (常態) 的單日 VaR / CVaR
+- 相對於 0050 的 Beta
+- 各持股的風險貢獻 (Euler 分解)
+所有計算皆以 NumPy 向量化完成，結果依 (持股, 最後一根 K 棒) 快取。
+"""
+from statistics import NormalDist
+import numpy as np
+import pandas as pd
+from rate_limit import guarded_call
+from shared_cache import get_shared_cache
+from cache_policy import cache_ttl
+from symbols import normalize_ticker
+
+BENCHMARK = "0050.TW"
+RISK_LOOKBACK = "1y"
+CONFIDENCE = 0.95
+TRADING_DAYS = 252
+
+# 風險結果以最後一根 K 棒為鍵，可保留較久 (收盤價的快取秒數見 cache_policy)
+RISK_CACHE_TTL = 24 * 3600
+
+
+def parse_holdings(df):
+    """
+    將投資組合表格整理為 [(ticker, 比例)]，合併重複代號並略過空白列
+
+    Args:
+        df: 含「股票代號」與「持有比例(%)」欄位的 DataFrame
+    """
+    holdings = {}
+    for _, row in df.iterrows():
+        ticker = row.get("股票代號")
+        weight = pd.to_numeric(row.get("持有比例(%)"), errors="coerce")
+        if not isinstance(ticker, str) or not ticker.strip() or pd.isna(weight) or weight <= 0:
+            continue
+        ticker = normalize_ticker(ticker)
+        holdings[ticker] = holdings.get(ticker, 0.0) + float(weight)
+    return sorted(holdings.items())
+
+
+def load_close_prices(tickers, period=RISK_LOOKBACK):
+    """
+    以單次 yf.download 取得多檔股票的收盤價 (跨程序快取)
+
+    Returns:
+        (closes, stale): 以日期為索引、代號為欄位的收盤價，以及是否為過期資料
+    """
+    import yfinance as yf
+    tickers = sorted(set(tickers))
+
+    def fetch():
+        data, stale = guarded_call(
+            "yfinance", ("download", tuple(tickers), period),
+            yf.download, tickers,
+            period=period, auto_adjust=True, progress=False, threads=True
+        )
+        closes = data["Close"]
+        if isinstance(closes, pd.Series):
+            closes = closes.to_frame(tickers[0])
+        return closes, stale
+
+    return get_shared_cache().get_or_compute(
+        "closes", (tuple(tickers), period), fetch,
+        ttl=cache_ttl("bars"),
+        should_cache=lambda result: not result[1] and not result[0].empty
+    )
+
+
+def compute_risk_metrics(closes, weights, benchmark=BENCHMARK, confidence=CONFIDENCE):
+    """
+    由收盤價計算投資組合風險指標 (純計算，不抓資料)
+
+    Args:
+        closes: 收盤價 DataFrame (欄位需包含 weights 的所有代號，可選擇包含 benchmark)
+        weights: dict ticker -> 權重 (會自動正規化為總和 1)
+        benchmark: 計算 Beta 的基準代號
+        confidence: VaR / CVaR 信賴水準
+
+    Returns:
+        holdings_df (pd.DataFrame): 各持股的權重、年化波動率、Beta、風險貢獻
+        metrics (dict): 投資組合層級指標與相關係數矩陣 (correlation)
+    """
+    tickers = list(weights)
+    columns = tickers + ([benchmark] if benchmark in closes.columns and benchmark not in tickers else [])
+    returns = closes[columns].pct_change().dropna()
+    if len(returns) < 20:
+        raise ValueError("共同交易日不足，無法計算風險指標")
+
+    w = np.array([weights[t] for t in tickers], dtype=float)
+    w = w / w.sum()
+    R = returns[tickers].to_numpy()
+
+    # 共變異數 (年化) 與相關係數
+    cov = np.cov(R, rowvar=False).reshape(len(tickers), len(tickers)) * TRADING_DAYS
+    std = np.sqrt(np.diag(cov))
+    corr = cov / np.outer(std, std)
+    port_vol = float(np.sqrt(w @ cov @ w))
+
+    # 單日 VaR / CVaR (以正數表示損失比例)
+    port_daily = R @ w
+    var_hist = -np.quantile(port_daily, 1 - confidence)
+    tail = port_daily[port_daily <= -var_hist]
+    cvar_hist = -tail.mean() if len(tail) else var_hist
+    mu, sigma = port_daily.mean(), port_daily.std(ddof=1)
+    z = NormalDist().inv_cdf(confidence)
+    var_param = -(mu - z * sigma)
+    cvar_param = -(mu - sigma * NormalDist().pdf(z) / (1 - confidence))
+
+    # Beta：各持股與基準的共變異數 / 基準變異數
+    betas = np.full(len(tickers), np.nan)
+    port_beta = None
+    if benchmark in returns.columns:
+        b = returns[benchmark].to_numpy()
+        b_centered = b - b.mean()
+        betas = ((R - R.mean(axis=0)).T @ b_centered) / (b_centered @ b_centered)
+        port_beta = float(w @ betas)
+
+    # 風險貢獻：w_i * (Σw)_i / σ_p，總和等於投資組合波動率
+    contribution = w * (cov @ w) / port_vol
+
+    holdings_df = pd.DataFrame({
+        "股票代號": tickers,
+        "權重(%)": w * 100,
+        "年化波動率(%)": std * 100,
+        "Beta": betas,
+        "風險貢獻(%)": contribution / port_vol * 100,
+    })
+    metrics = {
+        "volatility": port_vol * 100,
+        "var_hist": var_hist * 100,
+        "cvar_hist": cvar_hist * 100,
+        "var_param": var_param * 100,
+        "cvar_param": cvar_param * 100,
+        "beta": port_beta,
+        "confidence": confidence,
+        "observations": len(returns),
+        "start": returns.index[0].strftime("%Y-%m-%d"),
+        "end": returns.index[-1].strftime("%Y-%m-%d"),
+        "correlation": pd.DataFrame(corr, index=tickers, columns=tickers),
+    }
+    return holdings_df, metrics
+
+
+def analyze_portfolio_risk(holdings, period=RISK_LOOKBACK, benchmark=BENCHMARK):
+    """
+    計算投資組合風險 (依持股與最後一根 K 棒快取)
+
+    Args:
+        holdings: [(ticker, 比例)]，見 parse_holdings
+
+    Returns:
+        holdings_df (pd.DataFrame): 各持股風險資料，失敗時為 None
+        metrics (dict): 風險指標；失敗時含 "error"
+    """
+    if not holdings:
+        return None, {"error": "沒有有效的持股資料"}
+    try:
+        tickers = [t for t, _ in holdings]
+        closes, stale = load_close_prices(tickers + [benchmark], period)
+        missing = [t for t in tickers if t not in closes.columns or closes[t].dropna().empty]
+        weights = {t: w for t, w in holdings if t not in missing}
+        if not weights:
+            return None, {"error": "無法獲取持股的歷史數據"}
+
+        closes = closes.dropna(how="all")
+        key = (tuple(sorted(weights.items())), period, benchmark, str(closes.index[-1]))
+        holdings_df, metrics = get_shared_cache().get_or_compute(
+            "risk", key, lambda: compute_risk_metrics(closes, weights, benchmark),
+            ttl=RISK_CACHE_TTL
+        )
+        metrics = {**metrics, "missing": missing, "stale": stale}
+        return holdings_df, metrics
+    except Exception as e:
+        return None, {"error": str(e)}
+
+
+def format_risk_summary(holdings_df, metrics):
+    """將風險指標轉為文字 (供 AI prompt 使用)"""
+    level = int(metrics["confidence"] * 100)
+    beta = f"{metrics['beta']:.2f}" if metrics["beta"] is not None else "N/A"
+    lines = [
+        f"- 資料期間：{metrics['start']} ~ {metrics['end']} ({metrics['observations']} 個交易日)",
+        f"- 投資組合年化波動率：{metrics['volatility']:.2f}%",
+        f"- 單日 {level}% VaR：歷史法 {metrics['var_hist']:.2f}% / 參數法 {metrics['var_param']:.2f}%",
+        f"- 單日 {level}% CVaR：歷史法 {metrics['cvar_hist']:.2f}% / 參數法 {metrics['cvar_param']:.2f}%",
+        f"- 相對 {BENCHMARK} 的 Beta：{beta}",
+        "- 各持股 (權重 / 風險貢獻 / Beta)：" + "、".join(
+            f"{row['股票代號']} {row['權重(%)']:.1f}% / {row['風險貢獻(%)']:.1f}% / {row['Beta']:.2f}"
+            for _, row in holdings_df.iterrows()
+        ),
+    ]
+    corr = metrics["correlation"].to_numpy()
+    if len(corr) > 1:
+        upper = corr[np.triu_indices(len(corr), k=1)]
+        lines.append(f"- 持股間平均相關係數：{upper.mean():.2f} (最高 {upper.max():.2f})")
+    return "\n".join(lines)
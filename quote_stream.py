@@ -0,0 +1,88 @@
+"""
+即時行情推播中心
+
+每個被訂閱的股票代號只會有一個上游輪詢工作 (poller)，不論有多少訂閱者；
+輪詢到的新報價會同時推送給所有訂閱者。最後一位訂閱者離開後即停止輪詢。
+輪詢間隔依台股交易時段調整 (見 trading_calendar.poll_interval)。
+"""
+import asyncio
+import time
+from trading_calendar import poll_interval
+
+# 每個訂閱者佇列的容量 (消費太慢時丟棄最舊的報價)
+SUBSCRIBER_QUEUE_SIZE = 100
+
+
+class QuoteHub:
+    """管理各股票的輪詢工作與訂閱者"""
+
+    def __init__(self, fetch_quote, interval_fn=poll_interval):
+        """
+        Args:
+            fetch_quote: 同步抓取函數，接收 ticker 回傳報價 dict
+            interval_fn: 回傳目前輪詢間隔 (秒) 的函數
+        """
+        self.fetch_quote = fetch_quote
+        self.interval_fn = interval_fn
+        self.subscribers = {}   # ticker -> set(asyncio.Queue)
+        self.pollers = {}       # ticker -> asyncio.Task
+        self.latest = {}        # ticker -> 最新報價
+
+    def new_queue(self):
+        return asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+
+    def subscribe(self, ticker, queue):
+        """訂閱股票報價；若已有最新報價會立即推送一次"""
+        self.subscribers.setdefault(ticker, set()).add(queue)
+        if ticker in self.latest:
+            self._deliver(queue, self.latest[ticker])
+        if ticker not in self.pollers:
+            self.pollers[ticker] = asyncio.create_task(self._poll(ticker))
+
+    def unsubscribe(self, ticker, queue):
+        """取消訂閱；沒有訂閱者時停止該股票的輪詢"""
+        subs = self.subscribers.get(ticker)
+        if not subs:
+            return
+        subs.discard(queue)
+        if not subs:
+            del self.subscribers[ticker]
+            task = self.pollers.pop(ticker, None)
+            if task:
+                task.cancel()
+            self.latest.pop(ticker, None)
+
+    def stats(self):
+        """回傳各股票的訂閱者數量"""
+        return {ticker: len(subs) for ticker, subs in self.subscribers.items()}
+
+    @staticmethod
+    def _deliver(queue, message):
+        if queue.full():
+            try:
+                queue.get_nowait()
+            except asyncio.QueueEmpty:
+                pass
+        queue.put_nowait(message)
+
+    def _broadcast(self, ticker, message):
+        for queue in list(self.subscribers.get(ticker, ())):
+            self._deliver(queue, message)
+
+    async def _poll(self, ticker):
+        """單一股票的輪詢迴圈，只在報價變動時推播"""
+        last_key = None
+        while ticker in self.subscribers:
+            try:
+                quote = await asyncio.to_thread(self.fetch_quote, ticker)
+                key = (quote.get("status"), quote.get("close"), quote.get("change"))
+                if key != last_key:
+                    last_key = key
+                    message = {"type": "quote", "ticker": ticker, "time": time.time(), **quote}
+                    self.latest[ticker] = message
+                    self._broadcast(ticker, message)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self._broadcast(ticker, {"type": "error", "ticker": ticker, "message": str(e)})
+            await asyncio.sleep(self.interval_fn())
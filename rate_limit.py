@@ -0,0 +1,173 @@
+"""
+上游服務限流與重試工具
+
+為 yfinance 與 Gemini 提供程序層級 (process-wide) 的 token bucket 限流、
+指數退避 + 隨機抖動 (jitter) 的重試，以及在上游持續限流時回傳最近一次
+成功結果 (標記為過期資料) 的備援機制。
+"""
+import os
+import random
+import threading
+import time
+from collections import OrderedDict
+
+# 各上游的限流設定: (每秒補充 token 數, bucket 容量)
+UPSTREAM_LIMITS = {
+    "yfinance": (float(os.getenv("YFINANCE_RATE", 2.0)), int(os.getenv("YFINANCE_BURST", 5))),
+    "gemini": (float(os.getenv("GEMINI_RATE", 0.5)), int(os.getenv("GEMINI_BURST", 2))),
+}
+
+# 重試設定
+MAX_RETRIES = int(os.getenv("UPSTREAM_MAX_RETRIES", 3))
+BASE_DELAY = float(os.getenv("UPSTREAM_BASE_DELAY", 0.5))   # 第一次重試的基準等待秒數
+MAX_DELAY = float(os.getenv("UPSTREAM_MAX_DELAY", 8.0))     # 單次等待上限
+ACQUIRE_TIMEOUT = float(os.getenv("UPSTREAM_ACQUIRE_TIMEOUT", 10.0))  # 等待 token 的上限
+
+# 最近一次成功結果的保留筆數 (供限流時回傳過期資料)
+STALE_CACHE_SIZE = 512
+
+# 顯示給使用者的過期資料提示
+STALE_NOTICE = "⚠️ 上游服務限流中，以下為最近一次成功取得的快取資料"
+
+# 判斷為限流錯誤的關鍵字 (yfinance: YFRateLimitError / HTTP 429；Gemini: RESOURCE_EXHAUSTED)
+THROTTLE_MARKERS = ("429", "too many requests", "rate limit", "resource_exhausted", "quota")
+
+
+class UpstreamThrottled(Exception):
+    """上游持續限流且沒有可用的快取資料"""
+
+
+class TokenBucket:
+    """執行緒安全的 token bucket 限流器"""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self, timeout=None):
+        """
+        取得一個 token，必要時等待
+
+        Args:
+            timeout: 最長等待秒數 (None 表示無限等待)
+
+        Returns:
+            bool: 是否成功取得 token
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return True
+                wait = (1 - self.tokens) / self.rate
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                wait = min(wait, remaining)
+            time.sleep(wait)
+
+
+_buckets = {name: TokenBucket(rate, burst) for name, (rate, burst) in UPSTREAM_LIMITS.items()}
+_last_good = OrderedDict()
+_last_good_lock = threading.Lock()
+
+
+def is_throttle_error(exc):
+    """判斷例外是否為上游限流造成"""
+    if type(exc).__name__ == "YFRateLimitError":
+        return True
+    message = str(exc).lower()
+    return any(marker in message for marker in THROTTLE_MARKERS)
+
+
+def backoff_delay(attempt):
+    """計算第 attempt 次重試前的等待秒數 (指數退避 + full jitter)"""
+    return random.uniform(0, min(MAX_DELAY, BASE_DELAY * (2 ** attempt)))
+
+
+def _remember(key, value):
+    with _last_good_lock:
+        _last_good[key] = value
+        _last_good.move_to_end(key)
+        while len(_last_good) > STALE_CACHE_SIZE:
+            _last_good.popitem(last=False)
+
+
+def _recall(key):
+    with _last_good_lock:
+        if key in _last_good:
+            return True, _last_good[key]
+    return False, None
+
+
+def guarded_call(upstream, cache_key, fn, *args, **kwargs):
+    """
+    透過限流器呼叫上游，限流時以指數退避重試，仍失敗則回傳過期快取
+    (等待 token 超過 UPSTREAM_ACQUIRE_TIMEOUT 秒時視為本地限流)
+
+    Args:
+        upstream: 上游名稱 ("yfinance" 或 "gemini")
+        cache_key: 結果快取鍵 (None 表示不保留結果、也不使用過期資料)
+        fn: 實際呼叫上游的函數
+        *args, **kwargs: 傳給 fn 的參數
+
+    Returns:
+        (result, is_stale): 呼叫結果，以及是否為限流時回傳的過期資料
+
+    Raises:
+        UpstreamThrottled: 持續限流且沒有快取可用
+        其他例外: 非限流錯誤直接向上拋出
+    """
+    return _guarded_call(upstream, cache_key, fn, args, kwargs, ACQUIRE_TIMEOUT)
+
+
+def queued_call(upstream, cache_key, fn, *args, **kwargs):
+    """
+    與 guarded_call 相同，但一律排隊等到 token 為止 (不因本地等待逾時而失敗)
+
+    供已知請求總數、會一次送出大量請求的批次工作使用 (例如同業比較、快取預熱)，
+    總耗時取決於設定的速率
+    """
+    return _guarded_call(upstream, cache_key, fn, args, kwargs, None)
+
+
+def burst_size(upstream):
+    """上游 bucket 容量 (可同時送出而不需等待的請求數)"""
+    return _buckets[upstream].capacity
+
+
+def _guarded_call(upstream, cache_key, fn, args, kwargs, acquire_timeout):
+    bucket = _buckets[upstream]
+    key = (upstream, cache_key)
+    last_error = None
+
+    for attempt in range(MAX_RETRIES + 1):
+        if not bucket.acquire(timeout=acquire_timeout):
+            last_error = UpstreamThrottled(f"{upstream} 本地限流等待逾時")
+            break
+        try:
+            result = fn(*args, **kwargs)
+        except Exception as e:
+            if not is_throttle_error(e):
+                raise
+            last_error = e
+            if attempt < MAX_RETRIES:
+                time.sleep(backoff_delay(attempt))
+            continue
+        if cache_key is not None:
+            _remember(key, result)
+        return result, False
+
+    if cache_key is not None:
+        found, value = _recall(key)
+        if found:
+            return value, True
+    raise UpstreamThrottled(f"{upstream} 服務限流中，請稍後再試 ({last_error})") from last_error
@@ -0,0 +1,114 @@
+"""
+每日報告產出物 (artifact) 存放區
+
+Streamlit 日報頁面、daily_report.py 排程與 API /analyze 共用同一份報告：
+以 (觀察名單雜湊, 交易日, 資料版本) 為鍵，存放行情表、AI 文字與 Email 內文。
+同一交易日內第一個請求負責產生 (跨程序只會計算一次)，之後的請求直接讀取。
+試撮到盤後定價交易結束前行情仍在變動，改以當天的盤中鍵與較短的 TTL 存放；
+行情確定後的報告保留到下一次試撮開始 (有效期限見 cache_policy)。
+"""
+import datetime
+import hashlib
+import time
+from rate_limit import STALE_NOTICE
+from shared_cache import get_shared_cache
+from symbols import normalize_ticker
+from trading_calendar import TW_TZ, now_tw, last_closed_trading_date, is_data_settled
+from cache_policy import cache_ttl
+
+# 報告格式或 prompt 變更時遞增，舊的產出物即自動失效
+REPORT_DATA_VERSION = "1"
+
+
+def normalize_watchlist(tickers):
+    """正規化觀察名單：補上市場後綴、去除重複並排序 (順序不同視為同一份名單)"""
+    return sorted({normalize_ticker(t) for t in tickers if t and t.strip()})
+
+
+def watchlist_hash(tickers):
+    """觀察名單的雜湊值"""
+    return hashlib.sha1(",".join(normalize_watchlist(tickers)).encode("utf-8")).hexdigest()[:16]
+
+
+def report_key(tickers, now=None):
+    """
+    計算報告的快取鍵
+
+    Returns:
+        (key, ttl, trading_date): key 為 (名單雜湊, 交易日, 資料版本)
+    """
+    now = now or now_tw()
+    if is_data_settled(now):
+        trading_date = last_closed_trading_date(now).isoformat()
+    else:
+        trading_date = f"{now.date().isoformat()}-intraday"
+    return (watchlist_hash(tickers), trading_date, REPORT_DATA_VERSION), cache_ttl("report", now), trading_date
+
+
+def build_artifact(tickers, trading_date, market_data, report):
+    """組合報告產出物 (含 Email 主旨與內文)"""
+    return {
+        "tickers": normalize_watchlist(tickers),
+        "trading_date": trading_date,
+        "market_data": market_data,
+        "report": report,
+        "subject": f"📊 台股每日 AI 摘要 ({trading_date.replace('-intraday', ' 盤中')})",
+        "body": f"{market_data}\n\n{report}",
+        "generated_at": time.time(),
+        "version": REPORT_DATA_VERSION,
+    }
+
+
+def is_complete(artifact):
+    """行情與 AI 報告都成功 (非限流的過期結果) 才值得共用"""
+    report = artifact["report"]
+    return (
+        bool(artifact["market_data"].strip())
+        and "獲取失敗" not in artifact["market_data"]
+        and "(延遲資料)" not in artifact["market_data"]
+        and not report.startswith(("錯誤", "AI 生成失敗", STALE_NOTICE))
+    )
+
+
+def load_report(tickers):
+    """讀取已存在的報告，沒有時回傳 None"""
+    key, _, _ = report_key(tickers)
+    return get_shared_cache().get("report", key)
+
+
+def save_report(tickers, market_data, report):
+    """
+    儲存已產生的報告 (例如 /analyze 自行取得行情與 AI 文字後)
+
+    Returns:
+        dict: 報告產出物 (失敗的報告不會寫入快取)
+    """
+    key, ttl, trading_date = report_key(tickers)
+    artifact = build_artifact(tickers, trading_date, market_data, report)
+    if is_complete(artifact):
+        get_shared_cache().set("report", key, artifact, ttl=ttl)
+    return artifact
+
+
+def get_or_create_report(tickers):
+    """
+    取得觀察名單今日的報告；尚未產生時抓取行情並呼叫 AI (跨程序只會執行一次)
+
+    Returns:
+        dict: tickers, trading_date, market_data, report, subject, body, generated_at, version
+    """
+    from daily_report import get_market_summary, format_market_summary, generate_ai_report
+
+    tickers = normalize_watchlist(tickers)
+    key, ttl, trading_date = report_key(tickers)
+
+    def create():
+        market_data = format_market_summary(get_market_summary(tickers))
+        return build_artifact(tickers, trading_date, market_data, generate_ai_report(market_data))
+
+    return get_shared_cache().get_or_compute("report", key, create, ttl=ttl, should_cache=is_complete)
+
+
+def format_generated_at(artifact):
+    """報告產生時間 (台北時間)"""
+    return datetime.datetime.fromtimestamp(artifact["generated_at"], TW_TZ).strftime("%Y-%m-%d %H:%M")
@@ -0,0 +1,99 @@
+"""
+股票查詢紀錄 (熱門度統計)
+
+API 與網頁的每次查詢都以一行精簡 JSON ({"t": 時間, "k": 代號, "s": 來源}) 附加到本地檔案，
+供 cache_warmer.py 依近期熱門度排序、在收盤後與開盤前預先抓取資料。
+- 以 O_APPEND 寫入單行，多個程序同時寫入也不會交錯
+- 檔案超過上限時輪替為 .1 (只保留一份舊檔)
+- 紀錄失敗不影響查詢本身
+"""
+import json
+import math
+import os
+import threading
+import time
+
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_PATH = os.getenv("REQUEST_LOG_PATH", os.path.join(PROJECT_DIR, ".cache", "request_log.jsonl"))
+MAX_BYTES = int(float(os.getenv("REQUEST_LOG_MAX_MB", 20)) * 1024 * 1024)
+
+# 熱門度的半衰期 (天)：越近期的查詢權重越高
+POPULARITY_HALF_LIFE_DAYS = 2.0
+
+_lock = threading.Lock()
+
+
+def log_request(ticker, source, path=DEFAULT_PATH):
+    """
+    記錄一次股票查詢
+
+    Args:
+        ticker: 已正規化的股票代號
+        source: 來源 (例如 "api", "line", "stock", "dca")
+    """
+    line = json.dumps({"t": round(time.time(), 1), "k": ticker, "s": source}, ensure_ascii=False) + "\n"
+    try:
+        with _lock:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            if os.path.exists(path) and os.path.getsize(path) > MAX_BYTES:
+                os.replace(path, f"{path}.1")
+            fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                os.write(fd, line.encode("utf-8"))
+            finally:
+                os.close(fd)
+    except OSError as e:
+        print(f"查詢紀錄寫入失敗: {e}")
+
+
+def log_requests(tickers, source, path=DEFAULT_PATH):
+    """記錄多檔股票的查詢 (例如批次分析)"""
+    for ticker in tickers:
+        log_request(ticker, source, path)
+
+
+def read_requests(since=None, path=DEFAULT_PATH):
+    """
+    讀取查詢紀錄 (含輪替的舊檔)
+
+    Args:
+        since: 只回傳此時間戳記之後的紀錄
+
+    Yields:
+        dict: {"t", "k", "s"}
+    """
+    for file_path in (f"{path}.1", path):
+        if not os.path.exists(file_path):
+            continue
+        with open(file_path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue  # 寫入中斷的不完整行
+                if since is None or record["t"] >= since:
+                    yield record
+
+
+def rank_tickers(days=7, top_n=30, half_life_days=POPULARITY_HALF_LIFE_DAYS, now=None, path=DEFAULT_PATH):
+    """
+    依近期查詢熱門度排序股票
+
+    Args:
+        days: 統計的天數
+        top_n: 回傳前幾名
+        half_life_days: 時間衰減的半衰期 (天)
+        now: 目前時間戳記 (測試用)
+
+    Returns:
+        list[(ticker, score, count)]: 依分數由高到低排序
+    """
+    now = now or time.time()
+    scores, counts = {}, {}
+    decay = math.log(2) / (half_life_days * 86400)
+    for record in read_requests(since=now - days * 86400, path=path):
+        ticker = record["k"]
+        scores[ticker] = scores.get(ticker, 0.0) + math.exp(-decay * (now - record["t"]))
+        counts[ticker] = counts.get(ticker, 0) + 1
+    ranked = sorted(scores, key=lambda t: (-scores[t], t))[:top_n]
+    return [(t, round(scores[t], 2), counts[t]) for t in ranked]
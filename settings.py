@@ -0,0 +1,18 @@
+"""
+共用環境設定
+
+在程序內只載入一次 .env，並提供各模組共用的設定值。
+其他模組應優先 import 本模組，確保後續讀取的環境變數已載入。
+"""
+import os
+from dotenv import load_dotenv
+
+# 載入環境變數
+load_dotenv(override=True)
+
+GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
+MAIL_USERNAME = os.getenv("MAIL_USERNAME")  # 您的 Gmail
+MAIL_PASSWORD = os.getenv("MAIL_PASSWORD")  # 您的 Gmail 應用程式密碼
+MAIL_TO = os.getenv("MAIL_TO")              # 收件人 Email
+LINE_CHANNEL_SECRET = os.getenv("LINE_CHANNEL_SECRET")              # LINE Webhook 簽章驗證
+LINE_CHANNEL_ACCESS_TOKEN = os.getenv("LINE_CHANNEL_ACCESS_TOKEN")  # LINE 回覆訊息用
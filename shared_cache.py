@@ -0,0 +1,245 @@
+"""
+跨程序共用快取 (SQLite WAL)
+
+供多個 uvicorn / gunicorn worker 與 Streamlit 共用行情、K 線與 LLM 結果，
+不需要額外的外部服務：
+- SQLite WAL 模式：多個程序可同時讀取，寫入由 SQLite 自行加鎖
+- 租約鎖 (lease lock)：同一個 key 在所有程序中只會有一個實際計算
+- 依總容量淘汰：超過上限時先刪除過期資料，再依最近存取時間 (LRU) 刪除
+"""
+import os
+import pickle
+import sqlite3
+import threading
+import time
+
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_PATH = os.getenv("SHARED_CACHE_PATH", os.path.join(PROJECT_DIR, ".cache", "shared_cache.db"))
+DEFAULT_MAX_MB = float(os.getenv("SHARED_CACHE_MAX_MB", 256))
+
+# 每寫入幾次檢查一次總容量
+EVICT_CHECK_EVERY = 20
+# 淘汰時降到上限的比例，避免每次寫入都觸發淘汰
+EVICT_TARGET_RATIO = 0.9
+# 存取時間的更新間隔 (秒)，避免每次讀取都寫入資料庫
+TOUCH_INTERVAL = 60
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    namespace TEXT NOT NULL,
+    key TEXT NOT NULL,
+    value BLOB NOT NULL,
+    size INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    expires_at REAL,
+    accessed_at REAL NOT NULL,
+    PRIMARY KEY (namespace, key)
+);
+CREATE INDEX IF NOT EXISTS idx_entries_accessed ON entries (accessed_at);
+CREATE INDEX IF NOT EXISTS idx_entries_expires ON entries (expires_at);
+CREATE TABLE IF NOT EXISTS locks (
+    name TEXT PRIMARY KEY,
+    owner TEXT NOT NULL,
+    expires_at REAL NOT NULL
+);
+"""
+
+
+def _key(key):
+    """將 key 轉為字串 (tuple 等結構以 repr 表示)"""
+    return key if isinstance(key, str) else repr(key)
+
+
+class SharedCache:
+    """以 SQLite 檔案為後端、可跨程序使用的快取"""
+
+    def __init__(self, path=DEFAULT_PATH, max_mb=DEFAULT_MAX_MB):
+        self.path = path
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self._local = threading.local()
+        self._writes = 0
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn().executescript(SCHEMA)
+
+    def _conn(self):
+        """每個執行緒使用各自的連線 (fork 後的子程序會重新連線)"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=10000")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _owner(self):
+        """鎖的持有者識別 (程序 + 執行緒)"""
+        return f"{os.getpid()}-{threading.get_ident()}"
+
+    def get_with_age(self, namespace, key):
+        """
+        讀取快取
+
+        Returns:
+            (value, age): 快取值與其年齡 (秒)；不存在或已過期時回傳 (None, None)
+        """
+        now = time.time()
+        row = self._conn().execute(
+            "SELECT value, created_at, expires_at, accessed_at FROM entries WHERE namespace = ? AND key = ?",
+            (namespace, _key(key))
+        ).fetchone()
+        if row is None:
+            return None, None
+        value, created_at, expires_at, accessed_at = row
+        if expires_at is not None and expires_at <= now:
+            return None, None
+        if now - accessed_at > TOUCH_INTERVAL:
+            self._conn().execute(
+                "UPDATE entries SET accessed_at = ? WHERE namespace = ? AND key = ?",
+                (now, namespace, _key(key))
+            )
+        try:
+            return pickle.loads(value), now - created_at
+        except Exception:
+            return None, None
+
+    def get(self, namespace, key, default=None):
+        """讀取快取值，不存在或已過期時回傳 default"""
+        value, age = self.get_with_age(namespace, key)
+        return default if age is None else value
+
+    def set(self, namespace, key, value, ttl=None):
+        """
+        寫入快取
+
+        Args:
+            namespace: 資料類別 (例如 "quote", "bars", "llm")
+            key: 快取鍵
+            value: 可被 pickle 的資料
+            ttl: 有效秒數 (None 表示只受容量淘汰影響)
+        """
+        blob = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        now = time.time()
+        expires_at = now + ttl if ttl is not None else None
+        self._conn().execute(
+            "INSERT OR REPLACE INTO entries (namespace, key, value, size, created_at, expires_at, accessed_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (namespace, _key(key), blob, len(blob), now, expires_at, now)
+        )
+        self._writes += 1
+        if self._writes % EVICT_CHECK_EVERY == 0 or len(blob) > self.max_bytes // 100:
+            self.evict()
+
+    def delete(self, namespace, key):
+        self._conn().execute("DELETE FROM entries WHERE namespace = ? AND key = ?", (namespace, _key(key)))
+
+    def clear(self, namespace=None):
+        """清除整個快取或指定 namespace"""
+        if namespace is None:
+            self._conn().execute("DELETE FROM entries")
+        else:
+            self._conn().execute("DELETE FROM entries WHERE namespace = ?", (namespace,))
+
+    def evict(self):
+        """總容量超過上限時，先刪除過期資料，再依 LRU 刪除到上限的 90%"""
+        conn = self._conn()
+        conn.execute("DELETE FROM entries WHERE expires_at IS NOT NULL AND expires_at <= ?", (time.time(),))
+        total = conn.execute("SELECT total(size) FROM entries").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        target = self.max_bytes * EVICT_TARGET_RATIO
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            rows = conn.execute("SELECT namespace, key, size FROM entries ORDER BY accessed_at").fetchall()
+            doomed = []
+            for namespace, key, size in rows:
+                if total <= target:
+                    break
+                doomed.append((namespace, key))
+                total -= size
+            conn.executemany("DELETE FROM entries WHERE namespace = ? AND key = ?", doomed)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def stats(self):
+        """回傳各 namespace 的筆數與容量 (bytes)"""
+        rows = self._conn().execute(
+            "SELECT namespace, count(*), total(size) FROM entries GROUP BY namespace"
+        ).fetchall()
+        return {namespace: {"entries": count, "bytes": int(size)} for namespace, count, size in rows}
+
+    # ---------- 跨程序鎖 ----------
+
+    def acquire_lock(self, name, lease=30):
+        """嘗試取得租約鎖 (持有者當機時，租約到期後其他程序可接手)"""
+        now = time.time()
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT owner, expires_at FROM locks WHERE name = ?", (name,)).fetchone()
+            if row is not None and row[0] != self._owner() and row[1] > now:
+                conn.execute("COMMIT")
+                return False
+            conn.execute(
+                "INSERT OR REPLACE INTO locks (name, owner, expires_at) VALUES (?, ?, ?)",
+                (name, self._owner(), now + lease)
+            )
+            conn.execute("COMMIT")
+            return True
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def release_lock(self, name):
+        self._conn().execute("DELETE FROM locks WHERE name = ? AND owner = ?", (name, self._owner()))
+
+    def get_or_compute(self, namespace, key, compute, ttl=None, should_cache=None, lease=30, poll=0.1):
+        """
+        讀取快取；不存在時在所有程序中只由一個呼叫者計算，其餘等待結果
+
+        Args:
+            compute: 無參數的計算函數
+            ttl: 寫入快取的有效秒數
+            should_cache: 判斷結果是否寫入快取的函數
+            lease: 計算鎖的租約秒數 (超過後其他程序會自行計算)
+            poll: 等待其他程序計算時的輪詢間隔
+
+        Returns:
+            計算或快取的結果
+        """
+        value, age = self.get_with_age(namespace, key)
+        if age is not None:
+            return value
+
+        lock_name = f"{namespace}:{_key(key)}"
+        deadline = time.time() + lease
+        while not self.acquire_lock(lock_name, lease):
+            time.sleep(poll)
+            value, age = self.get_with_age(namespace, key)
+            if age is not None:
+                return value
+            if time.time() > deadline:
+                break  # 持有者可能已失敗，自行計算
+        try:
+            value = compute()
+            if should_cache is None or should_cache(value):
+                self.set(namespace, key, value, ttl)
+            return value
+        finally:
+            self.release_lock(lock_name)
+
+
+_default_cache = None
+_default_lock = threading.Lock()
+
+
+def get_shared_cache():
+    """取得程序內共用的 SharedCache 實例"""
+    global _default_cache
+    with _default_lock:
+        if _default_cache is None:
+            _default_cache = SharedCache()
+        return _default_cache
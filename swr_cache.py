@@ -0,0 +1,108 @@
+"""
+Stale-While-Revalidate 快取
+
+資料年齡小於 soft TTL 時直接回傳；介於 soft 與 hard TTL 之間時先回傳舊資料，
+同時在背景重新抓取；超過 hard TTL (或尚無資料) 才會阻塞等待抓取完成。
+可選擇以 shared_cache 作為儲存後端，讓多個 worker 程序共用同一份資料。
+TTL 可為固定秒數，或接收抓取時間戳記回傳秒數的函數 (例如依交易時段調整，見 cache_policy)。
+"""
+import threading
+import time
+
+
+class StaleWhileRevalidateCache:
+    """以執行緒在背景更新的 SWR 快取"""
+
+    def __init__(self, fetch, soft_ttl, hard_ttl, should_cache=None, store=None, namespace="swr"):
+        """
+        Args:
+            fetch: 抓取函數，接收 key 回傳資料
+            soft_ttl: 超過此秒數後回傳舊資料並觸發背景更新 (秒數，或 fetched_at -> 秒數的函數)
+            hard_ttl: 超過此秒數後必須阻塞重新抓取 (同上，不會短於 soft_ttl)
+            should_cache: 判斷結果是否可快取的函數 (例如失敗結果不快取)
+            store: 跨程序儲存後端 (SharedCache)，None 表示只存在本程序記憶體
+            namespace: 在 store 中使用的 namespace
+        """
+        self.fetch = fetch
+        self.soft_ttl = soft_ttl
+        self.hard_ttl = hard_ttl
+        self.should_cache = should_cache or (lambda value: True)
+        self.store = store
+        self.namespace = namespace
+        self._entries = {}        # key -> (value, fetched_at)
+        self._refreshing = set()  # 正在背景更新的 key
+        self._key_locks = {}
+        self._lock = threading.Lock()
+
+    def _ttls(self, fetched_at):
+        """資料的 (soft TTL, hard TTL)"""
+        soft = self.soft_ttl(fetched_at) if callable(self.soft_ttl) else self.soft_ttl
+        hard = self.hard_ttl(fetched_at) if callable(self.hard_ttl) else self.hard_ttl
+        return soft, max(hard, soft)
+
+    def _key_lock(self, key):
+        with self._lock:
+            return self._key_locks.setdefault(key, threading.Lock())
+
+    def _read(self, key):
+        """讀取 (value, fetched_at)，不存在時回傳 None"""
+        if self.store is not None:
+            return self.store.get(self.namespace, key)
+        with self._lock:
+            return self._entries.get(key)
+
+    def _load(self, key):
+        """實際抓取並寫入快取，回傳 (value, fetched_at)"""
+        value = self.fetch(key)
+        fetched_at = time.time()
+        if self.should_cache(value):
+            if self.store is not None:
+                self.store.set(self.namespace, key, (value, fetched_at), ttl=self._ttls(fetched_at)[1])
+            else:
+                with self._lock:
+                    self._entries[key] = (value, fetched_at)
+        return value, fetched_at
+
+    def _refresh_in_background(self, key):
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+
+        def worker():
+            try:
+                with self._key_lock(key):
+                    self._load(key)
+            except Exception as e:
+                print(f"背景更新失敗 ({key}): {e}")
+            finally:
+                with self._lock:
+                    self._refreshing.discard(key)
+
+        threading.Thread(target=worker, daemon=True).start()
+
+    def get(self, key):
+        """
+        取得資料
+
+        Returns:
+            (value, age): 資料與其年齡 (秒)
+        """
+        entry = self._read(key)
+        if entry is not None:
+            value, fetched_at = entry
+            age = time.time() - fetched_at
+            soft_ttl, hard_ttl = self._ttls(fetched_at)
+            if age < soft_ttl:
+                return value, age
+            if age < hard_ttl:
+                self._refresh_in_background(key)
+                return value, age
+
+        # 無資料或已超過 hard TTL: 阻塞抓取 (同一 key 只會有一個請求實際抓取)
+        with self._key_lock(key):
+            entry = self._read(key)
+            if entry is not None and time.time() - entry[1] < self._ttls(entry[1])[0]:
+                return entry[0], time.time() - entry[1]
+            value, fetched_at = self._load(key)
+        return value, time.time() - fetched_at
@@ -0,0 +1,244 @@
+"""
+股票代號工具
+
+供 Streamlit 介面與 API 共用的股票代號正規化規則，以及本地股票主檔索引：
+- 主檔 (data/symbols.csv)：代號、名稱、市場 (上市/上櫃)、產業
+- 記憶體索引：代號/名稱精確查詢 (dict)、前綴查詢 (排序陣列 + 二分搜尋)、模糊查詢
+- 上櫃股票自動使用 .TWO 後綴，中文名稱 (如「台積電」) 可直接解析為代號
+
+更新完整主檔 (需網路)：
+    python symbols.py --refresh
+"""
+import bisect
+import csv
+import difflib
+import os
+import re
+import threading
+from collections import namedtuple
+
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+SYMBOLS_PATH = os.getenv("SYMBOLS_PATH", os.path.join(PROJECT_DIR, "data", "symbols.csv"))
+
+# 主檔為完整清單時 (已執行 --refresh)，可開啟嚴格模式：不在主檔中的台股代號直接視為無效
+SYMBOL_MASTER_STRICT = os.getenv("SYMBOL_MASTER_STRICT", "0") == "1"
+
+MARKET_SUFFIX = {"上市": ".TW", "上櫃": ".TWO"}
+
+# 證交所 ISIN 公開資訊 (strMode=2 上市、strMode=4 上櫃)
+ISIN_URLS = {
+    "上市": "https://isin.twse.com.tw/isin/C_public.jsp?strMode=2",
+    "上櫃": "https://isin.twse.com.tw/isin/C_public.jsp?strMode=4",
+}
+# 只保留股票與 ETF (排除權證等)：4 碼股票，或 00 開頭的 ETF 代號
+SYMBOL_CODE_PATTERN = re.compile(r"^(\d{4}|00\d{3,4}[A-Z]?)$")
+
+
+class Symbol(namedtuple("Symbol", ["code", "name", "market", "industry"])):
+    """股票主檔資料"""
+    __slots__ = ()
+
+    @property
+    def ticker(self):
+        """Yahoo Finance 格式代號 (上市 .TW / 上櫃 .TWO)"""
+        return f"{self.code}{MARKET_SUFFIX.get(self.market, '.TW')}"
+
+    @property
+    def label(self):
+        """顯示用文字，例如 '2330 台積電'"""
+        return f"{self.code} {self.name}"
+
+
+class SymbolIndex:
+    """股票主檔的記憶體索引"""
+
+    def __init__(self, symbols):
+        self.symbols = list(symbols)
+        self.by_code = {s.code: s for s in self.symbols}
+        self.by_name = {s.name: s for s in self.symbols}
+        # 前綴查詢用的排序陣列：(查詢鍵, 代號)，同時包含代號與名稱
+        entries = sorted(
+            {(s.code, s.code) for s in self.symbols} | {(s.name.upper(), s.code) for s in self.symbols}
+        )
+        self._keys = [k for k, _ in entries]
+        self._codes = [c for _, c in entries]
+        self._names = [s.name for s in self.symbols]
+
+    def __len__(self):
+        return len(self.symbols)
+
+    def get(self, query):
+        """精確查詢代號或名稱"""
+        query = query.strip()
+        return self.by_code.get(query) or self.by_name.get(query)
+
+    def prefix(self, query, limit=10):
+        """代號或名稱前綴查詢 (依代號/名稱排序)"""
+        query = query.strip().upper()
+        if not query:
+            return []
+        results = []
+        seen = set()
+        i = bisect.bisect_left(self._keys, query)
+        while i < len(self._keys) and self._keys[i].startswith(query) and len(results) < limit:
+            code = self._codes[i]
+            if code not in seen:
+                seen.add(code)
+                results.append(self.by_code[code])
+            i += 1
+        return results
+
+    def search(self, query, limit=10):
+        """
+        綜合查詢：精確 → 前綴 → 名稱包含 → 模糊比對
+
+        Returns:
+            list[Symbol]: 依相關程度排序的結果
+        """
+        query = query.strip()
+        if not query:
+            return []
+        results = []
+
+        def add(symbols):
+            for s in symbols:
+                if s not in results and len(results) < limit:
+                    results.append(s)
+
+        exact = self.get(query)
+        if exact:
+            add([exact])
+        add(self.prefix(query, limit))
+        if len(results) < limit:
+            add(s for s in self.symbols if query in s.name)
+        if not results:
+            matches = difflib.get_close_matches(query, self._names, n=limit, cutoff=0.5)
+            add(self.by_name[name] for name in matches)
+        return results
+
+    def resolve(self, query):
+        """
+        將使用者輸入解析為唯一的股票，否則回傳 None
+
+        代號需精確符合；名稱可精確符合或為唯一的前綴 (如「聯發」-> 聯發科)
+        """
+        exact = self.get(query)
+        if exact:
+            return exact
+        if query.strip().isascii():
+            return None
+        candidates = self.prefix(query, limit=2)
+        return candidates[0] if len(candidates) == 1 else None
+
+
+def load_symbols(path=SYMBOLS_PATH):
+    """讀取股票主檔 CSV"""
+    if not os.path.exists(path):
+        return []
+    with open(path, encoding="utf-8") as f:
+        return [Symbol(row["code"], row["name"], row["market"], row["industry"]) for row in csv.DictReader(f)]
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_symbol_index():
+    """取得程序內共用的股票主檔索引 (首次呼叫時載入)"""
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = SymbolIndex(load_symbols())
+        return _index
+
+
+def normalize_ticker(ticker):
+    """
+    正規化股票代號 - 自動補上 .TW / .TWO 後綴，並支援中文名稱
+
+    Args:
+        ticker: 使用者輸入的股票代號或名稱
+
+    Returns:
+        正規化後的股票代號
+
+    Examples:
+        normalize_ticker("2330") -> "2330.TW"
+        normalize_ticker("2330.TW") -> "2330.TW"
+        normalize_ticker("0050") -> "0050.TW"
+        normalize_ticker("6488") -> "6488.TWO"  (上櫃)
+        normalize_ticker("台積電") -> "2330.TW"
+    """
+    if not ticker:
+        return ticker
+
+    # 移除前後空白
+    ticker = ticker.strip()
+
+    # 如果已經有後綴,直接返回
+    if '.' in ticker:
+        return ticker.upper()
+
+    # 主檔中的代號或名稱,使用正確的市場後綴
+    symbol = get_symbol_index().resolve(ticker)
+    if symbol:
+        return symbol.ticker
+
+    # 純數字代號,自動加上 .TW
+    if ticker.isdigit():
+        return f"{ticker}.TW"
+
+    # 其他情況(可能是美股等),原樣返回
+    return ticker.upper()
+
+
+def is_plausible_ticker(ticker):
+    """
+    不需網路即可判斷正規化後的代號是否值得向上游查詢
+
+    - 未能解析的中文名稱 (非 ASCII) 一定無效
+    - 嚴格模式下，不在主檔中的台股代號視為無效
+    """
+    if not ticker or not ticker.isascii():
+        return False
+    code, _, suffix = ticker.partition(".")
+    if suffix in ("TW", "TWO"):
+        if not code.isalnum():
+            return False
+        if SYMBOL_MASTER_STRICT and code not in get_symbol_index().by_code:
+            return False
+    return True
+
+
+def refresh_symbol_master(path=SYMBOLS_PATH):
+    """從證交所 ISIN 公開資訊下載完整上市/上櫃股票與 ETF 清單，寫入主檔"""
+    import requests
+
+    row_pattern = re.compile(
+        r"<tr><td[^>]*>([0-9A-Z]+)　([^<]+)</td><td[^>]*>[^<]*</td><td[^>]*>[^<]*</td>"
+        r"<td[^>]*>([^<]*)</td><td[^>]*>([^<]*)</td>"
+    )
+    symbols = []
+    for market, url in ISIN_URLS.items():
+        response = requests.get(url, timeout=30)
+        response.encoding = "cp950"
+        for code, name, row_market, industry in row_pattern.findall(response.text):
+            code, name = code.strip(), name.strip()
+            if SYMBOL_CODE_PATTERN.match(code):
+                symbols.append(Symbol(code, name, row_market.strip() or market, industry.strip() or "ETF"))
+
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(Symbol._fields)
+        writer.writerows(sorted(symbols, key=lambda s: (s.market != "上市", s.code)))
+    return len(symbols)
+
+
+if __name__ == "__main__":
+    import sys
+    if "--refresh" in sys.argv:
+        count = refresh_symbol_master()
+        print(f"已更新股票主檔：{count} 筆 ({SYMBOLS_PATH})")
+    else:
+        for query in sys.argv[1:]:
+            print(query, "->", [s.label for s in get_symbol_index().search(query)])
@@ -0,0 +1,16 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import shared_cache  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def isolated_cache(tmp_path, monkeypatch):
+    """每個測試使用獨立的共用快取檔案"""
+    cache = shared_cache.SharedCache(str(tmp_path / "shared_cache.db"))
+    monkeypatch.setattr(shared_cache, "_default_cache", cache)
+    return cache
@@ -0,0 +1,37 @@
+import asyncio
+import threading
+
+import api
+
+
+def test_pending_report_writes_run_off_the_event_loop(isolated_cache, monkeypatch):
+    loop_thread = threading.get_ident()
+    writers = []
+    original_set = isolated_cache.set
+
+    def recording_set(namespace, key, value, ttl=None):
+        writers.append((value["status"], threading.get_ident()))
+        return original_set(namespace, key, value, ttl=ttl)
+
+    monkeypatch.setattr(isolated_cache, "set", recording_set)
+
+    async def scenario():
+        release = asyncio.Event()
+
+        async def report():
+            await release.wait()
+            return "AI 報告"
+
+        task = asyncio.create_task(report())
+        await api.remember_pending_report("r1", task)
+        assert isolated_cache.get("pending_report", "r1") == {"status": "pending"}
+        release.set()
+        await task
+        while api.background_tasks:
+            await asyncio.sleep(0.01)
+
+    asyncio.run(scenario())
+
+    assert [status for status, _ in writers] == ["pending", "complete"]
+    assert all(thread != loop_thread for _, thread in writers)
+    assert isolated_cache.get("pending_report", "r1") == {"status": "complete", "message": "AI 報告"}
@@ -0,0 +1,47 @@
+import pytest
+from fastapi.testclient import TestClient
+
+import api
+
+
+class FakeHub:
+    def __init__(self):
+        self.subscribed = []
+
+    def new_queue(self):
+        import asyncio
+        return asyncio.Queue()
+
+    def subscribe(self, ticker, queue):
+        self.subscribed.append(ticker)
+
+    def unsubscribe(self, ticker, queue):
+        self.subscribed.remove(ticker)
+
+
+@pytest.fixture
+def hub(monkeypatch):
+    hub = FakeHub()
+    monkeypatch.setattr(api, "quote_hub", hub)
+    return hub
+
+
+def test_rejects_implausible_tickers_and_caps_subscriptions(hub, monkeypatch):
+    monkeypatch.setattr(api, "MAX_WS_SUBSCRIPTIONS", 2)
+    with TestClient(api.app).websocket_connect("/ws/quotes") as ws:
+        ws.send_json({"action": "subscribe", "tickers": ["2330", "不存在的公司", "2454", "2317"]})
+        reply = ws.receive_json()
+    assert reply["tickers"] == ["2330.TW", "2454.TW"]
+    assert "2317.TW" in reply["rejected"]
+    assert len(reply["rejected"]) == 2
+    assert hub.subscribed == []  # 斷線後全部取消訂閱
+
+
+def test_malformed_messages_get_error_frames(hub):
+    with TestClient(api.app).websocket_connect("/ws/quotes") as ws:
+        for message in ("[1, 2]", "not json", '{"action": "subscribe", "tickers": "2330"}'):
+            ws.send_text(message)
+            assert ws.receive_json()["type"] == "error"
+        # 連線仍可繼續使用
+        ws.send_json({"action": "subscribe", "tickers": ["2330"]})
+        assert ws.receive_json()["tickers"] == ["2330.TW"]
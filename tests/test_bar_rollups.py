@@ -0,0 +1,40 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from bar_rollups import get_rollup, rollup_bars
+
+
+def make_daily(days=800, seed=0):
+    rng = np.random.default_rng(seed)
+    index = pd.bdate_range("2023-01-02", periods=days)
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.01, days)))
+    return pd.DataFrame({
+        "Open": close * 0.99, "High": close * 1.01, "Low": close * 0.98,
+        "Close": close, "Volume": rng.integers(1000, 5000, days).astype(float),
+    }, index=index)
+
+
+@pytest.mark.parametrize("timeframe", ["W", "M", "Q"])
+def test_rolling_window_is_maintained_incrementally(timeframe, isolated_cache):
+    """滾動期間每天起點與終點都往後移：沿用快取的結果應與整份重算相同"""
+    daily = make_daily()
+    window = 250
+    for end in range(window, window + 40):
+        current = daily.iloc[end - window:end]
+        bars = get_rollup("2330.TW", timeframe, current, "1y")
+        pd.testing.assert_frame_equal(bars, rollup_bars(current, timeframe), check_freq=False)
+
+
+def test_rolling_window_reuses_cached_periods(monkeypatch, isolated_cache):
+    import bar_rollups
+    daily = make_daily()
+    get_rollup("2330.TW", "M", daily.iloc[:250], "1y")
+
+    full_rebuilds = []
+    original = bar_rollups.rollup_bars
+    monkeypatch.setattr(bar_rollups, "rollup_bars",
+                        lambda d, tf: full_rebuilds.append(len(d)) or original(d, tf))
+    get_rollup("2330.TW", "M", daily.iloc[1:251], "1y")
+    # 只重算起點所在的月份與最後一個月份
+    assert max(full_rebuilds) < 50
@@ -0,0 +1,69 @@
+import json
+import os
+import sys
+
+import pytest
+from streamlit.testing.v1 import AppTest
+
+import analysis_history
+
+APP_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app.py")
+
+
+def run_app():
+    import os
+    import runpy
+    import loadtest
+    loadtest.install_stubs()
+    runpy.run_path(os.environ["BROWSER_STORAGE_TEST_APP"], run_name="__main__")
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    monkeypatch.setenv("BROWSER_STORAGE_TEST_APP", APP_PATH)
+    monkeypatch.setattr(analysis_history, "_default_history",
+                        analysis_history.AnalysisHistory(str(tmp_path / "history.db")))
+    return AppTest.from_function(run_app, default_timeout=60)
+
+
+def test_missing_component_renders_defaults(app, monkeypatch):
+    """streamlit_js_eval 無法使用時不可停在「載入中」，應直接以預設值渲染頁面"""
+    monkeypatch.setitem(sys.modules, "streamlit_js_eval", None)
+    app.run()
+    assert not app.exception
+    assert "載入中..." not in [c.value for c in app.caption]
+    assert app.sidebar.radio[0].value == "📈 個股全方位分析"
+    assert app.text_input[0].value == "2330.TW"
+
+
+def test_component_failure_renders_defaults(app, monkeypatch):
+    """元件渲染時拋出例外也應退回預設值"""
+    class BrokenModule:
+        @staticmethod
+        def streamlit_js_eval(**kwargs):
+            raise RuntimeError("component not registered")
+
+    monkeypatch.setitem(sys.modules, "streamlit_js_eval", BrokenModule)
+    app.run()
+    assert not app.exception
+    assert "載入中..." not in [c.value for c in app.caption]
+    assert app.text_input[0].value == "2330.TW"
+
+
+def test_stored_values_load_in_one_pass(app, monkeypatch):
+    """讀取完成後的第一次渲染即使用保存的股票代號"""
+    stored = {"last_stock_ticker": json.dumps("2454.TW")}
+
+    class FakeModule:
+        @staticmethod
+        def streamlit_js_eval(js_expressions, want_output=True, key=None):
+            import streamlit as st
+            if want_output and key not in st.session_state:
+                st.session_state[key] = json.dumps(stored)
+
+    monkeypatch.setitem(sys.modules, "streamlit_js_eval", FakeModule)
+    app.run()
+    assert "載入中..." in [c.value for c in app.caption]
+    app.run()
+    assert not app.exception
+    assert app.text_input[0].value == "2454.TW"
@@ -0,0 +1,119 @@
+import pandas as pd
+import pytest
+import yfinance as yf
+
+from daily_report import (QUOTE_ERROR, QUOTE_NO_DATA, QUOTE_SUCCESS, get_market_summary,
+                          get_market_summary_bulk)
+
+
+class YFPricesMissingError(Exception):
+    """與 yfinance.exceptions.YFPricesMissingError 同名的替身"""
+
+
+def make_ticker(history):
+    class FakeTicker:
+        def __init__(self, ticker):
+            self.ticker = ticker
+
+        def history(self, period="1mo", **kwargs):
+            # 與 yfinance 相同：hide_exceptions 開啟時隱藏錯誤
+            return history(not yf.config.debug.hide_exceptions)
+
+    return FakeTicker
+
+
+def closes(*values):
+    index = pd.date_range("2026-10-15", periods=len(values), freq="D")
+    return pd.DataFrame({"Close": list(values)}, index=index)
+
+
+@pytest.fixture
+def no_data_ns(isolated_cache):
+    return lambda ticker: isolated_cache.get("no_data", ticker)
+
+
+def flaky_history(raise_errors):
+    """上游錯誤：yfinance 預設隱藏錯誤並回傳空表"""
+    if raise_errors:
+        raise ConnectionError("Yahoo 暫時無法連線")
+    return pd.DataFrame()
+
+
+def missing_history(raise_errors):
+    raise YFPricesMissingError("possibly delisted; no price data found")
+
+
+def test_upstream_error_is_not_negative_cached(monkeypatch, no_data_ns):
+    """yfinance 隱藏上游錯誤時回傳空表：不可寫入負向快取"""
+    history = flaky_history
+
+    monkeypatch.setattr(yf, "Ticker", make_ticker(history))
+    result, = get_market_summary(["2330.TW"])
+    assert result.status == QUOTE_ERROR
+    assert no_data_ns("2330.TW") is None
+
+
+def test_empty_frame_without_error_is_not_negative_cached(monkeypatch, no_data_ns):
+    monkeypatch.setattr(yf, "Ticker", make_ticker(lambda raise_errors: pd.DataFrame()))
+    result, = get_market_summary(["2330.TW"])
+    assert result.status == QUOTE_NO_DATA
+    assert no_data_ns("2330.TW") is None
+
+
+def test_confirmed_missing_symbol_is_negative_cached(monkeypatch, no_data_ns):
+    monkeypatch.setattr(yf, "Ticker", make_ticker(missing_history))
+    result, = get_market_summary(["9999.TW"])
+    assert result.status == QUOTE_NO_DATA
+    assert no_data_ns("9999.TW") is True
+
+    # 負向快取期間不再送往上游
+    monkeypatch.setattr(yf, "Ticker", None)
+    assert get_market_summary(["9999.TW"])[0].status == QUOTE_NO_DATA
+
+
+def test_single_bar_is_negative_cached(monkeypatch, no_data_ns):
+    monkeypatch.setattr(yf, "Ticker", make_ticker(lambda raise_errors: closes(100.0)))
+    assert get_market_summary(["7777.TW"])[0].status == QUOTE_NO_DATA
+    assert no_data_ns("7777.TW") is True
+
+
+def test_success(monkeypatch, no_data_ns):
+    monkeypatch.setattr(yf, "Ticker", make_ticker(lambda raise_errors: closes(100.0, 101.0)))
+    result, = get_market_summary(["2330.TW"])
+    assert result.status == QUOTE_SUCCESS
+    assert (result.close, result.change) == (101.0, 1.0)
+    assert no_data_ns("2330.TW") is None
+
+
+def mixed_download(tickers, period="5d", **kwargs):
+    """2330.TW 正常、其餘代號為全 NaN 欄位 (yf.download 對單檔錯誤的處理方式)"""
+    frames = {}
+    for ticker in tickers:
+        frame = closes(100.0, 101.0)
+        if ticker != "2330.TW":
+            frame["Close"] = float("nan")
+        frames[ticker] = frame
+    return pd.concat(frames, axis=1)
+
+
+def test_bulk_all_nan_column_from_upstream_error_is_not_negative_cached(monkeypatch, no_data_ns):
+    monkeypatch.setattr(yf, "download", mixed_download)
+    monkeypatch.setattr(yf, "Ticker", make_ticker(flaky_history))
+
+    results = get_market_summary_bulk(["2330.TW", "2454.TW"])
+
+    assert results["2330.TW"].status == QUOTE_SUCCESS
+    assert results["2454.TW"].status == QUOTE_ERROR
+    assert no_data_ns("2454.TW") is None
+    assert yf.config.debug.hide_exceptions is True
+
+
+def test_bulk_confirmed_missing_is_negative_cached(monkeypatch, no_data_ns):
+    monkeypatch.setattr(yf, "download", mixed_download)
+    monkeypatch.setattr(yf, "Ticker", make_ticker(missing_history))
+
+    results = get_market_summary_bulk(["2330.TW", "9999.TW"])
+
+    assert results["9999.TW"].status == QUOTE_NO_DATA
+    assert no_data_ns("9999.TW") is True
+    assert no_data_ns("2330.TW") is None
@@ -0,0 +1,82 @@
+import time
+
+import pandas as pd
+import yfinance as yf
+
+import fundamentals
+import rate_limit
+
+
+class CountingBucket:
+    capacity = 5
+
+    def __init__(self):
+        self.acquired = 0
+
+    def acquire(self, timeout=None):
+        self.acquired += 1
+        return True
+
+
+class FakeTicker:
+    def __init__(self, ticker):
+        self.ticker = ticker
+        statement = pd.DataFrame({"Total Revenue": [100.0]}, index=["2025-12-31"])
+        self.info = {"shortName": ticker}
+        self.financials = self.balance_sheet = self.cashflow = statement
+
+
+def use_store(monkeypatch):
+    monkeypatch.setattr(fundamentals, "_store", fundamentals.FundamentalsStore())
+    monkeypatch.setattr(yf, "Ticker", FakeTicker)
+
+
+def test_each_statement_takes_a_rate_limit_token(monkeypatch):
+    bucket = CountingBucket()
+    monkeypatch.setitem(rate_limit._buckets, "yfinance", bucket)
+    use_store(monkeypatch)
+
+    results = fundamentals.fetch_fundamentals(["2330.TW", "2454.TW"])
+
+    assert all("error" not in bundle for bundle in results.values())
+    assert bucket.acquired == 2 * len(fundamentals.STATEMENT_PARTS)
+
+
+def test_more_tickers_than_burst_all_load(monkeypatch):
+    """公司數遠超過 bucket 容量與等待逾時時，也不會因本地限流遺漏公司"""
+    bucket = rate_limit.TokenBucket(rate=40.0, capacity=3)
+    monkeypatch.setitem(rate_limit._buckets, "yfinance", bucket)
+    monkeypatch.setattr(rate_limit, "ACQUIRE_TIMEOUT", 0.05)
+    use_store(monkeypatch)
+    tickers = [f"{1100 + i}.TW" for i in range(12)]
+
+    started = time.monotonic()
+    results = fundamentals.fetch_fundamentals(tickers)
+
+    assert sorted(results) == tickers
+    assert all("error" not in bundle and not bundle["errors"] for bundle in results.values())
+    # 48 個請求、容量 3、每秒 40 個：受速率限制約 1.1 秒
+    assert time.monotonic() - started >= (12 * 4 - 3) / 40.0 * 0.9
+
+
+def test_failed_part_keeps_loaded_parts(monkeypatch, isolated_cache):
+    class PartialTicker(FakeTicker):
+        @property
+        def cashflow(self):
+            raise ConnectionError("timeout")
+
+        @cashflow.setter
+        def cashflow(self, value):
+            pass
+
+    monkeypatch.setitem(rate_limit._buckets, "yfinance", CountingBucket())
+    use_store(monkeypatch)
+    monkeypatch.setattr(yf, "Ticker", PartialTicker)
+
+    bundle = fundamentals.fetch_fundamentals(["2330.TW"])["2330.TW"]
+
+    assert "error" not in bundle
+    assert list(bundle["errors"]) == ["cashflow"]
+    assert not bundle["financials"].empty and bundle["cashflow"].empty
+    # 不完整的資料不寫入共用快取，下次重新抓取
+    assert isolated_cache.get("fundamentals", "2330.TW") is None
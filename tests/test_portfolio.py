@@ -0,0 +1,30 @@
+import numpy as np
+import pandas as pd
+import yfinance as yf
+
+from portfolio_optimizer import optimize_portfolio
+from portfolio_risk import analyze_portfolio_risk, parse_holdings
+
+
+def test_risk_and_optimizer_share_one_download(monkeypatch):
+    calls = []
+
+    def download(tickers, period="1y", **kwargs):
+        calls.append(tuple(tickers))
+        index = pd.bdate_range("2025-01-01", periods=250)
+        rng = np.random.default_rng(len(calls))
+        data = {t: 100 * np.exp(np.cumsum(rng.normal(0, 0.01, len(index)))) for t in tickers}
+        return pd.concat({"Close": pd.DataFrame(data, index=index)}, axis=1)
+
+    monkeypatch.setattr(yf, "download", download)
+    holdings = parse_holdings(pd.DataFrame({
+        "股票代號": ["2330.TW", "2454.TW", "2317.TW"],
+        "持有比例(%)": [40.0, 30.0, 30.0],
+    }))
+
+    _, risk = analyze_portfolio_risk(holdings)
+    rebalance_df, opt = optimize_portfolio(holdings)
+
+    assert "error" not in risk and "error" not in opt
+    assert len(calls) == 1
+    assert list(rebalance_df["股票代號"]) == ["2317.TW", "2330.TW", "2454.TW"]
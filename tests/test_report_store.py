@@ -0,0 +1,29 @@
+import datetime
+
+from cache_policy import ACTIVE_TTL
+from report_store import report_key
+from trading_calendar import TW_TZ
+
+WATCHLIST = ["2330.TW", "2454.TW"]
+
+
+def tw(*args):
+    return datetime.datetime(*args, tzinfo=TW_TZ)
+
+
+def test_after_close_before_settle_uses_intraday_key():
+    """收盤到盤後定價交易結束前行情仍在變動：不可寫入當日的收盤報告"""
+    key, ttl, trading_date = report_key(WATCHLIST, tw(2026, 10, 16, 13, 45))
+    assert trading_date == "2026-10-16-intraday"
+    assert ttl == ACTIVE_TTL["report"]
+
+
+def test_settled_report_lives_until_next_open():
+    # 週五 15:00 -> 下週一 08:30 試撮
+    now = tw(2026, 10, 16, 15, 0)
+    key, ttl, trading_date = report_key(WATCHLIST, now)
+    assert trading_date == "2026-10-16"
+    assert ttl == (tw(2026, 10, 19, 8, 30) - now).total_seconds()
+
+    # 週末仍取得同一份報告
+    assert report_key(WATCHLIST, tw(2026, 10, 18, 10, 0))[0] == key
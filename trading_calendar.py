@@ -0,0 +1,157 @@
+"""
+台股 (TWSE) 交易時段工具
+
+提供台北時區的交易時段判斷，以及依時段調整的行情輪詢間隔。
+休市日 (國定假日、颱風停止交易) 來自本地交易日曆檔 data/twse_calendar.csv (date,type,note)，
+檔案修改後會自動重新載入，不需重新啟動服務。
+"""
+import csv
+import datetime
+import os
+import threading
+
+TW_TZ = datetime.timezone(datetime.timedelta(hours=8), name="Asia/Taipei")
+
+# 交易時段 (台北時間)
+PRE_OPEN = datetime.time(8, 30)     # 試撮開始
+SESSION_OPEN = datetime.time(9, 0)
+SESSION_CLOSE = datetime.time(13, 30)
+SESSION_SETTLE = datetime.time(14, 30)  # 盤後定價交易結束，當日 K 線不再變動
+
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+CALENDAR_PATH = os.getenv("TWSE_CALENDAR_PATH", os.path.join(PROJECT_DIR, "data", "twse_calendar.csv"))
+# 交易日曆中代表休市的類型 (holiday: 國定假日、closed: 颱風等臨時停止交易)
+CLOSURE_TYPES = {"holiday", "closed"}
+
+# 各時段的輪詢間隔 (秒)
+POLL_INTERVAL_SESSION = float(os.getenv("QUOTE_POLL_SESSION", 5))
+POLL_INTERVAL_PRE_OPEN = float(os.getenv("QUOTE_POLL_PRE_OPEN", 30))
+POLL_INTERVAL_CLOSED = float(os.getenv("QUOTE_POLL_CLOSED", 300))
+
+
+def now_tw():
+    """目前的台北時間"""
+    return datetime.datetime.now(TW_TZ)
+
+
+_closures = {}
+_closures_mtime = None
+_closures_lock = threading.Lock()
+
+
+def load_closures(path=CALENDAR_PATH):
+    """
+    讀取交易日曆中的休市日
+
+    Returns:
+        dict: {date: note}；檔案不存在時回傳空 dict (只排除週末)
+    """
+    if not os.path.exists(path):
+        return {}
+    closures = {}
+    with open(path, encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            if row.get("type", "").strip() in CLOSURE_TYPES:
+                closures[datetime.date.fromisoformat(row["date"].strip())] = (row.get("note") or "").strip()
+    return closures
+
+
+def get_closures():
+    """目前的休市日 (交易日曆檔修改時重新載入)"""
+    global _closures, _closures_mtime
+    try:
+        mtime = os.path.getmtime(CALENDAR_PATH)
+    except OSError:
+        mtime = None
+    with _closures_lock:
+        if mtime != _closures_mtime:
+            try:
+                _closures = load_closures(CALENDAR_PATH)
+            except (OSError, ValueError, KeyError) as e:
+                print(f"交易日曆讀取失敗，沿用先前的休市日: {e}")
+            _closures_mtime = mtime
+        return _closures
+
+
+def closure_note(day):
+    """休市原因 (例如「春節」、「颱風停止交易」)，非休市日回傳 None"""
+    return get_closures().get(day)
+
+
+def is_trading_day(day):
+    """是否為交易日 (週一至週五，且不在交易日曆的休市日中)"""
+    return day.weekday() < 5 and day not in get_closures()
+
+
+def is_trading_session(now=None):
+    """是否在盤中 (09:00 ~ 13:30)"""
+    now = now or now_tw()
+    return is_trading_day(now.date()) and SESSION_OPEN <= now.time() < SESSION_CLOSE
+
+
+def last_closed_trading_date(now=None):
+    """
+    最近一個已收盤的交易日
+
+    交易日 13:30 收盤後為當天，否則往前找上一個交易日
+    """
+    now = now or now_tw()
+    day = now.date()
+    if is_trading_day(day) and now.time() >= SESSION_CLOSE:
+        return day
+    day -= datetime.timedelta(days=1)
+    while not is_trading_day(day):
+        day -= datetime.timedelta(days=1)
+    return day
+
+
+def is_market_active(now=None):
+    """是否在試撮或盤中 (08:30 ~ 13:30)，此時行情仍會變動"""
+    now = now or now_tw()
+    return is_trading_day(now.date()) and PRE_OPEN <= now.time() < SESSION_CLOSE
+
+
+def is_data_settled(now=None):
+    """
+    當日行情是否已確定 (盤後定價交易結束後、試撮開始前或非交易日)
+
+    行情確定後到下一次試撮開始前，報價與日 K 線都不會再變動
+    """
+    now = now or now_tw()
+    if not is_trading_day(now.date()):
+        return True
+    return now.time() < PRE_OPEN or now.time() >= SESSION_SETTLE
+
+
+def next_market_open(now=None):
+    """
+    下一次試撮開始的時間 (目前已在試撮或盤中時回傳 now)
+
+    收盤後到下一次開盤前行情不會變動，可作為預熱快取的有效期限
+    """
+    now = now or now_tw()
+    if is_market_active(now):
+        return now
+    day = now.date()
+    if now.time() >= PRE_OPEN or not is_trading_day(day):
+        day += datetime.timedelta(days=1)
+        while not is_trading_day(day):
+            day += datetime.timedelta(days=1)
+    return datetime.datetime.combine(day, PRE_OPEN, tzinfo=TW_TZ)
+
+
+def poll_interval(now=None):
+    """
+    依交易時段回傳行情輪詢間隔
+
+    Returns:
+        float: 盤中 5 秒、試撮 30 秒、收盤後與非交易日 300 秒 (可由環境變數調整)
+    """
+    now = now or now_tw()
+    if not is_trading_day(now.date()):
+        return POLL_INTERVAL_CLOSED
+    if SESSION_OPEN <= now.time() < SESSION_CLOSE:
+        return POLL_INTERVAL_SESSION
+    if PRE_OPEN <= now.time() < SESSION_OPEN:
+        return POLL_INTERVAL_PRE_OPEN
+    return POLL_INTERVAL_CLOSED